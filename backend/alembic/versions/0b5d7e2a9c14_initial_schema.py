@@ -0,0 +1,192 @@
+
+"""Initial schema
+
+Creates the tables as they were before the first migration, so a new
+database can be built with ``alembic upgrade head``. Databases created
+earlier with ``scripts/init_db.py`` already have these tables: mark them
+with ``alembic stamp 0b5d7e2a9c14`` before upgrading.
+
+Revision ID: 0b5d7e2a9c14
+Revises:
+Create Date: 2026-10-18 08:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b5d7e2a9c14'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _timestamps():
+    return (
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('password_hash', sa.String(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('avatar', sa.String()),
+        *_timestamps(),
+        sa.Column('last_login', sa.DateTime()),
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'conversations',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('user_id', sa.String(), sa.ForeignKey('users.id'), nullable=False),
+        *_timestamps(),
+    )
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('conversation_id', sa.String(), sa.ForeignKey('conversations.id'), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_table(
+        'documents',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.Text()),
+        sa.Column('file_name', sa.String(), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('mime_type', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('storage_path', sa.String()),
+        sa.Column('user_id', sa.String(), sa.ForeignKey('users.id'), nullable=False),
+        *_timestamps(),
+    )
+    op.create_table(
+        'sources',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('message_id', sa.String(), sa.ForeignKey('messages.id'), nullable=False),
+        sa.Column('document_id', sa.String(), sa.ForeignKey('documents.id'), nullable=False),
+        sa.Column('title', sa.String()),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('page', sa.Integer()),
+        sa.Column('score', sa.Float(), nullable=False),
+    )
+    op.create_table(
+        'feedback',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('message_id', sa.String(), sa.ForeignKey('messages.id'), nullable=False, unique=True),
+        sa.Column('feedback_type', sa.String(), nullable=False),
+        sa.Column('feedback_category', sa.String()),
+        sa.Column('feedback_text', sa.Text()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_table(
+        'document_status',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('document_id', sa.String(), sa.ForeignKey('documents.id'), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('progress', sa.Float()),
+        sa.Column('error', sa.Text()),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_table(
+        'tags',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False, unique=True),
+        sa.Column('color', sa.String(), nullable=False),
+        sa.Column('description', sa.Text()),
+        *_timestamps(),
+    )
+    op.create_table(
+        'document_tags',
+        sa.Column('document_id', sa.String(), sa.ForeignKey('documents.id'), primary_key=True),
+        sa.Column('tag_id', sa.String(), sa.ForeignKey('tags.id'), primary_key=True),
+    )
+    op.create_table(
+        'tag_access',
+        sa.Column('tag_id', sa.String(), sa.ForeignKey('tags.id'), primary_key=True),
+        sa.Column('role', sa.String(), primary_key=True),
+    )
+    op.create_table(
+        'llm_settings',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('provider', sa.String(), nullable=False),
+        sa.Column('model_name', sa.String(), nullable=False),
+        sa.Column('max_tokens', sa.Integer(), nullable=False),
+        sa.Column('temperature', sa.Float(), nullable=False),
+        sa.Column('top_p', sa.Float(), nullable=False),
+        sa.Column('frequency_penalty', sa.Float(), nullable=False),
+        sa.Column('presence_penalty', sa.Float(), nullable=False),
+        sa.Column('api_key', sa.String(), nullable=False),
+        sa.Column('api_base', sa.String()),
+        sa.Column('is_active', sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_table(
+        'embedding_settings',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('provider', sa.String(), nullable=False),
+        sa.Column('model_name', sa.String(), nullable=False),
+        sa.Column('dimensions', sa.Integer(), nullable=False),
+        sa.Column('api_key', sa.String(), nullable=False),
+        sa.Column('api_base', sa.String()),
+        sa.Column('is_active', sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_table(
+        'chunking_settings',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('chunk_size', sa.Integer(), nullable=False),
+        sa.Column('chunk_overlap', sa.Integer(), nullable=False),
+        sa.Column('strategy', sa.String(), nullable=False),
+        sa.Column('separator', sa.String()),
+        sa.Column('custom_split_logic', sa.Text()),
+        sa.Column('metadata_extraction', sa.Boolean()),
+        sa.Column('is_active', sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_table(
+        'vectordb_settings',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('provider', sa.String(), nullable=False),
+        sa.Column('connection_string', sa.String(), nullable=False),
+        sa.Column('api_key', sa.String()),
+        sa.Column('environment', sa.String()),
+        sa.Column('collection_name', sa.String(), nullable=False),
+        sa.Column('dimensions', sa.Integer(), nullable=False),
+        sa.Column('metric', sa.String(), nullable=False),
+        sa.Column('use_hybrid_search', sa.Boolean()),
+        sa.Column('use_metadata_filtering', sa.Boolean()),
+        sa.Column('is_active', sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_table(
+        'system_prompts',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False, unique=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('description', sa.Text()),
+        sa.Column('is_default', sa.Boolean()),
+        *_timestamps(),
+    )
+
+
+def downgrade() -> None:
+    for table in (
+        'system_prompts', 'vectordb_settings', 'chunking_settings', 'embedding_settings',
+        'llm_settings', 'tag_access', 'document_tags', 'tags', 'document_status',
+        'feedback', 'sources', 'documents', 'messages', 'conversations',
+    ):
+        op.drop_table(table)
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_table('users')
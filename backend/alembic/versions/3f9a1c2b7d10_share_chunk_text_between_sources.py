@@ -0,0 +1,117 @@
+
+"""Share chunk text between sources
+
+Moves ``sources.content`` into a deduplicated ``chunks`` table. Every
+distinct (document, text) pair becomes one chunk row and the sources that
+copied it point at that row instead.
+
+Revision ID: 3f9a1c2b7d10
+Revises: 0b5d7e2a9c14
+Create Date: 2026-10-18 09:12:44.000000
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2b7d10'
+down_revision = '0b5d7e2a9c14'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _chunk_id(document_id: str, content: str) -> str:
+    """Same derivation as app.crud.chunk.chunk_id_for, frozen for this revision."""
+    digest = hashlib.sha256(f"{document_id}\0{content}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def upgrade() -> None:
+    op.create_table(
+        'chunks',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('document_id', sa.String(), sa.ForeignKey('documents.id'), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('page', sa.Integer()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('ix_chunks_document_id', 'chunks', ['document_id'])
+
+    with op.batch_alter_table('sources') as batch_op:
+        batch_op.add_column(sa.Column('chunk_id', sa.String()))
+        batch_op.add_column(sa.Column('start_offset', sa.Integer()))
+        batch_op.add_column(sa.Column('end_offset', sa.Integer()))
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=True)
+        batch_op.create_foreign_key('fk_sources_chunk_id_chunks', 'chunks', ['chunk_id'], ['id'])
+        batch_op.create_index('ix_sources_message_id', ['message_id'])
+
+    # Deduplicate existing source text in batches. Each batch only touches
+    # sources that still carry their own copy, so the loop always advances.
+    conn = op.get_bind()
+    select_batch = sa.text(
+        "SELECT id, document_id, content, page FROM sources "
+        "WHERE chunk_id IS NULL AND content IS NOT NULL LIMIT :limit"
+    )
+    insert_chunk = sa.text(
+        "INSERT INTO chunks (id, document_id, content, page) "
+        "VALUES (:id, :document_id, :content, :page)"
+    )
+    update_source = sa.text(
+        "UPDATE sources SET chunk_id = :chunk_id, content = NULL WHERE id = :source_id"
+    )
+    while True:
+        rows = conn.execute(select_batch, {"limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+
+        new_chunks = {}
+        updates = []
+        for source_id, document_id, content, page in rows:
+            chunk_id = _chunk_id(document_id, content)
+            new_chunks.setdefault(chunk_id, {
+                "id": chunk_id,
+                "document_id": document_id,
+                "content": content,
+                "page": page,
+            })
+            updates.append({"chunk_id": chunk_id, "source_id": source_id})
+
+        existing = {
+            row[0] for row in conn.execute(
+                sa.text("SELECT id FROM chunks WHERE id IN :ids").bindparams(
+                    sa.bindparam("ids", expanding=True)
+                ),
+                {"ids": list(new_chunks)},
+            )
+        }
+        missing = [chunk for chunk_id, chunk in new_chunks.items() if chunk_id not in existing]
+        if missing:
+            conn.execute(insert_chunk, missing)
+        conn.execute(update_source, updates)
+
+
+def downgrade() -> None:
+    # Copy the cited span of each chunk back into its sources
+    op.execute(
+        "UPDATE sources SET content = ("
+        "SELECT substr(chunks.content, COALESCE(sources.start_offset, 0) + 1, "
+        "COALESCE(sources.end_offset, length(chunks.content)) - COALESCE(sources.start_offset, 0)) "
+        "FROM chunks WHERE chunks.id = sources.chunk_id"
+        ") WHERE content IS NULL"
+    )
+
+    with op.batch_alter_table('sources') as batch_op:
+        batch_op.drop_index('ix_sources_message_id')
+        batch_op.drop_constraint('fk_sources_chunk_id_chunks', type_='foreignkey')
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('end_offset')
+        batch_op.drop_column('start_offset')
+        batch_op.drop_column('chunk_id')
+
+    op.drop_index('ix_chunks_document_id', table_name='chunks')
+    op.drop_table('chunks')
@@ -0,0 +1,41 @@
+
+"""Index chunks by vector row
+
+Adds the vector index row and document offsets to ``chunks`` so retrieval
+results can be resolved to chunk metadata, and indexes ``sources.chunk_id``
+so chunks still cited by history can be found when a document is removed.
+
+Revision ID: 8c41d2e6a5b3
+Revises: 3f9a1c2b7d10
+Create Date: 2026-10-18 11:03:27.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41d2e6a5b3'
+down_revision = '3f9a1c2b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('chunks') as batch_op:
+        batch_op.add_column(sa.Column('vector_id', sa.Integer()))
+        batch_op.add_column(sa.Column('char_start', sa.Integer()))
+        batch_op.add_column(sa.Column('char_end', sa.Integer()))
+        batch_op.create_unique_constraint('uq_chunks_vector_id', ['vector_id'])
+
+    op.create_index('ix_sources_chunk_id', 'sources', ['chunk_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sources_chunk_id', table_name='sources')
+
+    with op.batch_alter_table('chunks') as batch_op:
+        batch_op.drop_constraint('uq_chunks_vector_id', type_='unique')
+        batch_op.drop_column('char_end')
+        batch_op.drop_column('char_start')
+        batch_op.drop_column('vector_id')
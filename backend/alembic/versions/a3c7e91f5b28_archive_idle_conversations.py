@@ -0,0 +1,48 @@
+
+"""Archive idle conversations
+
+Adds the archive stub columns to conversations and the documents cited
+by archived conversations.
+
+Revision ID: a3c7e91f5b28
+Revises: e5b19a7c3d62
+Create Date: 2026-10-18 19:12:37.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c7e91f5b28'
+down_revision = 'e5b19a7c3d62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.add_column(sa.Column('archived_at', sa.DateTime()))
+        batch_op.add_column(sa.Column('archive_key', sa.String()))
+        batch_op.add_column(sa.Column('archived_message_count', sa.Integer()))
+        batch_op.add_column(sa.Column('rehydrated_at', sa.DateTime()))
+    op.create_index('ix_conversations_archived_at', 'conversations', ['archived_at'])
+
+    op.create_table(
+        'archived_citations',
+        sa.Column('conversation_id', sa.String(), sa.ForeignKey('conversations.id'), primary_key=True),
+        sa.Column('document_id', sa.String(), sa.ForeignKey('documents.id'), primary_key=True),
+    )
+    op.create_index('ix_archived_citations_document_id', 'archived_citations', ['document_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_archived_citations_document_id', table_name='archived_citations')
+    op.drop_table('archived_citations')
+
+    op.drop_index('ix_conversations_archived_at', table_name='conversations')
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('rehydrated_at')
+        batch_op.drop_column('archived_message_count')
+        batch_op.drop_column('archive_key')
+        batch_op.drop_column('archived_at')
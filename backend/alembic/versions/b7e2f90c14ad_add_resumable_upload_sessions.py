@@ -0,0 +1,57 @@
+
+"""Add resumable upload sessions
+
+Adds ``upload_sessions`` for chunked, resumable uploads and records the
+SHA-256 of each stored file on ``documents``.
+
+Revision ID: b7e2f90c14ad
+Revises: 8c41d2e6a5b3
+Create Date: 2026-10-18 13:40:05.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f90c14ad'
+down_revision = '8c41d2e6a5b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'upload_sessions',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('user_id', sa.String(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.Text()),
+        sa.Column('file_name', sa.String(), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('mime_type', sa.String(), nullable=False),
+        sa.Column('tags', sa.Text()),
+        sa.Column('storage_key', sa.String(), nullable=False),
+        sa.Column('storage_upload_id', sa.String(), nullable=False),
+        sa.Column('part_size', sa.Integer(), nullable=False),
+        sa.Column('next_part', sa.Integer(), nullable=False),
+        sa.Column('bytes_received', sa.Integer(), nullable=False),
+        sa.Column('parts', sa.Text()),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('document_id', sa.String(), sa.ForeignKey('documents.id')),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('ix_upload_sessions_user_id', 'upload_sessions', ['user_id'])
+
+    op.add_column('documents', sa.Column('content_hash', sa.String()))
+    op.create_index('ix_documents_content_hash', 'documents', ['content_hash'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_content_hash', table_name='documents')
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.drop_column('content_hash')
+
+    op.drop_index('ix_upload_sessions_user_id', table_name='upload_sessions')
+    op.drop_table('upload_sessions')
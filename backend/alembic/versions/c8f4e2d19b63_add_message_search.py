@@ -0,0 +1,87 @@
+
+"""Add full-text search over messages
+
+Creates the external-content FTS5 table, the view it reads message text
+through and its triggers on SQLite, indexing existing messages, and the
+stored tsvector column with its GIN index on Postgres.
+Other databases search messages in process. Every database gets indexes
+on the owner of conversations and the conversation of messages, which
+searches are scoped by.
+
+Revision ID: c8f4e2d19b63
+Revises: a3c7e91f5b28
+Create Date: 2026-10-18 21:40:12.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f4e2d19b63'
+down_revision = 'a3c7e91f5b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_conversations_user_id', 'conversations', ['user_id'])
+    op.create_index('ix_messages_conversation_id', 'messages', ['conversation_id'])
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIEW message_search_source AS "
+            "SELECT m.rowid AS message_rowid, m.content AS content, "
+            "replace(c.user_id, '-', '') AS owner "
+            "FROM messages m JOIN conversations c ON c.id = m.conversation_id"
+        )
+        op.execute(
+            "CREATE VIRTUAL TABLE message_search USING fts5("
+            "content, owner, content = 'message_search_source', content_rowid = 'message_rowid', "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "CREATE TRIGGER message_search_insert AFTER INSERT ON messages BEGIN "
+            "INSERT INTO message_search (rowid, content, owner) "
+            "SELECT new.rowid, new.content, replace(user_id, '-', '') "
+            "FROM conversations WHERE id = new.conversation_id; END"
+        )
+        op.execute(
+            "CREATE TRIGGER message_search_delete AFTER DELETE ON messages BEGIN "
+            "INSERT INTO message_search (message_search, rowid, content, owner) "
+            "SELECT 'delete', old.rowid, old.content, replace(user_id, '-', '') "
+            "FROM conversations WHERE id = old.conversation_id; END"
+        )
+        op.execute(
+            "CREATE TRIGGER message_search_update AFTER UPDATE OF content ON messages BEGIN "
+            "INSERT INTO message_search (message_search, rowid, content, owner) "
+            "SELECT 'delete', old.rowid, old.content, replace(user_id, '-', '') "
+            "FROM conversations WHERE id = old.conversation_id; "
+            "INSERT INTO message_search (rowid, content, owner) "
+            "SELECT new.rowid, new.content, replace(user_id, '-', '') "
+            "FROM conversations WHERE id = new.conversation_id; END"
+        )
+        op.execute("INSERT INTO message_search (message_search) VALUES ('rebuild')")
+        op.execute("INSERT INTO message_search (message_search) VALUES ('optimize')")
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE messages ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+        )
+        op.execute("CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS message_search_update")
+        op.execute("DROP TRIGGER IF EXISTS message_search_delete")
+        op.execute("DROP TRIGGER IF EXISTS message_search_insert")
+        op.execute("DROP TABLE IF EXISTS message_search")
+        op.execute("DROP VIEW IF EXISTS message_search_source")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_messages_search_vector")
+        op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
+
+    op.drop_index('ix_messages_conversation_id', table_name='messages')
+    op.drop_index('ix_conversations_user_id', table_name='conversations')
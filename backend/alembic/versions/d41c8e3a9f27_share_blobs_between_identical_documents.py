@@ -0,0 +1,107 @@
+
+"""Share blobs between identical documents
+
+Adds reference-counted ``blobs`` keyed by content hash and links documents
+to them. Each hash already on record gets a blob owned by its oldest
+document; existing duplicates keep their own files and chunks.
+
+Revision ID: d41c8e3a9f27
+Revises: b7e2f90c14ad
+Create Date: 2026-10-18 15:02:44.000000
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41c8e3a9f27'
+down_revision = 'b7e2f90c14ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'blobs',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('content_hash', sa.String(), nullable=False),
+        sa.Column('storage_path', sa.String(), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.String()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint('content_hash', name='uq_blobs_content_hash'),
+    )
+    op.create_index('ix_blobs_document_id', 'blobs', ['document_id'])
+
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.String()))
+        batch_op.create_foreign_key('fk_documents_blob_id_blobs', 'blobs', ['blob_id'], ['id'])
+    op.create_index('ix_documents_blob_id', 'documents', ['blob_id'])
+
+    documents = sa.table(
+        'documents',
+        sa.column('id', sa.String()),
+        sa.column('content_hash', sa.String()),
+        sa.column('storage_path', sa.String()),
+        sa.column('file_size', sa.Integer()),
+        sa.column('created_at', sa.DateTime()),
+        sa.column('blob_id', sa.String()),
+    )
+    blobs = sa.table(
+        'blobs',
+        sa.column('id', sa.String()),
+        sa.column('content_hash', sa.String()),
+        sa.column('storage_path', sa.String()),
+        sa.column('file_size', sa.Integer()),
+        sa.column('ref_count', sa.Integer()),
+        sa.column('document_id', sa.String()),
+    )
+
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(
+            documents.c.id,
+            documents.c.content_hash,
+            documents.c.storage_path,
+            documents.c.file_size
+        ).where(
+            documents.c.content_hash.isnot(None),
+            documents.c.storage_path.isnot(None)
+        ).order_by(documents.c.created_at, documents.c.id)
+    )
+    new_blobs = {}
+    for document_id, content_hash, storage_path, file_size in rows:
+        if content_hash not in new_blobs:
+            new_blobs[content_hash] = {
+                'id': str(uuid.uuid4()),
+                'content_hash': content_hash,
+                'storage_path': storage_path,
+                'file_size': file_size,
+                'ref_count': 1,
+                'document_id': document_id,
+            }
+    if new_blobs:
+        bind.execute(blobs.insert(), list(new_blobs.values()))
+        bind.execute(
+            documents.update().where(
+                documents.c.id == sa.bindparam('b_document_id')
+            ).values(blob_id=sa.bindparam('b_blob_id')),
+            [
+                {'b_document_id': blob['document_id'], 'b_blob_id': blob['id']}
+                for blob in new_blobs.values()
+            ]
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_blob_id', table_name='documents')
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.drop_constraint('fk_documents_blob_id_blobs', type_='foreignkey')
+        batch_op.drop_column('blob_id')
+
+    op.drop_index('ix_blobs_document_id', table_name='blobs')
+    op.drop_table('blobs')
@@ -0,0 +1,60 @@
+
+"""Add feedback rollups
+
+Records the system prompt version on messages and adds rollup tables of
+feedback counts by day, category and prompt version and by cited
+document. They start empty; run ``scripts/rebuild_feedback_rollups.py``
+once after upgrading to count the feedback already on record.
+
+Revision ID: e5b19a7c3d62
+Revises: d41c8e3a9f27
+Create Date: 2026-10-18 17:41:09.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b19a7c3d62'
+down_revision = 'd41c8e3a9f27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.add_column(sa.Column('prompt_version', sa.String()))
+
+    op.create_table(
+        'feedback_rollups',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('category', sa.String(), primary_key=True),
+        sa.Column('prompt_version', sa.String(), primary_key=True),
+        sa.Column('positive', sa.Integer(), nullable=False),
+        sa.Column('negative', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'document_feedback_rollups',
+        sa.Column('document_id', sa.String(), primary_key=True),
+        sa.Column('positive', sa.Integer(), nullable=False),
+        sa.Column('negative', sa.Integer(), nullable=False),
+        sa.Column('unhelpful_score', sa.Float(), nullable=False),
+    )
+    op.create_index(
+        'ix_document_feedback_rollups_unhelpful_score',
+        'document_feedback_rollups',
+        ['unhelpful_score']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_document_feedback_rollups_unhelpful_score',
+        table_name='document_feedback_rollups'
+    )
+    op.drop_table('document_feedback_rollups')
+    op.drop_table('feedback_rollups')
+
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('prompt_version')
@@ -0,0 +1,59 @@
+
+"""Feedback analytics endpoints."""
+from datetime import date
+from typing import Any, List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy.orm import Session
+
+from app.schemas.analytics import DocumentFeedback, FeedbackCount
+from app.schemas.user import User
+from app.api.deps import get_current_active_admin, get_db
+from app.crud.analytics import (
+    get_feedback_summary,
+    get_unhelpful_documents,
+    rebuild_feedback_rollups
+)
+
+router = APIRouter()
+
+@router.get("/feedback", response_model=List[FeedbackCount])
+def get_feedback_analytics(
+    group_by: Literal["day", "category", "prompt_version"] = Query("day"),
+    since: Optional[date] = Query(None),
+    until: Optional[date] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+) -> Any:
+    """
+    Get positive and negative feedback counts by day, category or prompt version.
+
+    Read from rollups maintained as feedback is written, so the cost does
+    not grow with the amount of feedback. Feedback still queued for
+    writing is not counted yet.
+    """
+    return get_feedback_summary(db=db, group_by=group_by, since=since, until=until)
+
+@router.get("/feedback/documents", response_model=List[DocumentFeedback])
+def get_document_feedback_analytics(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+) -> Any:
+    """
+    Get the documents most often cited by unhelpful answers.
+
+    Documents are ranked by their unhelpful score, which discounts
+    documents with only a few ratings.
+    """
+    return get_unhelpful_documents(db=db, limit=limit)
+
+@router.post("/feedback/rebuild", status_code=status.HTTP_204_NO_CONTENT)
+def rebuild_feedback_analytics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+) -> None:
+    """
+    Recompute the feedback rollups from the stored feedback.
+    """
+    rebuild_feedback_rollups(db)
@@ -1,6 +1,6 @@
 
 """Authentication endpoints."""
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -13,12 +13,13 @@ from app.core.security import create_access_token, create_refresh_token
 from app.db.session import get_db
 from app.schemas.auth import Token, AuthResponse, RefreshRequest
 from app.schemas.user import User
-from app.crud.user import authenticate, get_user_by_id, update_last_login
-from app.api.deps import get_current_user
+from app.crud.user import authenticate, get_user_by_id
+from app.services.write_behind import WRITE_BEHIND
+from app.api.deps import get_current_user, rate_limit_client
 
 router = APIRouter()
 
-@router.post("/login", response_model=AuthResponse)
+@router.post("/login", response_model=AuthResponse, dependencies=[Depends(rate_limit_client("auth"))])
 async def login_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
@@ -34,8 +35,8 @@ async def login_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Update last login time
-    update_last_login(db, user.id)
+    # Record the login time in the background, the response does not need it
+    WRITE_BEHIND.enqueue("last_login", {"user_id": user.id, "at": datetime.utcnow().isoformat()})
     
     # Create access token and refresh token
     access_token = create_access_token(user.id)
@@ -47,7 +48,7 @@ async def login_access_token(
         "user": user
     }
 
-@router.post("/refresh", response_model=Token)
+@router.post("/refresh", response_model=Token, dependencies=[Depends(rate_limit_client("auth"))])
 async def refresh_token(
     request: RefreshRequest,
     db: Session = Depends(get_db)
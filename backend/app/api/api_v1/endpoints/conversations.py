@@ -1,8 +1,10 @@
 
 """Conversation management endpoints."""
-from typing import Any, List
+from datetime import datetime
+from typing import Any, List, Literal, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.schemas.conversation import (
@@ -13,12 +15,20 @@ from app.schemas.conversation import (
 from app.schemas.pagination import PaginatedResponse
 from app.schemas.user import User
 from app.api.deps import get_current_user, get_db
+from app.core.compression import ORJSONResponse
 from app.crud.conversation import (
     create_conversation,
     get_conversations,
     get_conversation_by_id,
     delete_conversation
 )
+from app.services.archive import (
+    EXPORT_CODECS,
+    delete_conversation_archive,
+    export_conversations,
+    rehydrate_conversation,
+    zstd_available
+)
 
 router = APIRouter()
 
@@ -33,7 +43,11 @@ def create_new_conversation(
     """
     return create_conversation(db=db, conversation=conversation, user_id=current_user.id)
 
-@router.get("", response_model=PaginatedResponse[ConversationResponse])
+@router.get(
+    "",
+    response_model=PaginatedResponse[ConversationResponse],
+    response_class=ORJSONResponse
+)
 def list_conversations(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
@@ -60,6 +74,71 @@ def list_conversations(
         "total_pages": total_pages
     }
 
+@router.get("/export")
+def export_conversation_history(
+    conversation_id: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    created_after: Optional[datetime] = Query(None),
+    created_before: Optional[datetime] = Query(None),
+    compression: Literal["none", "gzip", "zstd"] = Query("none"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    Export conversations with all their messages and sources as JSON Lines.
+
+    Users export their own history, all of it or one conversation; admins
+    can export any user's, or everyone's for compliance. Archived
+    conversations are read from their archive files without restoring
+    them. The export is streamed as it is read, so it can cover any number
+    of conversations in one request; with ``compression`` it is sent as a
+    gzip or zstd file instead of plain JSON Lines.
+    """
+    if current_user.role != "admin":
+        if user_id is not None and user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to export this user's conversations"
+            )
+        user_id = current_user.id
+
+    if conversation_id is not None:
+        conversation = get_conversation_by_id(db=db, conversation_id=conversation_id)
+        if not conversation:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        if conversation.user_id != current_user.id and current_user.role != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to access this conversation"
+            )
+
+    filename = f"conversation-{conversation_id}.jsonl" if conversation_id else "conversations.jsonl"
+    media_type = "application/x-ndjson"
+    codec = None
+    if compression != "none":
+        codec, media_type = EXPORT_CODECS[compression]
+        if codec == "zst" and not zstd_available():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="zstd compression is not available"
+            )
+        filename = f"{filename}.{codec}"
+
+    return StreamingResponse(
+        export_conversations(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            created_after=created_after,
+            created_before=created_before,
+            compression=codec
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/{conversation_id}", response_model=ConversationDetails)
 def get_conversation(
     conversation_id: str,
@@ -83,7 +162,8 @@ def get_conversation(
             detail="Not authorized to access this conversation"
         )
         
-    return conversation
+    # Opening an archived conversation brings its messages back
+    return rehydrate_conversation(db=db, conversation=conversation)
 
 @router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
 def remove_conversation(
@@ -108,4 +188,6 @@ def remove_conversation(
             detail="Not authorized to delete this conversation"
         )
         
+    archive_key = conversation.archive_key
     delete_conversation(db=db, conversation_id=conversation_id)
+    delete_conversation_archive(archive_key)
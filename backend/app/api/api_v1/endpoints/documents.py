@@ -0,0 +1,251 @@
+
+"""Document management endpoints."""
+from typing import Any, Optional, Tuple
+import re
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.schemas.document import DocumentResponse, UploadCreate, UploadSession
+from app.schemas.user import User
+from app.api.deps import get_current_user, get_db, rate_limit
+from app.crud.document import get_document_by_id
+from app.crud.upload import get_upload_session
+from app.db.base import UploadSession as UploadSessionModel
+from app.services.documents import delete_document
+from app.services.storage import get_storage
+from app.services.uploads import (
+    UploadConflict,
+    UploadError,
+    abort_upload,
+    complete_upload,
+    start_upload,
+    write_part
+)
+
+router = APIRouter()
+
+def get_own_upload(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> UploadSessionModel:
+    """Get an upload session owned by the current user."""
+    upload = get_upload_session(db=db, upload_session_id=upload_id)
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    if upload.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this upload"
+        )
+    return upload
+
+def upload_error(e: UploadError) -> HTTPException:
+    """Map an upload error to an HTTP error."""
+    if isinstance(e, UploadConflict):
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range`` header into an offset and length.
+
+    Returns:
+        The range, or None if the header is not a byte range this endpoint
+        serves, in which case the whole file is returned
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1 if int(last) else -1
+    else:
+        start = int(first)
+        end = size - 1 if last == "" else min(int(last), size - 1)
+    if start >= size or end < start:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end - start + 1
+
+@router.post(
+    "/uploads",
+    response_model=UploadSession,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("upload"))]
+)
+def create_upload(
+    upload: UploadCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Start a resumable upload.
+
+    The file is then sent as consecutive parts of ``part_size`` bytes (the
+    last one may be shorter) and the upload completed to create the
+    document.
+    """
+    if upload.file_size <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File size must be positive"
+        )
+    return start_upload(db=db, upload=upload, user_id=current_user.id)
+
+@router.get("/uploads/{upload_id}", response_model=UploadSession)
+def get_upload(
+    upload: UploadSessionModel = Depends(get_own_upload)
+) -> Any:
+    """
+    Get the state of an upload, to resume it from ``next_part``.
+    """
+    return upload
+
+@router.put("/uploads/{upload_id}/parts/{part_number}", response_model=UploadSession)
+async def upload_part(
+    part_number: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    upload: UploadSessionModel = Depends(get_own_upload)
+) -> Any:
+    """
+    Upload one part of a file as the raw request body.
+
+    The body is streamed to storage as it arrives. A failed part can be
+    sent again; parts must be sent in order.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid Content-Length header"
+            )
+    if content_length is not None and content_length > upload.part_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Parts are at most {upload.part_size} bytes"
+        )
+    try:
+        return await write_part(
+            db=db,
+            db_upload=upload,
+            part_number=part_number,
+            body=request.stream()
+        )
+    except UploadError as e:
+        raise upload_error(e)
+
+@router.post("/uploads/{upload_id}/complete", response_model=DocumentResponse)
+def finish_upload(
+    db: Session = Depends(get_db),
+    upload: UploadSessionModel = Depends(get_own_upload)
+) -> Any:
+    """
+    Complete an upload and queue the document for ingestion.
+    """
+    try:
+        return complete_upload(db=db, db_upload=upload)
+    except UploadError as e:
+        raise upload_error(e)
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_upload(
+    db: Session = Depends(get_db),
+    upload: UploadSessionModel = Depends(get_own_upload)
+) -> None:
+    """
+    Abort an upload and discard the parts received so far.
+    """
+    try:
+        abort_upload(db=db, db_upload=upload)
+    except UploadError as e:
+        raise upload_error(e)
+
+@router.get("/{document_id}/file")
+def get_document_file(
+    document_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Download the stored file of a document.
+
+    A single ``Range: bytes=`` header returns only that part of the file,
+    e.g. to preview the pages around a source.
+    """
+    document = get_document_by_id(db=db, document_id=document_id)
+    if not document or not document.storage_path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+
+    # Check if user owns this document or is admin
+    if document.user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this document"
+        )
+
+    storage = get_storage()
+    byte_range = parse_range(range_header, document.file_size) if range_header else None
+    if byte_range is None:
+        return StreamingResponse(
+            storage.iter_object(document.storage_path),
+            media_type=document.mime_type,
+            headers={"Accept-Ranges": "bytes", "Content-Length": str(document.file_size)}
+        )
+
+    offset, length = byte_range
+    data = storage.read_range(document.storage_path, offset, length)
+    return Response(
+        content=data,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=document.mime_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {offset}-{offset + len(data) - 1}/{document.file_size}"
+        }
+    )
+
+@router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_document(
+    document_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> None:
+    """
+    Delete a document.
+
+    Content shared with identical uploads is only purged once the last of
+    them is deleted.
+    """
+    document = get_document_by_id(db=db, document_id=document_id)
+    if not document or document.status == "deleted":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+
+    # Check if user owns this document or is admin
+    if document.user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete this document"
+        )
+
+    delete_document(db=db, document=document)
@@ -8,7 +8,8 @@ from sqlalchemy.orm import Session
 from app.schemas.message import FeedbackCreate, FeedbackResponse
 from app.schemas.user import User
 from app.api.deps import get_current_user, get_db
-from app.crud.message import get_message_by_id, create_feedback
+from app.crud.message import get_feedback_id, get_message_by_id
+from app.services.write_behind import WRITE_BEHIND
 
 router = APIRouter()
 
@@ -20,6 +21,9 @@ def submit_feedback(
 ) -> Any:
     """
     Submit feedback for a message.
+
+    The feedback is written shortly after the response, together with
+    other queued writes.
     """
     # Check if message exists
     message = get_message_by_id(db=db, message_id=feedback.message_id)
@@ -36,13 +40,11 @@ def submit_feedback(
             detail="Feedback type must be 'positive' or 'negative'"
         )
     
-    # Create feedback record
-    feedback_record = create_feedback(
-        db=db,
-        feedback=feedback
-    )
+    # Store the feedback in the background; its ID is known up front
+    feedback_id = get_feedback_id(db=db, message_id=feedback.message_id)
+    WRITE_BEHIND.enqueue("feedback", feedback.model_dump())
     
     return {
-        "id": feedback_record.id,
+        "id": feedback_id,
         "status": "success"
     }
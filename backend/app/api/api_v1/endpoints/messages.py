@@ -1,21 +1,45 @@
 
 """Message management endpoints."""
-from typing import Any, List
+from typing import Any, List, Literal
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from app.schemas.message import MessageCreate, Message, MessageResponse
+from app.schemas.message import (
+    MessageCreate,
+    Message,
+    MessageResponse,
+    MessageSearchResult,
+    Source
+)
 from app.schemas.pagination import PaginatedResponse
 from app.schemas.user import User
-from app.api.deps import get_current_user, get_db
+from app.api.deps import get_current_user, get_db, rate_limit
+from app.core.admission import Overloaded, retry_after
+from app.core.compression import ORJSONResponse
+from app.core.config import settings
+from app.core.metrics import span
 from app.crud.conversation import get_conversation_by_id
-from app.crud.message import create_message, get_messages
-from app.services.rag import process_query
+from app.crud.message import (
+    create_message,
+    delete_message,
+    get_message_by_id,
+    get_messages,
+    get_source
+)
+from app.services.archive import rehydrate_conversation
+from app.services.message_search import search_messages
+from app.services.rag import get_prompt_version, process_query_coalesced
 
 router = APIRouter()
 
-@router.post("/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/messages",
+    response_model=MessageResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("chat"))]
+)
 async def send_message(
     message_create: MessageCreate,
     db: Session = Depends(get_db),
@@ -25,7 +49,8 @@ async def send_message(
     Send a new message in a conversation.
     """
     # Check if conversation exists and user has access
-    conversation = get_conversation_by_id(db=db, conversation_id=message_create.conversation_id)
+    with span("load_conversation"):
+        conversation = get_conversation_by_id(db=db, conversation_id=message_create.conversation_id)
     if not conversation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -37,31 +62,49 @@ async def send_message(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this conversation"
         )
+    # Restoring reads and inserts a whole archive; keep it off the event loop
+    conversation = await run_in_threadpool(rehydrate_conversation, db=db, conversation=conversation)
     
     # Save user message
-    user_message = create_message(
-        db=db,
-        content=message_create.message,
-        role="user",
-        conversation_id=message_create.conversation_id
-    )
+    with span("save_user_message"):
+        user_message = create_message(
+            db=db,
+            content=message_create.message,
+            role="user",
+            conversation_id=message_create.conversation_id
+        )
     
-    # Process message with RAG and get response
-    response_content, sources = await process_query(
-        db=db,
-        query=message_create.message,
-        conversation_id=message_create.conversation_id,
-        context_filter=message_create.context_filter
-    )
+    # Process message with RAG and get response, sharing the work with
+    # identical questions that are already being answered
+    with span("rag"):
+        try:
+            response_content, sources = await process_query_coalesced(
+                db=db,
+                query=message_create.message,
+                conversation_id=message_create.conversation_id,
+                context_filter=message_create.context_filter,
+                access_scope=current_user.role,
+                exclude_message_id=user_message.id
+            )
+        except Overloaded as e:
+            # Drop the unanswered question so a retry does not repeat it
+            delete_message(db=db, message_id=user_message.id)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The assistant is overloaded, please retry later",
+                headers={"Retry-After": retry_after(e)}
+            )
     
     # Save assistant response
-    assistant_message = create_message(
-        db=db,
-        content=response_content,
-        role="assistant",
-        conversation_id=message_create.conversation_id,
-        sources=sources
-    )
+    with span("save_assistant_message"):
+        assistant_message = create_message(
+            db=db,
+            content=response_content,
+            role="assistant",
+            conversation_id=message_create.conversation_id,
+            sources=sources,
+            prompt_version=get_prompt_version(db)
+        )
     
     return {
         "id": assistant_message.id,
@@ -70,16 +113,26 @@ async def send_message(
         "conversation_id": message_create.conversation_id
     }
 
-@router.get("/conversations/{conversation_id}/messages", response_model=PaginatedResponse[Message])
+@router.get(
+    "/conversations/{conversation_id}/messages",
+    response_model=PaginatedResponse[Message],
+    response_class=ORJSONResponse
+)
 def get_conversation_messages(
     conversation_id: str,
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=100),
+    source_content: Literal["full", "truncated", "none"] = Query("full"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
     Get messages from a conversation.
+
+    With ``source_content=truncated`` sources carry only the first
+    ``SOURCE_PREVIEW_CHARS`` characters of their text, with ``none`` no
+    text; either way shortened sources are flagged ``contentTruncated`` and
+    their full text can be fetched one at a time.
     """
     # Check if conversation exists and user has access
     conversation = get_conversation_by_id(db=db, conversation_id=conversation_id)
@@ -94,12 +147,15 @@ def get_conversation_messages(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this conversation"
         )
+    rehydrate_conversation(db=db, conversation=conversation)
     
+    source_chars = {"full": None, "truncated": settings.SOURCE_PREVIEW_CHARS, "none": 0}
     messages, total = get_messages(
         db=db,
         conversation_id=conversation_id,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        source_chars=source_chars[source_content]
     )
     
     total_pages = (total + page_size - 1) // page_size
@@ -117,3 +173,56 @@ def get_conversation_messages(
         "page_size": page_size,
         "total_pages": total_pages
     }
+
+@router.get(
+    "/search",
+    response_model=List[MessageSearchResult],
+    response_class=ORJSONResponse
+)
+def search_conversation_messages(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Search the messages of the current user's conversations.
+
+    All words of ``q`` must appear, in any order, and quoted phrases as
+    written. Results are ranked by relevance and carry a snippet of the
+    message with the offsets of the matching words. Archived conversations
+    are searched again once they are opened.
+    """
+    return search_messages(db=db, user_id=current_user.id, query=q, limit=limit)
+
+@router.get("/messages/{message_id}/sources/{source_id}", response_model=Source)
+def get_message_source(
+    message_id: str,
+    source_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Get a source of a message with its full text.
+    """
+    message = get_message_by_id(db=db, message_id=message_id)
+    if not message:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+
+    conversation = get_conversation_by_id(db=db, conversation_id=message.conversation_id)
+    if conversation.user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this conversation"
+        )
+
+    source = get_source(db=db, message_id=message_id, source_id=source_id)
+    if not source:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Source not found"
+        )
+    return source
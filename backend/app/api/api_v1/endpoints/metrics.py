@@ -0,0 +1,75 @@
+
+"""Metrics endpoints."""
+import os
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.schemas.user import User
+from app.api.deps import get_current_active_admin
+from app.core.metrics import REGISTRY
+from app.core.profiling import (
+    get_background_sampler,
+    list_profiles,
+    profile_path,
+    render_folded
+)
+
+router = APIRouter()
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics(
+    current_user: User = Depends(get_current_active_admin)
+) -> PlainTextResponse:
+    """
+    Get request and pipeline latency metrics in Prometheus text format.
+    """
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@router.get("/profiles", response_model=List[Dict[str, Any]])
+def get_profiles(
+    current_user: User = Depends(get_current_active_admin)
+) -> Any:
+    """
+    List stored request profiles, newest first.
+    """
+    return list_profiles()
+
+@router.get("/profiles/background", response_class=PlainTextResponse)
+def get_background_profile(
+    reset: bool = Query(False),
+    current_user: User = Depends(get_current_active_admin)
+) -> PlainTextResponse:
+    """
+    Get the hot stacks aggregated by the background sampler in folded format.
+    """
+    sampler = get_background_sampler()
+    if sampler is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Background profiling is disabled"
+        )
+    samples = sampler.samples
+    stacks = sampler.snapshot(reset=reset)
+    return PlainTextResponse(f"# {samples} samples\n" + render_folded(stacks))
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_active_admin)
+) -> PlainTextResponse:
+    """
+    Get a stored request profile in folded format.
+    """
+    path = profile_path(profile_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    with open(path) as f:
+        return PlainTextResponse(f.read())
@@ -1,8 +1,8 @@
 
 """Dependency functions for API endpoints."""
-from typing import Generator, Optional
+from typing import Callable, Generator, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import ValidationError
@@ -14,16 +14,22 @@ from app.schemas.auth import TokenPayload
 from app.schemas.user import User
 from app.crud.user import get_user_by_id
 from app.core.security import create_access_token, create_refresh_token
+from app.core.rate_limit import RATE_LIMITER, retry_after
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
 )
 
-async def get_current_user(
+def get_current_user(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
 ) -> User:
-    """Get the current authenticated user based on the JWT token."""
+    """
+    Get the current authenticated user based on the JWT token.
+
+    A plain function so it runs in the thread pool: waiting for a pooled
+    connection on the event loop would stall the requests holding them.
+    """
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=["HS256"]
@@ -85,3 +91,38 @@ def check_resource_owner(user_id: str, current_user: User = Depends(get_current_
         status_code=status.HTTP_403_FORBIDDEN,
         detail="Not authorized to access this resource"
     )
+
+def _too_many_requests(wait: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Rate limit exceeded",
+        headers={"Retry-After": retry_after(wait)}
+    )
+
+def rate_limit(scope: str) -> Callable:
+    """
+    Dependency charging a request to the current user's budget for a scope.
+
+    The budget is picked by the user's role and the bucket is keyed by
+    their id; over budget, the request is rejected with 429 and a
+    ``Retry-After`` header.
+    """
+    async def check(current_user: User = Depends(get_current_user)) -> User:
+        wait = await RATE_LIMITER.acquire(scope, f"user:{current_user.id}", current_user.role)
+        if wait:
+            raise _too_many_requests(wait)
+        return current_user
+    return check
+
+def rate_limit_client(scope: str) -> Callable:
+    """
+    Dependency charging a request to the client address's budget for a scope.
+
+    For endpoints called before a user is known, such as login.
+    """
+    async def check(request: Request) -> None:
+        client = request.client.host if request.client else "unknown"
+        wait = await RATE_LIMITER.acquire(scope, f"ip:{client}")
+        if wait:
+            raise _too_many_requests(wait)
+    return check
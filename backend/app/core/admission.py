@@ -0,0 +1,198 @@
+
+"""Adaptive admission control for calls to a saturating backend.
+
+``AdaptiveLimiter`` caps the calls in flight with a limit that follows the
+backend's latency (AIMD): each call that finishes normally raises it by
+``1 / limit``, about one per round of calls, and a failed call or one
+``tolerance`` times slower than the backend's unloaded latency cuts it by
+``backoff``, at most once per average latency. Callers over the limit wait in a bounded FIFO queue and
+are shed with ``Overloaded`` when the queue is full, when the expected wait
+already exceeds the queue timeout, or when the timeout passes.
+"""
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+import asyncio
+import math
+import time
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+
+class Overloaded(Exception):
+    """A call was shed instead of admitted."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(f"Backend overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit with a bounded wait queue.
+
+    Meant for one event loop: state is only touched from coroutines and
+    callbacks of that loop, so it needs no locks.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        max_queue: int = 100,
+        queue_timeout: float = 10.0,
+        backoff: float = 0.9,
+        tolerance: float = 1.5,
+        smoothing: float = 0.05,
+        drift: float = 0.001
+    ) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.drift = drift
+        self.inflight = 0
+        # Moving average of call latency, None until the first call ends
+        self.latency: Optional[float] = None
+        # Latency of the backend when it is not queueing: the lowest seen,
+        # drifting up slowly so a slower model or network is learned
+        self.baseline: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self) -> float:
+        """Estimated queueing time of a caller joining the queue now."""
+        if self.latency is None:
+            return 0.0
+        # Slots free up at about ``limit`` per average latency
+        return (len(self._waiters) + 1) * self.latency / self.limit
+
+    def _shed(self, reason: str) -> Overloaded:
+        SHED.inc((reason,))
+        return Overloaded(reason, self.latency or self.queue_timeout)
+
+    async def acquire(self) -> None:
+        """
+        Wait for a slot.
+
+        Raises:
+            Overloaded: The call was shed
+        """
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            QUEUE_WAIT.observe((), 0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed("queue_full")
+        if self.expected_wait() > self.queue_timeout:
+            raise self._shed("deadline")
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait([future], timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(future)
+            raise
+        finally:
+            QUEUE_WAIT.observe((), time.perf_counter() - start)
+        if not future.done():
+            self._abandon(future)
+            raise self._shed("timeout")
+
+    def _abandon(self, future: asyncio.Future) -> None:
+        if future.done():
+            # The slot was handed over just as the caller gave up
+            self.release()
+            return
+        future.cancel()
+        self._waiters.remove(future)
+
+    def release(self, latency: Optional[float] = None, ok: bool = True) -> None:
+        """
+        Free a slot and adapt the limit to how the call went.
+
+        Args:
+            latency: Seconds the call took, None if it says nothing about
+                the backend, e.g. it was cancelled
+            ok: Whether the call succeeded
+        """
+        inflight = self.inflight
+        self.inflight -= 1
+        if latency is not None:
+            self._adapt(latency, ok, inflight)
+        # Hand free slots to waiters in arrival order
+        while self._waiters and self.inflight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def _adapt(self, latency: float, ok: bool, inflight: int) -> None:
+        if self.latency is None:
+            self.latency = self.baseline = latency
+        self.latency += self.smoothing * (latency - self.latency)
+        if latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += self.drift * (latency - self.baseline)
+        slow = latency > self.tolerance * self.baseline
+        if not ok or slow:
+            now = time.monotonic()
+            # Calls of the same round see the same overload, so react once
+            if now - self._last_decrease >= self.latency:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif inflight * 2 >= self.limit:
+            # Only grow a limit that is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of a call; see ``acquire``."""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.release(time.perf_counter() - start, ok=False)
+            raise
+        self.release(time.perf_counter() - start)
+
+def retry_after(error: Overloaded) -> str:
+    """``Retry-After`` header value for a shed call."""
+    return str(max(1, math.ceil(error.retry_after)))
+
+LLM_LIMITER = AdaptiveLimiter(
+    initial_limit=settings.LLM_CONCURRENCY_INITIAL,
+    min_limit=settings.LLM_CONCURRENCY_MIN,
+    max_limit=settings.LLM_CONCURRENCY_MAX,
+    max_queue=settings.LLM_QUEUE_SIZE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT
+)
+
+QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM calls waited for admission."
+)
+SHED = Counter(
+    "llm_shed_total",
+    "LLM calls shed instead of admitted, by reason.",
+    ("reason",)
+)
+Gauge("llm_concurrency_limit", "Current adaptive limit on LLM calls in flight.", lambda: LLM_LIMITER.limit)
+Gauge("llm_inflight", "LLM calls in flight.", lambda: LLM_LIMITER.inflight)
+Gauge("llm_queue_depth", "LLM calls waiting for admission.", lambda: LLM_LIMITER.queue_depth)
@@ -0,0 +1,198 @@
+
+"""Negotiated response compression and fast JSON responses."""
+from typing import Any, List, Optional, Sequence, Tuple
+import zlib
+
+import orjson
+from starlette.responses import JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    # Without the brotli package responses are only gzipped
+    brotli = None
+
+# Content types worth compressing; files are served as stored
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Several times faster than the standard library encoder on large pages
+    of messages and sources.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def negotiate(accept_encoding: str, available: Sequence[str]) -> Optional[str]:
+    """
+    Pick a content coding from an ``Accept-Encoding`` header.
+
+    Args:
+        accept_encoding: Header value, e.g. ``gzip;q=0.8, br``
+        available: Supported codings, most preferred first
+
+    Returns:
+        The acceptable coding with the highest quality, ties going to the
+        most preferred, or None to send the response as is
+    """
+    qualities = {}
+    for entry in accept_encoding.split(","):
+        coding, _, params = entry.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+class _GzipEncoder:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliEncoder:
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+def _vary_accept_encoding(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Headers with ``Accept-Encoding`` added to ``Vary``, unless already covered."""
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    fields = {field.strip().lower() for field in vary.split(b",")}
+    if b"*" in fields or b"accept-encoding" in fields:
+        return headers
+    headers = [(key, value) for key, value in headers if key.lower() != b"vary"]
+    return headers + [(b"vary", vary + b", Accept-Encoding")]
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing responses with brotli or gzip.
+
+    The coding is negotiated from ``Accept-Encoding``. Responses smaller
+    than ``minimum_size``, of a type outside ``COMPRESSIBLE_TYPES``, already
+    encoded or answering a range request are sent as is. Streamed
+    responses are compressed chunk by chunk and flushed after each one, so
+    clients still see every chunk as it is produced.
+
+    Every response of a compressible type carries ``Vary: Accept-Encoding``,
+    including ones sent uncompressed because they were small or the client
+    asked for no coding, so a shared cache never serves one client's
+    variant to another.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 4,
+        brotli_quality: int = 4
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.available = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def _encoder(self, coding: str):
+        if coding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = _header(scope["headers"], b"accept-encoding")
+        coding = negotiate(accept.decode("latin-1"), self.available) if accept else None
+
+        start = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message) -> None:
+            nonlocal start, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk shows the response size
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = list(start.get("headers", ()))
+                content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+                if (
+                    _header(headers, b"content-encoding") is not None
+                    or _header(headers, b"content-range") is not None
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers = _vary_accept_encoding(headers)
+                if coding is None or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send({**start, "headers": headers})
+                    await send(message)
+                    return
+                encoder = self._encoder(coding)
+                headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+                headers.append((b"content-encoding", coding.encode("latin-1")))
+                if not more_body:
+                    body = encoder.process(body) + encoder.finish()
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send({**start, "headers": headers})
+
+            if more_body:
+                body = encoder.process(body) + encoder.flush()
+            else:
+                body = encoder.process(body) + encoder.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
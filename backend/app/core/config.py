@@ -15,10 +15,66 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
     REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./rag_assistant.db")
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "200"))  # 0 disables the log
     CORS_ORIGINS: List[str] = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     STORAGE_TYPE: str = os.getenv("STORAGE_TYPE", "local")
     STORAGE_PATH: str = os.getenv("STORAGE_PATH", "./storage")
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "rag-assistant")
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "")
+    S3_REGION: str = os.getenv("S3_REGION", "")
+    UPLOAD_PART_SIZE: int = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+    UPLOAD_SPOOL_SIZE: int = int(os.getenv("UPLOAD_SPOOL_SIZE", str(1024 * 1024)))
+    UPLOAD_HASH_MAX_ENTRIES: int = int(os.getenv("UPLOAD_HASH_MAX_ENTRIES", "1000"))
+    UPLOAD_HASH_MAX_IDLE: int = int(os.getenv("UPLOAD_HASH_MAX_IDLE", "86400"))
+    STORAGE_CACHE_PATH: str = os.getenv("STORAGE_CACHE_PATH", "./storage/cache")
+    STORAGE_CACHE_MAX_BYTES: int = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    STORAGE_CACHE_BLOCK_SIZE: int = int(os.getenv("STORAGE_CACHE_BLOCK_SIZE", str(256 * 1024)))
+    INDEX_PATH: str = os.getenv("INDEX_PATH", "./storage/index")
+    INDEX_COMPACTION_MAX_SEGMENT_ROWS: int = int(os.getenv("INDEX_COMPACTION_MAX_SEGMENT_ROWS", "1000000"))
+    INDEX_MAX_SEGMENTS: int = int(os.getenv("INDEX_MAX_SEGMENTS", "8"))
+    INDEX_MAX_TOMBSTONE_RATIO: float = float(os.getenv("INDEX_MAX_TOMBSTONE_RATIO", "0.1"))
+    INDEX_RELOAD_INTERVAL: float = float(os.getenv("INDEX_RELOAD_INTERVAL", "30"))  # seconds
+    INDEX_PUBLISH_INTERVAL: float = float(os.getenv("INDEX_PUBLISH_INTERVAL", "300"))  # seconds
+    INDEX_KEEP_VERSIONS: int = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+    FEEDBACK_BOOST_CHECK_INTERVAL: float = float(os.getenv("FEEDBACK_BOOST_CHECK_INTERVAL", "60"))  # seconds
+    PARSE_WORKERS: int = int(os.getenv("PARSE_WORKERS", "0"))  # 0 = one per CPU
+    PARSE_PAGES_PER_TASK: int = int(os.getenv("PARSE_PAGES_PER_TASK", "16"))
+    PARSE_WORKER_MEMORY_MB: int = int(os.getenv("PARSE_WORKER_MEMORY_MB", "1024"))
+    PARSE_MAX_TASKS_PER_CHILD: int = int(os.getenv("PARSE_MAX_TASKS_PER_CHILD", "50"))
+    INGEST_POLL_INTERVAL: float = float(os.getenv("INGEST_POLL_INTERVAL", "10"))  # seconds
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "10"))  # documents per pass
+    WEB_WORKERS: int = int(os.getenv("WEB_WORKERS", "0"))  # 0 = one per CPU
+    WEB_MAX_REQUESTS: int = int(os.getenv("WEB_MAX_REQUESTS", "10000"))  # 0 = never recycle
+    WEB_MAX_REQUESTS_JITTER: int = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "1000"))
+    WEB_GRACEFUL_TIMEOUT: int = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+    PROFILE_PATH: str = os.getenv("PROFILE_PATH", "./storage/profiles")
+    PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", "100"))
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+    PROFILE_BACKGROUND_INTERVAL_MS: float = float(os.getenv("PROFILE_BACKGROUND_INTERVAL_MS", "0"))  # 0 disables
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_CHAT: str = os.getenv("RATE_LIMIT_CHAT", "*:20/minute,admin:120/minute")  # per user, by role
+    RATE_LIMIT_UPLOAD: str = os.getenv("RATE_LIMIT_UPLOAD", "*:60/hour,curator:600/hour,admin:600/hour")
+    RATE_LIMIT_AUTH: str = os.getenv("RATE_LIMIT_AUTH", "*:10/minute")  # per client address
+    RATE_LIMIT_REDIS_URL: str = os.getenv("RATE_LIMIT_REDIS_URL", "")  # empty = per-worker buckets
+    LLM_CONCURRENCY_INITIAL: int = int(os.getenv("LLM_CONCURRENCY_INITIAL", "8"))
+    LLM_CONCURRENCY_MIN: int = int(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+    LLM_CONCURRENCY_MAX: int = int(os.getenv("LLM_CONCURRENCY_MAX", "64"))  # per worker
+    LLM_QUEUE_SIZE: int = int(os.getenv("LLM_QUEUE_SIZE", "100"))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))  # seconds before shedding with 503
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "4"))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+    ARCHIVE_IDLE_DAYS: int = int(os.getenv("ARCHIVE_IDLE_DAYS", "180"))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))  # conversations per archival run
+    SOURCE_PREVIEW_CHARS: int = int(os.getenv("SOURCE_PREVIEW_CHARS", "300"))  # truncated history sources
+    MESSAGE_SEARCH_BACKEND: str = os.getenv("MESSAGE_SEARCH_BACKEND", "auto")  # auto or memory
+    MESSAGE_SEARCH_CACHE_USERS: int = int(os.getenv("MESSAGE_SEARCH_CACHE_USERS", "256"))
+    MESSAGE_SEARCH_MAX_CANDIDATES: int = int(os.getenv("MESSAGE_SEARCH_MAX_CANDIDATES", "1000"))
+    WRITE_BEHIND_INTERVAL_MS: float = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "500"))
+    WRITE_BEHIND_MAX_BATCH: int = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+    WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+    WRITE_BEHIND_SPOOL_PATH: str = os.getenv("WRITE_BEHIND_SPOOL_PATH", "./storage/write_behind")
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,280 @@
+
+"""Request timing, pipeline spans and Prometheus metrics."""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import threading
+import time
+
+# Latency bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _HistogramChild:
+    __slots__ = ("counts", "total")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.total = 0.0
+
+class Histogram:
+    """
+    Latency histogram family with one child per label combination.
+
+    Observing is a bisect and three additions under a lock, so it is cheap
+    enough for every request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Counts per bucket, the last one for +Inf, not cumulative
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+        REGISTRY.register(self)
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        """Record one observation for a label combination."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labels)
+            if child is None:
+                child = self._children[labels] = _HistogramChild(len(self.buckets) + 1)
+            child.counts[index] += 1
+            child.total += value
+
+    def render(self) -> Iterator[str]:
+        """Render the family in Prometheus text format."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            children = [
+                (labels, list(child.counts), child.total)
+                for labels, child in self._children.items()
+            ]
+        for labels, counts, total in sorted(children):
+            pairs = list(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(pairs)} {total}"
+            yield f"{self.name}_count{_format_labels(pairs)} {cumulative}"
+
+class Counter:
+    """Monotonic counter family with one child per label combination."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+        REGISTRY.register(self)
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0) -> None:
+        """Add to the count of a label combination."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> Iterator[str]:
+        """Render the family in Prometheus text format."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(list(zip(self.label_names, labels)))} {value}"
+
+class Gauge:
+    """
+    Gauge read from a callback when rendered.
+
+    The value lives wherever it is maintained, e.g. a queue's length, so
+    updating it costs nothing on the hot path.
+    """
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        REGISTRY.register(self)
+
+    def render(self) -> Iterator[str]:
+        """Render the gauge in Prometheus text format."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {float(self.read())}"
+
+class Registry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics = []
+
+    def register(self, metric) -> None:
+        """Add a metric family; it must provide ``render()``."""
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Render every registered family in Prometheus text format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ("method", "route", "status")
+)
+STAGE_LATENCY = Histogram(
+    "rag_stage_duration_seconds",
+    "Latency of message pipeline stages.",
+    ("stage",)
+)
+
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database statements executed per HTTP request, by route.",
+    ("route",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+
+class QueryStats:
+    """Number and total duration of database statements in a scope."""
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self, capture: bool = False) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        # Statement texts, only kept when capturing for assertions
+        self.statements: Optional[List[str]] = [] if capture else None
+
+# Spans finished during the current request, as (name, seconds)
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_spans", default=None
+)
+# Query counters of every enclosing ``track_queries`` scope
+_query_stats: ContextVar[Tuple[QueryStats, ...]] = ContextVar("query_stats", default=())
+
+@contextmanager
+def track_queries(capture: bool = False) -> Iterator[QueryStats]:
+    """
+    Count the database statements executed in a block.
+
+    Scopes nest: a statement counts towards every enclosing scope.
+
+    Args:
+        capture: Also keep the statement texts
+    """
+    stats = QueryStats(capture)
+    token = _query_stats.set(_query_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+def record_query(statement: str, seconds: float) -> None:
+    """Count a finished statement towards the active ``track_queries`` scopes."""
+    for stats in _query_stats.get():
+        stats.count += 1
+        stats.seconds += seconds
+        if stats.statements is not None:
+            stats.statements.append(statement)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time a stage of request handling.
+
+    The duration is recorded in ``rag_stage_duration_seconds`` and, inside
+    a request, reported in its ``Server-Timing`` header. Works around both
+    sync and ``await``-ing code.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_LATENCY.observe((name,), duration)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, duration))
+
+def _server_timing(
+    spans: List[Tuple[str, float]], queries: QueryStats, total: float
+) -> bytes:
+    entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in spans]
+    entries.append(f'db;desc="{queries.count} queries";dur={queries.seconds * 1000:.1f}')
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries).encode("latin-1")
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request.
+
+    Latency and the number of database statements are recorded per route,
+    and the spans and database time accumulated before the response starts
+    are returned in a ``Server-Timing`` header.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        queries = QueryStats()
+        queries_token = _query_stats.set((queries,))
+        status_code = 500
+
+        async def send_with_timing(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((
+                    b"server-timing",
+                    _server_timing(spans, queries, time.perf_counter() - start)
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _query_stats.reset(queries_token)
+            _request_spans.reset(token)
+            # The router stores the matched route in the scope; unmatched
+            # paths share one label so scanners cannot explode cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(
+                (scope["method"], route, str(status_code)), time.perf_counter() - start
+            )
+            REQUEST_QUERIES.observe((route,), queries.count)
@@ -0,0 +1,296 @@
+
+"""Sampling profiler for single requests and for the whole worker.
+
+Stacks are recorded in the folded format (``outer;inner;leaf count`` per
+line) read by flamegraph.pl, speedscope and most flamegraph viewers.
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+from urllib.parse import parse_qs
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.crud.user import get_user_by_id
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Leaf frames of threads waiting for work, left out of profiles
+_IDLE_FRAMES = {
+    ("threading", "wait"),
+    ("selectors", "select"),
+    ("queue", "get"),
+    ("concurrent.futures.thread", "_worker"),
+}
+
+# Threads running sync endpoints and dependencies
+_WORKER_THREAD_PREFIX = "AnyIO worker thread"
+
+_PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+def fold_stack(frame) -> Optional[str]:
+    """
+    Fold a thread's stack into ``module:function`` names, outermost first.
+
+    Returns:
+        The folded stack, or None for a thread waiting for work
+    """
+    code = frame.f_code
+    if (frame.f_globals.get("__name__"), code.co_name) in _IDLE_FRAMES:
+        return None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def render_folded(stacks: Counter) -> str:
+    """Render stack counts in folded format, hottest first."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class StackSampler:
+    """
+    Thread that periodically records the stacks of other threads.
+
+    Sampling reads ``sys._current_frames()`` and never stops the sampled
+    threads; the cost is roughly proportional to the number of threads
+    and their stack depth at each tick.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.005,
+        threads: Optional[Callable[[], Set[int]]] = None,
+        max_stacks: int = 10000
+    ) -> None:
+        """
+        Args:
+            interval: Seconds between samples
+            threads: Returns the idents of the threads to sample; all
+                other threads by default
+            max_stacks: Distinct stacks kept; further new stacks are
+                counted under a single ``[truncated]`` entry
+        """
+        self.interval = interval
+        self.threads = threads
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sampling in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop sampling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def snapshot(self, reset: bool = False) -> Counter:
+        """Get the stack counts so far, optionally starting over."""
+        with self._lock:
+            stacks = Counter(self._stacks)
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+        return stacks
+
+    def sample(self) -> None:
+        """Record the current stack of every selected thread once."""
+        own = threading.get_ident()
+        selected = self.threads() if self.threads is not None else None
+        frames = sys._current_frames()
+        folded = []
+        for ident, frame in frames.items():
+            if ident == own or (selected is not None and ident not in selected):
+                continue
+            stack = fold_stack(frame)
+            if stack is not None:
+                folded.append(stack)
+        del frames
+        with self._lock:
+            self.samples += 1
+            for stack in folded:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = "[truncated]"
+                self._stacks[stack] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("Stack sampling failed")
+
+def _request_threads(loop_thread: int) -> Callable[[], Set[int]]:
+    """Threads that can run a request: its event loop and the worker pool."""
+    def threads() -> Set[int]:
+        selected = {loop_thread}
+        for thread in threading.enumerate():
+            if thread.name.startswith(_WORKER_THREAD_PREFIX):
+                selected.add(thread.ident)
+        return selected
+    return threads
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Get the file of a stored request profile, or None for an invalid ID."""
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    return os.path.join(settings.PROFILE_PATH, f"{profile_id}.folded")
+
+def list_profiles() -> List[Dict]:
+    """Stored request profiles, newest first."""
+    if not os.path.isdir(settings.PROFILE_PATH):
+        return []
+    profiles = []
+    for name in os.listdir(settings.PROFILE_PATH):
+        profile_id, extension = os.path.splitext(name)
+        if extension != ".folded" or not _PROFILE_ID.match(profile_id):
+            continue
+        path = os.path.join(settings.PROFILE_PATH, name)
+        with open(path) as f:
+            header = f.readline()
+        profiles.append({
+            "id": profile_id,
+            "request": header[2:].strip() if header.startswith("# ") else "",
+            "size": os.path.getsize(path)
+        })
+    profiles.sort(key=lambda profile: profile["id"], reverse=True)
+    return profiles
+
+def save_profile(profile_id: str, description: str, stacks: Counter) -> str:
+    """Store a request profile, keeping the newest ``PROFILE_MAX_FILES``."""
+    os.makedirs(settings.PROFILE_PATH, exist_ok=True)
+    path = profile_path(profile_id)
+    with open(path, "w") as f:
+        f.write(f"# {description}\n")
+        f.write(render_folded(stacks))
+    for stale in list_profiles()[settings.PROFILE_MAX_FILES:]:
+        try:
+            os.remove(profile_path(stale["id"]))
+        except OSError:
+            pass
+    return path
+
+def _is_admin(token: str) -> bool:
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    except JWTError:
+        return False
+    if payload.get("type") == "refresh" or not payload.get("sub"):
+        return False
+    db = SessionLocal()
+    try:
+        user = get_user_by_id(db, user_id=payload["sub"])
+        return user is not None and user.role == "admin"
+    finally:
+        db.close()
+
+def _profile_requested(scope) -> Optional[str]:
+    """Get the bearer token of a request asking to be profiled."""
+    headers = dict(scope.get("headers") or ())
+    if headers.get(b"x-profile") != b"1":
+        query_string = scope.get("query_string", b"")
+        # Most requests have no flag; skip parsing their query string
+        if b"profile=" not in query_string:
+            return None
+        if parse_qs(query_string.decode("latin-1")).get("profile") != ["1"]:
+            return None
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    return token if scheme.lower() == "bearer" and token else None
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling requests on demand.
+
+    A request from an admin carrying ``X-Profile: 1`` or ``?profile=1`` is
+    sampled from start to the end of its response. The folded stacks are
+    stored under ``PROFILE_PATH`` and the response carries their ID in an
+    ``X-Profile-Id`` header; fetch them from ``/metrics/profiles/{id}``.
+    The flag is ignored for everyone else.
+
+    Sync endpoints run on a shared thread pool, so stacks of requests
+    running concurrently on the same worker can appear in a profile.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _profile_requested(scope)
+        if token is None or not await run_in_threadpool(_is_admin, token):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+        async def send_with_profile_id(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = StackSampler(
+            settings.PROFILE_INTERVAL_MS / 1000, threads=_request_threads(threading.get_ident())
+        )
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stop()
+            description = (
+                f"{scope['method']} {scope['path']} {sampler.samples} samples "
+                f"{(time.perf_counter() - start) * 1000:.1f} ms"
+            )
+            await run_in_threadpool(save_profile, profile_id, description, sampler.snapshot())
+
+_background_sampler: Optional[StackSampler] = None
+
+def start_background_sampler(interval: float) -> Optional[StackSampler]:
+    """Start aggregating hot stacks across the worker; 0 leaves it off."""
+    global _background_sampler
+    if interval <= 0:
+        return None
+    if _background_sampler is None:
+        _background_sampler = StackSampler(interval)
+        _background_sampler.start()
+    return _background_sampler
+
+def stop_background_sampler() -> None:
+    """Stop the background sampler if it runs."""
+    global _background_sampler
+    if _background_sampler is not None:
+        _background_sampler.stop()
+        _background_sampler = None
+
+def get_background_sampler() -> Optional[StackSampler]:
+    """Get the running background sampler."""
+    return _background_sampler
@@ -0,0 +1,228 @@
+
+"""Per-user token bucket rate limiting.
+
+Each scope (chat, upload, auth) has its own budget per role, written as
+``role:count/period`` pairs, e.g. ``*:20/minute,admin:120/minute``. A
+bucket holds up to ``count`` tokens and refills at ``count / period`` per
+second, so a user can burst the whole budget and then continues at the
+average rate.
+
+Buckets live in the worker's memory by default, so with several workers a
+user gets each worker's budget. Setting ``RATE_LIMIT_REDIS_URL`` keeps them
+in Redis instead, shared by all workers; if Redis is unreachable the
+worker falls back to its own buckets rather than failing requests.
+"""
+from typing import Dict, List, NamedTuple, Optional
+import logging
+import math
+import threading
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+class Limit(NamedTuple):
+    """Bucket size and refill rate in tokens per second."""
+    capacity: float
+    rate: float
+
+def parse_limits(spec: str) -> Dict[str, Optional[Limit]]:
+    """
+    Parse budgets by role.
+
+    Args:
+        spec: Comma-separated ``role:count/period`` pairs; ``*`` is the
+            default role, ``period`` is a unit from ``PERIODS`` or a number
+            of seconds and ``role:none`` exempts a role
+
+    Returns:
+        Limits by role, None for exempt roles
+    """
+    limits: Dict[str, Optional[Limit]] = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        role, _, budget = entry.partition(":")
+        budget = budget.strip()
+        if budget == "none":
+            limits[role.strip()] = None
+            continue
+        count, _, period = budget.partition("/")
+        seconds = PERIODS.get(period.strip()) or float(period)
+        if float(count) <= 0 or seconds <= 0:
+            raise ValueError(f"Invalid rate limit: {entry}")
+        limits[role.strip()] = Limit(float(count), float(count) / seconds)
+    return limits
+
+class MemoryBackend:
+    """
+    Token buckets in this worker's memory.
+
+    Buckets are spread over striped locks, so concurrent checks only
+    contend when their keys share a stripe, and a check is a dictionary
+    lookup and a few float operations. Buckets that have refilled are
+    dropped once there are more than ``max_keys`` of them.
+    """
+
+    def __init__(self, max_keys: int = 100_000, stripes: int = 64) -> None:
+        self.max_keys = max_keys
+        # Key -> [tokens, time of the last update, time it will be full]
+        self._buckets: Dict[str, List[float]] = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._prune_at = max_keys
+
+    def acquire(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """
+        Take ``cost`` tokens from a bucket.
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds until they
+            will be available
+        """
+        if len(self._buckets) >= self._prune_at:
+            self._prune()
+        now = time.monotonic()
+        with self._locks[hash(key) % len(self._locks)]:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [limit.capacity, now, now]
+            tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / limit.rate
+            bucket[0] = tokens
+            bucket[1] = now
+            bucket[2] = now + (limit.capacity - tokens) / limit.rate
+            return wait
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            if bucket[2] <= now:
+                with self._locks[hash(key) % len(self._locks)]:
+                    # A full bucket is the same as no bucket
+                    if bucket[2] <= now:
+                        self._buckets.pop(key, None)
+        # Buckets in use are kept, so wait for the map to grow again rather
+        # than scanning it on every check
+        self._prune_at = max(self.max_keys, 2 * len(self._buckets))
+
+# Refills and takes from a bucket atomically, on the Redis server's clock
+_REDIS_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or capacity
+local stamp = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisBackend:
+    """
+    Token buckets in Redis, shared by every worker.
+
+    A bucket is a hash updated by one script call, which expires once the
+    bucket would be full again.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit", timeout: float = 0.1) -> None:
+        # redis is only needed when a shared backend is configured
+        import redis.asyncio
+
+        self.prefix = prefix
+        self._client = redis.asyncio.from_url(
+            url, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+        self._script = self._client.register_script(_REDIS_SCRIPT)
+
+    async def acquire(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens from a bucket, see ``MemoryBackend.acquire``."""
+        wait = await self._script(
+            keys=[f"{self.prefix}:{key}"],
+            args=[limit.capacity, limit.rate, cost]
+        )
+        return float(wait)
+
+class RateLimiter:
+    """Budgets by scope and role over a bucket backend."""
+
+    def __init__(
+        self,
+        limits: Dict[str, Dict[str, Optional[Limit]]],
+        redis_url: str = "",
+        enabled: bool = True
+    ) -> None:
+        self.limits = limits
+        self.enabled = enabled
+        self.redis_url = redis_url
+        self._memory = MemoryBackend()
+        self._redis: Optional[RedisBackend] = None
+        self._redis_failing = False
+
+    def limit_for(self, scope: str, role: Optional[str]) -> Optional[Limit]:
+        """Budget of a role in a scope, None if it is not limited."""
+        limits = self.limits.get(scope, {})
+        if role in limits:
+            return limits[role]
+        return limits.get("*")
+
+    async def acquire(self, scope: str, key: str, role: Optional[str] = None) -> float:
+        """
+        Charge one request to a bucket.
+
+        Args:
+            scope: Budget to charge, e.g. ``chat``
+            key: Who is charged, e.g. ``user:<id>``
+            role: Role selecting the budget, None for the default
+
+        Returns:
+            0 if the request is allowed, otherwise the seconds to wait
+        """
+        limit = self.limit_for(scope, role) if self.enabled else None
+        if limit is None:
+            return 0.0
+        key = f"{scope}:{key}"
+        if not self.redis_url:
+            return self._memory.acquire(key, limit)
+        try:
+            if self._redis is None:
+                self._redis = RedisBackend(self.redis_url)
+            wait = await self._redis.acquire(key, limit)
+        except Exception as e:
+            if not self._redis_failing:
+                logger.warning("Rate limit backend unavailable, using local buckets: %s", e)
+                self._redis_failing = True
+            return self._memory.acquire(key, limit)
+        if self._redis_failing:
+            logger.info("Rate limit backend available again")
+            self._redis_failing = False
+        return wait
+
+def retry_after(wait: float) -> str:
+    """``Retry-After`` header value for a wait in seconds."""
+    return str(max(1, math.ceil(wait)))
+
+RATE_LIMITER = RateLimiter(
+    {
+        "chat": parse_limits(settings.RATE_LIMIT_CHAT),
+        "upload": parse_limits(settings.RATE_LIMIT_UPLOAD),
+        "auth": parse_limits(settings.RATE_LIMIT_AUTH),
+    },
+    redis_url=settings.RATE_LIMIT_REDIS_URL,
+    enabled=settings.RATE_LIMIT_ENABLED
+)
@@ -0,0 +1,258 @@
+
+"""CRUD operations for feedback analytics rollups.
+
+Feedback counts are kept in two rollup tables instead of being grouped over
+``feedback``, ``messages`` and ``sources`` on every read: one by day,
+category and prompt version, one by cited document. Each feedback write
+adds the difference it makes to the counts, and ``rebuild_feedback_rollups``
+recomputes both tables from scratch to repair any drift.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db.base import (
+    Document as DocumentModel,
+    DocumentFeedbackRollup as DocumentFeedbackRollupModel,
+    Feedback as FeedbackModel,
+    FeedbackRollup as FeedbackRollupModel,
+    Message as MessageModel,
+    Source as SourceModel
+)
+
+# Columns the feedback summary can be grouped by
+SUMMARY_GROUPS = {
+    "day": FeedbackRollupModel.day,
+    "category": FeedbackRollupModel.category,
+    "prompt_version": FeedbackRollupModel.prompt_version,
+}
+
+def unhelpful_score(positive: int, negative: int, z: float = 1.96) -> float:
+    """
+    Lower bound of the Wilson interval of a document's negative rate.
+
+    A document cited by a few negatively rated answers scores lower than
+    one cited by many, so the score ranks documents by how confidently
+    they are associated with unhelpful answers.
+    """
+    total = positive + negative
+    if total == 0:
+        return 0.0
+    rate = negative / total
+    z2 = z * z
+    centre = rate + z2 / (2 * total)
+    margin = z * math.sqrt(rate * (1 - rate) / total + z2 / (4 * total * total))
+    return max(0.0, (centre - margin) / (1 + z2 / total))
+
+def _counts(feedback_type: str, sign: int) -> Tuple[int, int]:
+    return (sign, 0) if feedback_type == "positive" else (0, sign)
+
+def _add_counts(
+    db: Session, model, keys: Sequence[str], deltas: Dict[Tuple, List[int]]
+) -> None:
+    """Add count differences to rollup rows, creating missing rows."""
+    rows = [
+        {**dict(zip(keys, key)), "positive": positive, "negative": negative}
+        for key, (positive, negative) in deltas.items()
+        if positive or negative
+    ]
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={
+                "positive": model.positive + stmt.excluded.positive,
+                "negative": model.negative + stmt.excluded.negative
+            }
+        )
+        db.execute(stmt, rows)
+        return
+    for row in rows:
+        rollup = db.get(model, tuple(row[key] for key in keys))
+        if rollup is None:
+            db.add(model(**row))
+        else:
+            rollup.positive += row["positive"]
+            rollup.negative += row["negative"]
+    db.flush()
+
+def _update_scores(db: Session, document_ids: Sequence[str]) -> None:
+    if not document_ids:
+        return
+    rows = db.execute(
+        select(
+            DocumentFeedbackRollupModel.document_id,
+            DocumentFeedbackRollupModel.positive,
+            DocumentFeedbackRollupModel.negative
+        ).where(DocumentFeedbackRollupModel.document_id.in_(list(document_ids)))
+    ).all()
+    if not rows:
+        return
+    table = DocumentFeedbackRollupModel.__table__
+    db.execute(
+        update(table)
+        .where(table.c.document_id == bindparam("b_document_id"))
+        .values(unhelpful_score=bindparam("b_score")),
+        [
+            {"b_document_id": document_id, "b_score": unhelpful_score(positive, negative)}
+            for document_id, positive, negative in rows
+        ]
+    )
+
+def record_feedback_changes(
+    db: Session,
+    previous: Dict[str, Dict[str, Any]],
+    current: Dict[str, Dict[str, Any]]
+) -> None:
+    """
+    Update the rollups for feedback that was created or changed, without committing.
+
+    Args:
+        previous: Feedback stored before the change by message ID, with
+            ``feedback_type``, ``feedback_category`` and ``created_at``;
+            messages without feedback yet are left out
+        current: Feedback after the change by message ID, with
+            ``feedback_type`` and ``feedback_category``
+    """
+    message_ids = list(current)
+    if not message_ids:
+        return
+    prompt_versions = dict(
+        db.query(MessageModel.id, MessageModel.prompt_version).filter(
+            MessageModel.id.in_(message_ids)
+        )
+    )
+    documents: Dict[str, List[str]] = {}
+    for message_id, document_id in db.query(
+        SourceModel.message_id, SourceModel.document_id
+    ).filter(SourceModel.message_id.in_(message_ids)).distinct():
+        documents.setdefault(message_id, []).append(document_id)
+
+    today = datetime.utcnow().date()
+    by_day: Dict[Tuple, List[int]] = {}
+    by_document: Dict[Tuple, List[int]] = {}
+    for message_id, new in current.items():
+        old = previous.get(message_id)
+        prompt_version = prompt_versions.get(message_id) or ""
+        # Feedback keeps counting towards the day it was first given
+        day = old["created_at"].date() if old and old.get("created_at") else today
+        changes = [(new, 1)] + ([(old, -1)] if old else [])
+        for feedback, sign in changes:
+            positive, negative = _counts(feedback["feedback_type"], sign)
+            key = (day, feedback.get("feedback_category") or "", prompt_version)
+            counts = by_day.setdefault(key, [0, 0])
+            counts[0] += positive
+            counts[1] += negative
+            for document_id in documents.get(message_id, ()):
+                counts = by_document.setdefault((document_id,), [0, 0])
+                counts[0] += positive
+                counts[1] += negative
+
+    _add_counts(db, FeedbackRollupModel, ("day", "category", "prompt_version"), by_day)
+    _add_counts(db, DocumentFeedbackRollupModel, ("document_id",), by_document)
+    _update_scores(db, [key[0] for key, counts in by_document.items() if any(counts)])
+
+def rebuild_feedback_rollups(db: Session) -> None:
+    """
+    Recompute both rollup tables from the stored feedback.
+
+    Feedback in archived conversations is not in the database, so a
+    rebuild leaves it out until the conversations are restored.
+    """
+    positive = func.sum(case((FeedbackModel.feedback_type == "positive", 1), else_=0))
+    negative = func.sum(case((FeedbackModel.feedback_type == "positive", 0), else_=1))
+    db.execute(delete(FeedbackRollupModel))
+    db.execute(delete(DocumentFeedbackRollupModel))
+
+    day = func.date(FeedbackModel.created_at)
+    category = func.coalesce(FeedbackModel.feedback_category, "")
+    prompt_version = func.coalesce(MessageModel.prompt_version, "")
+    db.execute(
+        insert(FeedbackRollupModel).from_select(
+            ["day", "category", "prompt_version", "positive", "negative"],
+            select(day, category, prompt_version, positive, negative)
+            .select_from(FeedbackModel)
+            .join(MessageModel, MessageModel.id == FeedbackModel.message_id)
+            .group_by(day, category, prompt_version)
+        )
+    )
+
+    cited = select(SourceModel.message_id, SourceModel.document_id).distinct().subquery()
+    db.execute(
+        insert(DocumentFeedbackRollupModel).from_select(
+            ["document_id", "positive", "negative"],
+            select(cited.c.document_id, positive, negative)
+            .select_from(FeedbackModel)
+            .join(cited, cited.c.message_id == FeedbackModel.message_id)
+            .group_by(cited.c.document_id)
+        )
+    )
+    _update_scores(
+        db, [document_id for (document_id,) in db.query(DocumentFeedbackRollupModel.document_id)]
+    )
+    db.commit()
+
+def get_feedback_summary(
+    db: Session,
+    group_by: str,
+    since: Optional[date] = None,
+    until: Optional[date] = None
+) -> List[Dict[str, Any]]:
+    """
+    Get positive and negative counts grouped by a rollup column.
+
+    Reads only the rollup table, so the cost depends on the number of
+    days, categories and prompt versions, not on the amount of feedback.
+    """
+    column = SUMMARY_GROUPS[group_by]
+    query = db.query(
+        column,
+        func.sum(FeedbackRollupModel.positive),
+        func.sum(FeedbackRollupModel.negative)
+    )
+    if since is not None:
+        query = query.filter(FeedbackRollupModel.day >= since)
+    if until is not None:
+        query = query.filter(FeedbackRollupModel.day <= until)
+    rows = query.group_by(column).order_by(column).all()
+    return [
+        {
+            "key": str(key),
+            "positive": positive,
+            "negative": negative,
+            "negative_rate": negative / (positive + negative) if positive + negative else 0.0
+        }
+        for key, positive, negative in rows
+    ]
+
+def get_unhelpful_documents(db: Session, limit: int = 20) -> List[Dict[str, Any]]:
+    """Get the documents with the highest unhelpful score, best known first."""
+    rows = db.query(
+        DocumentFeedbackRollupModel, DocumentModel.title
+    ).join(
+        DocumentModel, DocumentModel.id == DocumentFeedbackRollupModel.document_id
+    ).filter(
+        DocumentFeedbackRollupModel.negative > 0
+    ).order_by(
+        DocumentFeedbackRollupModel.unhelpful_score.desc()
+    ).limit(limit).all()
+    return [
+        {
+            "document_id": rollup.document_id,
+            "title": title,
+            "positive": rollup.positive,
+            "negative": rollup.negative,
+            "unhelpful_score": rollup.unhelpful_score
+        }
+        for rollup, title in rows
+    ]
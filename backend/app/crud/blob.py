@@ -0,0 +1,69 @@
+
+"""CRUD operations for content-addressed document blobs."""
+from typing import Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.base import Blob as BlobModel
+
+def get_blob_by_hash(db: Session, content_hash: str) -> Optional[BlobModel]:
+    """Get the blob holding content with a given digest."""
+    return db.query(BlobModel).filter(BlobModel.content_hash == content_hash).first()
+
+def acquire_blob(
+    db: Session,
+    content_hash: str,
+    storage_path: str,
+    file_size: int,
+    document_id: str
+) -> Tuple[BlobModel, bool]:
+    """
+    Take a reference to the blob for a digest, creating it if new, without committing.
+
+    A new blob points at ``storage_path`` and is indexed through
+    ``document_id``. Two uploads of the same new content racing each other
+    are settled by the unique digest: the loser takes a reference to the
+    winner's blob instead.
+
+    Returns:
+        Tuple of the blob and whether it was created
+    """
+    blob = get_blob_by_hash(db, content_hash)
+    if blob is None:
+        try:
+            with db.begin_nested():
+                blob = BlobModel(
+                    content_hash=content_hash,
+                    storage_path=storage_path,
+                    file_size=file_size,
+                    ref_count=1,
+                    document_id=document_id
+                )
+                db.add(blob)
+            return blob, True
+        except IntegrityError:
+            blob = get_blob_by_hash(db, content_hash)
+
+    db.query(BlobModel).filter(BlobModel.id == blob.id).update(
+        {BlobModel.ref_count: BlobModel.ref_count + 1}, synchronize_session=False
+    )
+    db.refresh(blob)
+    return blob, False
+
+def release_blob(db: Session, blob: BlobModel) -> int:
+    """
+    Drop a reference to a blob, without committing.
+
+    The blob row is deleted with its last reference.
+
+    Returns:
+        Number of references left
+    """
+    db.query(BlobModel).filter(BlobModel.id == blob.id).update(
+        {BlobModel.ref_count: BlobModel.ref_count - 1}, synchronize_session=False
+    )
+    db.refresh(blob)
+    if blob.ref_count <= 0:
+        db.delete(blob)
+        return 0
+    return blob.ref_count
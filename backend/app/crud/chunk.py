@@ -0,0 +1,232 @@
+
+"""CRUD operations for shared document chunks."""
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+
+from sqlalchemy import and_, exists, func, insert, or_
+from sqlalchemy.orm import Session, aliased
+
+from app.db.base import (
+    generate_uuid,
+    Chunk as ChunkModel,
+    Document as DocumentModel,
+    Source as SourceModel,
+    document_tags
+)
+from app.schemas.chunk import ChunkCreate
+
+def chunk_id_for(document_id: str, content: str) -> str:
+    """
+    Derive a stable chunk ID from a document ID and chunk text.
+
+    Used for sources that arrive without a chunk ID, so the same text cited
+    by many messages always maps to one chunk row.
+    """
+    digest = hashlib.sha256(f"{document_id}\0{content}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+def insert_missing_chunks(db: Session, chunks: List[Dict]) -> None:
+    """
+    Insert chunk rows that do not exist yet, without committing.
+
+    Rows are written in one executemany that skips IDs already present, so
+    concurrent writers citing the same chunk do not conflict.
+    """
+    if not chunks:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(ChunkModel).on_conflict_do_nothing(index_elements=["id"])
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(ChunkModel).on_conflict_do_nothing(index_elements=["id"])
+    else:
+        existing = {
+            row.id for row in db.query(ChunkModel.id).filter(
+                ChunkModel.id.in_([chunk["id"] for chunk in chunks])
+            )
+        }
+        chunks = [chunk for chunk in chunks if chunk["id"] not in existing]
+        if not chunks:
+            return
+        stmt = insert(ChunkModel)
+    db.execute(stmt, chunks)
+
+def get_chunk_texts(db: Session, chunk_ids: Iterable[str]) -> Dict[str, str]:
+    """Get the text of several chunks in a single query."""
+    chunk_ids = list(set(chunk_ids))
+    if not chunk_ids:
+        return {}
+    rows = db.query(ChunkModel.id, ChunkModel.content).filter(
+        ChunkModel.id.in_(chunk_ids)
+    ).all()
+    return {chunk_id: content for chunk_id, content in rows}
+
+def create_chunks(
+    db: Session,
+    document_id: str,
+    chunks: List[ChunkCreate],
+    min_vector_id: int = 0
+) -> List[Dict]:
+    """
+    Insert a document's chunks with new vector IDs, without committing.
+
+    Vector IDs continue after the highest one in the table. Deleted chunks
+    no longer count towards that maximum, so callers holding an index pass
+    its size as ``min_vector_id`` to keep rows it still stores from being
+    handed out again.
+
+    Returns:
+        The inserted rows, in input order
+    """
+    next_vector_id = max(
+        (db.query(func.max(ChunkModel.vector_id)).scalar() or -1) + 1,
+        min_vector_id
+    )
+    rows = [
+        {
+            "id": generate_uuid(),
+            "document_id": document_id,
+            "vector_id": next_vector_id + i,
+            "content": chunk.content,
+            "page": chunk.page,
+            "char_start": chunk.char_start,
+            "char_end": chunk.char_end
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+    if rows:
+        db.execute(insert(ChunkModel), rows)
+    return rows
+
+def get_chunks_by_vector_ids(
+    db: Session, vector_ids: Iterable[int]
+) -> Dict[int, ChunkModel]:
+    """Get the chunks behind several vector index rows in a single query."""
+    vector_ids = [int(vector_id) for vector_id in set(vector_ids)]
+    if not vector_ids:
+        return {}
+    chunks = db.query(ChunkModel).filter(ChunkModel.vector_id.in_(vector_ids)).all()
+    return {chunk.vector_id: chunk for chunk in chunks}
+
+def delete_document_chunks(
+    db: Session, document_id: str, before_vector_id: Optional[int] = None
+) -> List[int]:
+    """
+    Remove a document's chunks from retrieval, without committing.
+
+    Chunks still cited by message sources keep their text so conversation
+    history stays readable; they only lose their vector ID. All other
+    chunks of the document are deleted.
+
+    Args:
+        db: Database session
+        document_id: Document whose chunks are removed
+        before_vector_id: Only remove chunks with a lower vector ID, or
+            none; vector IDs only grow, so this keeps the chunks a
+            re-index has inserted so far
+
+    Returns:
+        Vector IDs that no longer map to a chunk
+    """
+    in_scope = ChunkModel.document_id == document_id
+    if before_vector_id is not None:
+        in_scope = and_(in_scope, or_(
+            ChunkModel.vector_id.is_(None),
+            ChunkModel.vector_id < before_vector_id
+        ))
+    vector_ids = [
+        vector_id for (vector_id,) in db.query(ChunkModel.vector_id).filter(
+            in_scope,
+            ChunkModel.vector_id.isnot(None)
+        )
+    ]
+    db.query(ChunkModel).filter(
+        in_scope,
+        ~exists().where(SourceModel.chunk_id == ChunkModel.id)
+    ).delete(synchronize_session=False)
+    db.query(ChunkModel).filter(
+        in_scope
+    ).update({ChunkModel.vector_id: None}, synchronize_session=False)
+    return vector_ids
+
+def discard_new_chunks(db: Session, document_id: str, first_vector_id: int) -> List[int]:
+    """
+    Delete the chunks a failed re-index inserted, without committing.
+
+    Returns:
+        Their vector IDs
+    """
+    query = db.query(ChunkModel).filter(
+        ChunkModel.document_id == document_id,
+        ChunkModel.vector_id >= first_vector_id
+    )
+    vector_ids = [vector_id for (vector_id,) in query.with_entities(ChunkModel.vector_id)]
+    query.delete(synchronize_session=False)
+    return vector_ids
+
+def replace_document_chunks(
+    db: Session,
+    document_id: str,
+    chunks: List[ChunkCreate],
+    min_vector_id: int = 0
+) -> Tuple[List[int], List[Dict]]:
+    """
+    Swap a document's chunks for a new set, without committing.
+
+    Returns:
+        Tuple of the vector IDs removed and the rows inserted
+    """
+    removed = delete_document_chunks(db, document_id)
+    return removed, create_chunks(db, document_id, chunks, min_vector_id)
+
+def reassign_document_chunks(db: Session, document_id: str, new_document_id: str) -> None:
+    """Move a document's chunks to another document, without committing."""
+    db.query(ChunkModel).filter(ChunkModel.document_id == document_id).update(
+        {ChunkModel.document_id: new_document_id}, synchronize_session=False
+    )
+
+def get_document_tag_ids(
+    db: Session, document_ids: Iterable[str]
+) -> Dict[str, List[str]]:
+    """Get the tag IDs of several documents in a single query."""
+    document_ids = list(set(document_ids))
+    result = {document_id: [] for document_id in document_ids}
+    if not document_ids:
+        return result
+    rows = db.query(document_tags.c.document_id, document_tags.c.tag_id).filter(
+        document_tags.c.document_id.in_(document_ids)
+    )
+    for document_id, tag_id in rows:
+        result[document_id].append(tag_id)
+    return result
+
+def get_chunk_tag_ids(
+    db: Session, document_ids: Iterable[str]
+) -> Dict[str, List[str]]:
+    """
+    Get the tags that apply to the chunks of several documents in a single query.
+
+    Chunks of a shared blob are indexed once, under one of its documents,
+    so they carry the union of the tags of every document sharing the blob.
+    """
+    document_ids = list(set(document_ids))
+    result = {document_id: [] for document_id in document_ids}
+    if not document_ids:
+        return result
+    peer = aliased(DocumentModel)
+    rows = db.query(DocumentModel.id, document_tags.c.tag_id).join(
+        peer,
+        or_(
+            peer.id == DocumentModel.id,
+            peer.blob_id == DocumentModel.blob_id
+        )
+    ).join(
+        document_tags, document_tags.c.document_id == peer.id
+    ).filter(
+        DocumentModel.id.in_(document_ids)
+    ).distinct()
+    for document_id, tag_id in rows:
+        result[document_id].append(tag_id)
+    return result
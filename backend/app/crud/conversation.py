@@ -1,8 +1,9 @@
 
 """CRUD operations for conversation management."""
 from typing import List, Optional, Tuple
+from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import exists, func, or_
 
 from app.db.base import Conversation as ConversationModel, Message as MessageModel
 from app.schemas.conversation import ConversationCreate
@@ -47,10 +48,11 @@ def get_conversations(
         page_size
     ).all()
     
-    # Merge message count into conversations
+    # Merge message count into conversations; archived messages are only
+    # counted on the stub
     result = []
     for conv, msg_count in conversations_with_count:
-        conv.message_count = msg_count
+        conv.message_count = msg_count + (conv.archived_message_count or 0)
         result.append(conv)
     
     return result, total
@@ -71,3 +73,30 @@ def delete_conversation(db: Session, conversation_id: str) -> bool:
     db.delete(conversation)
     db.commit()
     return True
+
+def get_idle_conversation_ids(
+    db: Session, idle_before: datetime, limit: int = 100
+) -> List[str]:
+    """
+    Get conversations with messages but no activity since ``idle_before``.
+
+    A conversation is active when it was updated, got a message or was
+    restored from the archive. Archived conversations are left out.
+    """
+    return [
+        conversation_id for (conversation_id,) in db.query(ConversationModel.id).filter(
+            ConversationModel.archived_at.is_(None),
+            ConversationModel.updated_at < idle_before,
+            or_(
+                ConversationModel.rehydrated_at.is_(None),
+                ConversationModel.rehydrated_at < idle_before
+            ),
+            exists().where(MessageModel.conversation_id == ConversationModel.id),
+            ~exists().where(
+                MessageModel.conversation_id == ConversationModel.id,
+                MessageModel.created_at >= idle_before
+            )
+        ).order_by(
+            ConversationModel.updated_at
+        ).limit(limit)
+    ]
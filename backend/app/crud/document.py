@@ -0,0 +1,144 @@
+
+"""CRUD operations for document management."""
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import exists, or_, select
+from sqlalchemy.orm import Session, aliased
+
+from app.db.base import (
+    ArchivedCitation as ArchivedCitationModel,
+    Blob as BlobModel,
+    Chunk as ChunkModel,
+    Document as DocumentModel,
+    DocumentStatus as DocumentStatusModel,
+    Source as SourceModel,
+    Tag as TagModel
+)
+from app.schemas.document import DocumentCreate
+
+def get_document_by_id(db: Session, document_id: str) -> Optional[DocumentModel]:
+    """Get a specific document by ID."""
+    return db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
+
+def create_document(
+    db: Session,
+    document: DocumentCreate,
+    user_id: str,
+    storage_path: str,
+    content_hash: Optional[str] = None,
+    blob_id: Optional[str] = None,
+    status: str = "pending",
+    document_id: Optional[str] = None
+) -> DocumentModel:
+    """Create a new document for a stored file."""
+    db_document = DocumentModel(
+        id=document_id,
+        title=document.title,
+        description=document.description,
+        file_name=document.file_name,
+        file_size=document.file_size,
+        mime_type=document.mime_type,
+        status=status,
+        storage_path=storage_path,
+        content_hash=content_hash,
+        blob_id=blob_id,
+        user_id=user_id
+    )
+    if document.tags:
+        db_document.tags = db.query(TagModel).filter(TagModel.id.in_(document.tags)).all()
+    db.add(db_document)
+    db.flush()
+    db.add(DocumentStatusModel(
+        document_id=db_document.id,
+        status=status,
+        progress=0.0,
+        updated_at=datetime.utcnow()
+    ))
+    db.commit()
+    db.refresh(db_document)
+    return db_document
+
+def get_indexed_document_id(db: Session, document_id: str) -> str:
+    """
+    Get the document whose chunks index a document's content.
+
+    That is the document itself, unless it shares a blob indexed through
+    another document.
+    """
+    row = db.query(DocumentModel.blob_id, BlobModel.document_id).outerjoin(
+        BlobModel, BlobModel.id == DocumentModel.blob_id
+    ).filter(DocumentModel.id == document_id).first()
+    if row is None or row.document_id is None:
+        return document_id
+    return row.document_id
+
+def get_blob_documents(
+    db: Session, blob_id: str, exclude: Optional[str] = None
+) -> List[DocumentModel]:
+    """Get the documents sharing a blob, oldest first."""
+    query = db.query(DocumentModel).filter(DocumentModel.blob_id == blob_id)
+    if exclude is not None:
+        query = query.filter(DocumentModel.id != exclude)
+    return query.order_by(DocumentModel.created_at, DocumentModel.id).all()
+
+def is_document_cited(db: Session, document_id: str) -> bool:
+    """Check whether message sources, archived conversations or kept chunks still point at a document."""
+    return db.query(
+        exists().where(SourceModel.document_id == document_id)
+        | exists().where(ArchivedCitationModel.document_id == document_id)
+        | exists().where(ChunkModel.document_id == document_id)
+    ).scalar()
+
+def _sharing_content(document_id: str):
+    """Filter for a document and every document sharing its blob."""
+    document = aliased(DocumentModel)
+    blob_id = select(document.blob_id).where(document.id == document_id).scalar_subquery()
+    return or_(DocumentModel.id == document_id, DocumentModel.blob_id == blob_id)
+
+def create_status_update(
+    db: Session,
+    document_id: str,
+    status: str,
+    progress: float = 0.0,
+    error: Optional[str] = None
+) -> DocumentStatusModel:
+    """
+    Record a new processing status for a document.
+
+    Documents sharing its blob are indexed through it and follow the same
+    status.
+    """
+    db_status = DocumentStatusModel(
+        document_id=document_id,
+        status=status,
+        progress=progress,
+        error=error,
+        updated_at=datetime.utcnow()
+    )
+    db.add(db_status)
+    db.query(DocumentModel).filter(_sharing_content(document_id)).update(
+        {DocumentModel.status: status}, synchronize_session=False
+    )
+    db.commit()
+    db.refresh(db_status)
+    return db_status
+
+def update_status_progress(
+    db: Session,
+    db_status: DocumentStatusModel,
+    progress: float,
+    status: Optional[str] = None,
+    error: Optional[str] = None
+) -> DocumentStatusModel:
+    """Update the progress of a processing status, and its state if given."""
+    db_status.progress = progress
+    db_status.updated_at = datetime.utcnow()
+    if error is not None:
+        db_status.error = error
+    if status is not None:
+        db_status.status = status
+        db.query(DocumentModel).filter(_sharing_content(db_status.document_id)).update(
+            {DocumentModel.status: status}, synchronize_session=False
+        )
+    db.commit()
+    return db_status
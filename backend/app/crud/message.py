@@ -1,56 +1,102 @@
 
 """CRUD operations for message management."""
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple
+from datetime import datetime
+from itertools import islice
+import uuid
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import delete, func, insert, select
 
 from app.db.base import (
+    generate_uuid,
+    Chunk as ChunkModel,
     Message as MessageModel,
     Source as SourceModel,
     Feedback as FeedbackModel
 )
-from app.schemas.message import FeedbackCreate, SourceBase
+from app.schemas.message import SourceBase
+from app.crud.analytics import record_feedback_changes
+from app.crud.chunk import chunk_id_for, insert_missing_chunks, get_chunk_texts
 
 def create_message(
     db: Session, 
     content: str, 
     role: str, 
     conversation_id: str,
-    sources: List[SourceBase] = None
+    sources: List[SourceBase] = None,
+    prompt_version: Optional[str] = None
 ) -> MessageModel:
-    """Create a new message."""
-    db_message = MessageModel(
-        content=content,
-        role=role,
-        conversation_id=conversation_id
-    )
-    db.add(db_message)
-    db.flush()  # Flush to get the ID without committing
+    """
+    Create a new message together with its sources.
+
+    The message and all of its sources are written with core INSERT
+    statements in a single transaction. Sources go through one executemany,
+    which SQLAlchemy batches into multi-row ``INSERT ... VALUES`` statements
+    on dialects that support it, so an assistant message with many sources
+    costs a single round-trip for them. Source text is stored once in the
+    shared chunks table and referenced by chunk ID. The primary key and
+    ``created_at`` are generated client-side, which lets the returned
+    message be built without reloading it after the commit.
+    """
+    message_values = {
+        "id": generate_uuid(),
+        "conversation_id": conversation_id,
+        "content": content,
+        "role": role,
+        "prompt_version": prompt_version,
+        "created_at": datetime.utcnow()
+    }
+    db.execute(insert(MessageModel), message_values)
     
-    # Add sources if provided (for assistant messages)
+    # Add sources if provided (for assistant messages). Their text lives in
+    # the shared chunks table; sources only reference it.
     if sources and role == "assistant":
+        new_chunks = {}
+        source_rows = []
         for source in sources:
-            db_source = SourceModel(
-                message_id=db_message.id,
-                document_id=source.documentId,
-                title=source.title,
-                content=source.content,
-                page=source.page,
-                score=source.score
-            )
-            db.add(db_source)
+            chunk_id = source.chunkId
+            if chunk_id is None:
+                chunk_id = chunk_id_for(source.documentId, source.content)
+                new_chunks[chunk_id] = {
+                    "id": chunk_id,
+                    "document_id": source.documentId,
+                    "content": source.content,
+                    "page": source.page,
+                    "created_at": message_values["created_at"]
+                }
+            source_rows.append({
+                "id": generate_uuid(),
+                "message_id": message_values["id"],
+                "document_id": source.documentId,
+                "chunk_id": chunk_id,
+                "start_offset": source.startOffset,
+                "end_offset": source.endOffset,
+                "title": source.title,
+                "content": None,
+                "page": source.page,
+                "score": source.score
+            })
+        insert_missing_chunks(db, list(new_chunks.values()))
+        db.execute(insert(SourceModel), source_rows)
     
     db.commit()
-    db.refresh(db_message)
-    return db_message
+    return MessageModel(**message_values)
 
 def get_messages(
     db: Session, 
     conversation_id: str,
     page: int = 1,
-    page_size: int = 50
+    page_size: int = 50,
+    source_chars: Optional[int] = None
 ) -> Tuple[List[MessageModel], int]:
-    """Get paginated messages for a conversation."""
+    """
+    Get paginated messages for a conversation.
+
+    Args:
+        source_chars: Keep at most this many characters of each source's
+            text, 0 to omit it without loading it, None for the full text
+    """
     # Count total messages in this conversation
     total = db.query(func.count(MessageModel.id)).filter(
         MessageModel.conversation_id == conversation_id
@@ -67,42 +113,311 @@ def get_messages(
         page_size
     ).all()
     
-    # Load sources for each message
-    for message in messages:
-        message.sources = db.query(SourceModel).filter(
-            SourceModel.message_id == message.id
+    # Load sources for the whole page at once and hydrate their text from
+    # the shared chunks
+    sources_by_message = {message.id: [] for message in messages}
+    if messages:
+        sources = db.query(SourceModel).filter(
+            SourceModel.message_id.in_(list(sources_by_message))
+        ).order_by(
+            SourceModel.score.desc()
         ).all()
+        if source_chars == 0:
+            for source in sources:
+                set_committed_value(source, "content", "")
+                source.content_truncated = True
+        else:
+            hydrate_source_content(db, sources, max_chars=source_chars)
+        for source in sources:
+            sources_by_message[source.message_id].append(source)
+    
+    for message in messages:
+        set_committed_value(message, "sources", sources_by_message[message.id])
     
     return messages, total
 
+def hydrate_source_content(
+    db: Session, sources: List[SourceModel], max_chars: Optional[int] = None
+) -> None:
+    """
+    Fill in source text from the shared chunks in a single query.
+
+    Text longer than ``max_chars`` is cut and the source marked with
+    ``content_truncated``.
+    """
+    texts = get_chunk_texts(
+        db, (source.chunk_id for source in sources if source.content is None)
+    )
+    for source in sources:
+        if source.content is None:
+            text = texts.get(source.chunk_id, "")[source.start_offset:source.end_offset]
+        else:
+            text = source.content
+        if max_chars is not None and len(text) > max_chars:
+            text = text[:max_chars]
+            source.content_truncated = True
+        # Hydrated text is not a change to persist back to the source row
+        set_committed_value(source, "content", text)
+
 def get_message_by_id(db: Session, message_id: str) -> Optional[MessageModel]:
     """Get a specific message by ID."""
     return db.query(MessageModel).filter(MessageModel.id == message_id).first()
 
-def create_feedback(db: Session, feedback: FeedbackCreate) -> FeedbackModel:
-    """Create or update feedback for a message."""
-    # Check if feedback already exists
-    existing = db.query(FeedbackModel).filter(
-        FeedbackModel.message_id == feedback.message_id
+def get_source(db: Session, message_id: str, source_id: str) -> Optional[SourceModel]:
+    """Get a source of a message with its full text."""
+    source = db.query(SourceModel).filter(
+        SourceModel.id == source_id,
+        SourceModel.message_id == message_id
     ).first()
-    
-    if existing:
-        # Update existing feedback
-        existing.feedback_type = feedback.feedback_type
-        existing.feedback_category = feedback.feedback_category
-        existing.feedback_text = feedback.feedback_text
-        db.commit()
-        db.refresh(existing)
-        return existing
-    
-    # Create new feedback
-    db_feedback = FeedbackModel(
-        message_id=feedback.message_id,
-        feedback_type=feedback.feedback_type,
-        feedback_category=feedback.feedback_category,
-        feedback_text=feedback.feedback_text
-    )
-    db.add(db_feedback)
+    if source is not None:
+        hydrate_source_content(db, [source])
+    return source
+
+def delete_message(db: Session, message_id: str) -> None:
+    """Delete a message, e.g. a question that could not be answered."""
+    db.query(MessageModel).filter(MessageModel.id == message_id).delete(synchronize_session=False)
     db.commit()
-    db.refresh(db_feedback)
-    return db_feedback
+
+def iter_message_records(
+    db: Session, conversation_id: str, batch_size: int = 500
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a conversation's messages, oldest first, as plain dicts.
+
+    Messages are read through a server-side cursor ``batch_size`` at a
+    time, and the sources and feedback of each batch in one query each, so
+    memory stays bounded however long the conversation is. Records carry
+    the full source text, so they stay readable after the chunks they
+    were cited from are gone.
+    """
+    result = db.execute(
+        select(
+            MessageModel.id,
+            MessageModel.role,
+            MessageModel.content,
+            MessageModel.prompt_version,
+            MessageModel.created_at
+        ).where(
+            MessageModel.conversation_id == conversation_id
+        ).order_by(
+            MessageModel.created_at, MessageModel.id
+        ).execution_options(yield_per=batch_size)
+    )
+    for batch in result.partitions():
+        message_ids = [row.id for row in batch]
+        sources = db.query(SourceModel).filter(
+            SourceModel.message_id.in_(message_ids)
+        ).order_by(
+            SourceModel.score.desc()
+        ).all()
+        hydrate_source_content(db, sources)
+        sources_by_message: Dict[str, List[Dict[str, Any]]] = {}
+        for source in sources:
+            sources_by_message.setdefault(source.message_id, []).append({
+                "id": source.id,
+                "document_id": source.document_id,
+                "chunk_id": source.chunk_id,
+                "start_offset": source.start_offset,
+                "end_offset": source.end_offset,
+                "title": source.title,
+                "content": source.content,
+                "page": source.page,
+                "score": source.score
+            })
+        feedback_by_message = {
+            feedback.message_id: {
+                "id": feedback.id,
+                "feedback_type": feedback.feedback_type,
+                "feedback_category": feedback.feedback_category,
+                "feedback_text": feedback.feedback_text,
+                "created_at": feedback.created_at
+            }
+            for feedback in db.query(FeedbackModel).filter(
+                FeedbackModel.message_id.in_(message_ids)
+            )
+        }
+        for row in batch:
+            yield {
+                "id": row.id,
+                "role": row.role,
+                "content": row.content,
+                "prompt_version": row.prompt_version,
+                "created_at": row.created_at,
+                "sources": sources_by_message.get(row.id, []),
+                "feedback": feedback_by_message.get(row.id)
+            }
+
+def restore_message_records(
+    db: Session,
+    conversation_id: str,
+    records: Iterable[Dict[str, Any]],
+    batch_size: int = 500
+) -> int:
+    """
+    Insert messages from ``iter_message_records`` records, without committing.
+
+    Messages keep their IDs and timestamps. Sources point at their chunk
+    again when it still exists and keep their own copy of the text when
+    it does not.
+
+    Returns:
+        Number of messages inserted
+    """
+    records = iter(records)
+    count = 0
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return count
+        chunk_ids = {
+            source["chunk_id"] for record in batch for source in record["sources"]
+            if source["chunk_id"]
+        }
+        existing = {
+            chunk_id for (chunk_id,) in db.query(ChunkModel.id).filter(
+                ChunkModel.id.in_(list(chunk_ids))
+            )
+        } if chunk_ids else set()
+
+        messages, sources, feedback = [], [], []
+        for record in batch:
+            messages.append({
+                "id": record["id"],
+                "conversation_id": conversation_id,
+                "role": record["role"],
+                "content": record["content"],
+                "prompt_version": record["prompt_version"],
+                "created_at": _datetime(record["created_at"])
+            })
+            for source in record["sources"]:
+                kept = source["chunk_id"] in existing
+                sources.append({
+                    "id": source["id"],
+                    "message_id": record["id"],
+                    "document_id": source["document_id"],
+                    "chunk_id": source["chunk_id"] if kept else None,
+                    "start_offset": source["start_offset"],
+                    "end_offset": source["end_offset"],
+                    "title": source["title"],
+                    "content": None if kept else source["content"],
+                    "page": source["page"],
+                    "score": source["score"]
+                })
+            if record["feedback"]:
+                feedback.append({
+                    **record["feedback"],
+                    "message_id": record["id"],
+                    "created_at": _datetime(record["feedback"]["created_at"])
+                })
+        db.execute(insert(MessageModel), messages)
+        if sources:
+            db.execute(insert(SourceModel), sources)
+        if feedback:
+            db.execute(insert(FeedbackModel), feedback)
+        count += len(batch)
+
+def delete_conversation_messages(
+    db: Session, message_ids: List[str], batch_size: int = 500
+) -> None:
+    """Delete messages with their sources and feedback, without committing."""
+    for start in range(0, len(message_ids), batch_size):
+        batch = message_ids[start:start + batch_size]
+        db.execute(delete(FeedbackModel).where(FeedbackModel.message_id.in_(batch)))
+        db.execute(delete(SourceModel).where(SourceModel.message_id.in_(batch)))
+        db.execute(delete(MessageModel).where(MessageModel.id.in_(batch)))
+
+def _datetime(value: Any) -> Optional[datetime]:
+    """Parse a timestamp that went through JSON."""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def feedback_id_for(message_id: str) -> str:
+    """
+    Derive the ID of a message's feedback from the message ID.
+
+    A message has at most one feedback row, so the ID can be returned
+    before the buffered write creating it has run.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"feedback:{message_id}"))
+
+def get_feedback_id(db: Session, message_id: str) -> str:
+    """
+    Get the ID of a message's feedback, stored or yet to be written.
+
+    Feedback created before IDs were derived from the message keeps its
+    original ID, which upserts leave unchanged.
+    """
+    stored = db.query(FeedbackModel.id).filter(FeedbackModel.message_id == message_id).scalar()
+    return stored if stored is not None else feedback_id_for(message_id)
+
+def upsert_feedback(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """
+    Create or update the feedback of several messages, without committing.
+
+    Rows are applied in order, so the last feedback for a message wins.
+    Applying the same rows again changes nothing. The feedback rollups are
+    updated in the same transaction, by the difference from what was
+    stored before.
+
+    Args:
+        rows: Dicts with ``message_id``, ``feedback_type``,
+            ``feedback_category`` and ``feedback_text``
+    """
+    latest = {}
+    for row in rows:
+        latest[row["message_id"]] = {
+            "id": feedback_id_for(row["message_id"]),
+            "message_id": row["message_id"],
+            "feedback_type": row["feedback_type"],
+            "feedback_category": row.get("feedback_category"),
+            "feedback_text": row.get("feedback_text")
+        }
+    if not latest:
+        return
+    values = list(latest.values())
+    previous = {
+        message_id: {
+            "feedback_type": feedback_type,
+            "feedback_category": feedback_category,
+            "created_at": created_at
+        }
+        for message_id, feedback_type, feedback_category, created_at in db.query(
+            FeedbackModel.message_id,
+            FeedbackModel.feedback_type,
+            FeedbackModel.feedback_category,
+            FeedbackModel.created_at
+        ).filter(FeedbackModel.message_id.in_(list(latest)))
+    }
+    record_feedback_changes(db, previous, latest)
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(FeedbackModel)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["message_id"],
+            set_={
+                "feedback_type": stmt.excluded.feedback_type,
+                "feedback_category": stmt.excluded.feedback_category,
+                "feedback_text": stmt.excluded.feedback_text
+            }
+        )
+        db.execute(stmt, values)
+        return
+    existing = {
+        feedback.message_id: feedback for feedback in db.query(FeedbackModel).filter(
+            FeedbackModel.message_id.in_(list(latest))
+        )
+    }
+    for row in values:
+        feedback = existing.get(row["message_id"])
+        if feedback is None:
+            db.add(FeedbackModel(**row))
+        else:
+            feedback.feedback_type = row["feedback_type"]
+            feedback.feedback_category = row["feedback_category"]
+            feedback.feedback_text = row["feedback_text"]
+    db.flush()
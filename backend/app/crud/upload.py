@@ -0,0 +1,117 @@
+
+"""CRUD operations for resumable uploads."""
+from typing import List, Optional, Tuple
+import json
+from sqlalchemy.orm import Session
+
+from app.db.base import UploadSession as UploadSessionModel
+from app.schemas.document import UploadCreate
+
+def create_upload_session(
+    db: Session,
+    upload: UploadCreate,
+    user_id: str,
+    storage_key: str,
+    storage_upload_id: str,
+    part_size: int,
+    upload_session_id: Optional[str] = None
+) -> UploadSessionModel:
+    """Create a new upload session."""
+    db_upload = UploadSessionModel(
+        id=upload_session_id,
+        user_id=user_id,
+        title=upload.title,
+        description=upload.description,
+        file_name=upload.file_name,
+        file_size=upload.file_size,
+        mime_type=upload.mime_type,
+        tags=json.dumps(upload.tags or []),
+        storage_key=storage_key,
+        storage_upload_id=storage_upload_id,
+        part_size=part_size,
+        next_part=1,
+        bytes_received=0,
+        parts="[]",
+        status="active"
+    )
+    db.add(db_upload)
+    db.commit()
+    db.refresh(db_upload)
+    return db_upload
+
+def get_upload_session(db: Session, upload_session_id: str) -> Optional[UploadSessionModel]:
+    """Get a specific upload session by ID."""
+    return db.query(UploadSessionModel).filter(
+        UploadSessionModel.id == upload_session_id
+    ).first()
+
+def get_upload_parts(db_upload: UploadSessionModel) -> List[Tuple[int, str]]:
+    """Get the ``(part_number, etag)`` pairs received so far."""
+    return [tuple(part) for part in json.loads(db_upload.parts or "[]")]
+
+def record_upload_part(
+    db: Session,
+    db_upload: UploadSessionModel,
+    part_number: int,
+    etag: str,
+    size: int
+) -> bool:
+    """
+    Record a received part, unless another request recorded it first.
+
+    The update only applies while the session still expects this part, so
+    concurrent uploads of the same part cannot both advance the session.
+
+    Returns:
+        True if the part was recorded
+    """
+    parts = get_upload_parts(db_upload) + [(part_number, etag)]
+    updated = db.query(UploadSessionModel).filter(
+        UploadSessionModel.id == db_upload.id,
+        UploadSessionModel.next_part == part_number
+    ).update({
+        UploadSessionModel.next_part: part_number + 1,
+        UploadSessionModel.bytes_received: UploadSessionModel.bytes_received + size,
+        UploadSessionModel.parts: json.dumps(parts)
+    }, synchronize_session=False)
+    db.commit()
+    db.refresh(db_upload)
+    return updated == 1
+
+def update_upload_status(
+    db: Session,
+    db_upload: UploadSessionModel,
+    status: str,
+    document_id: Optional[str] = None
+) -> UploadSessionModel:
+    """Update the status of an upload session."""
+    db_upload.status = status
+    if document_id is not None:
+        db_upload.document_id = document_id
+    db.commit()
+    db.refresh(db_upload)
+    return db_upload
+
+def transition_upload_status(
+    db: Session,
+    db_upload: UploadSessionModel,
+    from_status: str,
+    to_status: str
+) -> bool:
+    """
+    Move an upload session from one status to another, unless another request moved it first.
+
+    The update only applies while the session is still in ``from_status``,
+    so of concurrent requests completing or aborting an upload exactly one
+    goes ahead.
+
+    Returns:
+        True if the status was changed
+    """
+    updated = db.query(UploadSessionModel).filter(
+        UploadSessionModel.id == db_upload.id,
+        UploadSessionModel.status == from_status
+    ).update({UploadSessionModel.status: to_status}, synchronize_session=False)
+    db.commit()
+    db.refresh(db_upload)
+    return updated == 1
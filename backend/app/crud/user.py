@@ -1,7 +1,8 @@
 
 """CRUD operations for user management."""
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
+from sqlalchemy import bindparam, or_, update
 from sqlalchemy.orm import Session
 
 from app.core.security import verify_password, get_password_hash
@@ -69,9 +70,29 @@ def authenticate(db: Session, email: str, password: str) -> Optional[User]:
         return None
     return user
 
-def update_last_login(db: Session, user_id: str) -> None:
-    """Update user's last login timestamp."""
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
-    if db_user:
-        db_user.last_login = datetime.utcnow()
-        db.commit()
+def record_last_logins(db: Session, logins: List[Dict[str, Any]]) -> None:
+    """
+    Record several users' login times, without committing.
+
+    A time earlier than the one stored is ignored, so logins can be
+    recorded late, out of order or more than once.
+
+    Args:
+        logins: Dicts with ``user_id`` and ``at``, an ISO 8601 time
+    """
+    latest: Dict[str, datetime] = {}
+    for login in logins:
+        at = datetime.fromisoformat(login["at"])
+        if login["user_id"] not in latest or at > latest[login["user_id"]]:
+            latest[login["user_id"]] = at
+    if not latest:
+        return
+    # A core statement, so the rows go out as one executemany
+    users = UserModel.__table__
+    db.execute(
+        update(users)
+        .where(users.c.id == bindparam("user_id"))
+        .where(or_(users.c.last_login.is_(None), users.c.last_login < bindparam("at")))
+        .values(last_login=bindparam("at")),
+        [{"user_id": user_id, "at": at} for user_id, at in latest.items()]
+    )
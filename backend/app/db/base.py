@@ -1,6 +1,6 @@
 
 """SQLAlchemy models declaration."""
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Table, Text
+from sqlalchemy import DDL, Column, String, Integer, Float, Boolean, Date, DateTime, ForeignKey, Table, Text, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -20,14 +20,6 @@ document_tags = Table(
     Column("tag_id", String, ForeignKey("tags.id"), primary_key=True),
 )
 
-# Association table for tag-role many-to-many relationship
-tag_access = Table(
-    "tag_access",
-    Base.metadata,
-    Column("tag_id", String, ForeignKey("tags.id"), primary_key=True),
-    Column("role", String, primary_key=True),
-)
-
 class User(Base):
     """User model."""
     __tablename__ = "users"
@@ -51,41 +43,121 @@ class Conversation(Base):
     
     id = Column(String, primary_key=True, default=generate_uuid)
     title = Column(String, nullable=False)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # Set while the messages live in the archive file at archive_key
+    archived_at = Column(DateTime, index=True)
+    archive_key = Column(String)
+    archived_message_count = Column(Integer)
+    rehydrated_at = Column(DateTime)  # last time the archive was restored
     
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    archived_citations = relationship("ArchivedCitation", cascade="all, delete-orphan")
+
+class ArchivedCitation(Base):
+    """Document cited by an archived conversation, kept from being purged until it is restored."""
+    __tablename__ = "archived_citations"
+    
+    conversation_id = Column(String, ForeignKey("conversations.id"), primary_key=True)
+    document_id = Column(String, ForeignKey("documents.id"), primary_key=True, index=True)
 
 class Message(Base):
     """Message model."""
     __tablename__ = "messages"
     
     id = Column(String, primary_key=True, default=generate_uuid)
-    conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False)
+    conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False, index=True)
     content = Column(Text, nullable=False)
     role = Column(String, nullable=False)
+    prompt_version = Column(String)  # system prompt an assistant message was answered with
     created_at = Column(DateTime, server_default=func.now())
     
     conversation = relationship("Conversation", back_populates="messages")
     sources = relationship("Source", back_populates="message", cascade="all, delete-orphan")
     feedback = relationship("Feedback", back_populates="message", uselist=False, cascade="all, delete-orphan")
 
+# Full-text search over message text, kept in step with the messages
+# table. On SQLite an external-content FTS5 table also indexes the owner of
+# each message as a token, so searches only walk the caller's postings; it
+# keeps no copy of the text, reading it through the message_search_source
+# view. On Postgres a stored tsvector column carries a GIN index. See
+# app/services/message_search.py.
+MESSAGE_SEARCH_DDL = {
+    "sqlite": (
+        "CREATE VIEW message_search_source AS "
+        "SELECT m.rowid AS message_rowid, m.content AS content, "
+        "replace(c.user_id, '-', '') AS owner "
+        "FROM messages m JOIN conversations c ON c.id = m.conversation_id",
+        "CREATE VIRTUAL TABLE message_search USING fts5("
+        "content, owner, content = 'message_search_source', content_rowid = 'message_rowid', "
+        "tokenize = 'unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER message_search_insert AFTER INSERT ON messages BEGIN "
+        "INSERT INTO message_search (rowid, content, owner) "
+        "SELECT new.rowid, new.content, replace(user_id, '-', '') "
+        "FROM conversations WHERE id = new.conversation_id; END",
+        # External content leaves the index by passing the values it was indexed with,
+        # so messages are deleted before their conversation, as the ORM cascade does
+        "CREATE TRIGGER message_search_delete AFTER DELETE ON messages BEGIN "
+        "INSERT INTO message_search (message_search, rowid, content, owner) "
+        "SELECT 'delete', old.rowid, old.content, replace(user_id, '-', '') "
+        "FROM conversations WHERE id = old.conversation_id; END",
+        "CREATE TRIGGER message_search_update AFTER UPDATE OF content ON messages BEGIN "
+        "INSERT INTO message_search (message_search, rowid, content, owner) "
+        "SELECT 'delete', old.rowid, old.content, replace(user_id, '-', '') "
+        "FROM conversations WHERE id = old.conversation_id; "
+        "INSERT INTO message_search (rowid, content, owner) "
+        "SELECT new.rowid, new.content, replace(user_id, '-', '') "
+        "FROM conversations WHERE id = new.conversation_id; END",
+    ),
+    "postgresql": (
+        "ALTER TABLE messages ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED",
+        "CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)",
+    ),
+}
+
+for _dialect, _statements in MESSAGE_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Message.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+# The triggers and the Postgres column go with the table, the FTS5 table and its view do not
+for _statement in ("DROP TABLE IF EXISTS message_search", "DROP VIEW IF EXISTS message_search_source"):
+    event.listen(Message.__table__, "after_drop", DDL(_statement).execute_if(dialect="sqlite"))
+
 class Source(Base):
     """Document source for message context."""
     __tablename__ = "sources"
     
     id = Column(String, primary_key=True, default=generate_uuid)
-    message_id = Column(String, ForeignKey("messages.id"), nullable=False)
+    message_id = Column(String, ForeignKey("messages.id"), nullable=False, index=True)
     document_id = Column(String, ForeignKey("documents.id"), nullable=False)
+    chunk_id = Column(String, ForeignKey("chunks.id"), index=True)
+    start_offset = Column(Integer)  # cited span within the chunk text
+    end_offset = Column(Integer)
     title = Column(String)
-    content = Column(Text, nullable=False)
+    content = Column(Text)  # legacy copy, hydrated from the chunk when null
     page = Column(Integer)
     score = Column(Float, nullable=False)
     
     message = relationship("Message", back_populates="sources")
     document = relationship("Document")
+    chunk = relationship("Chunk")
+
+class Chunk(Base):
+    """Document chunk text shared by every source that cites it."""
+    __tablename__ = "chunks"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    document_id = Column(String, ForeignKey("documents.id"), nullable=False, index=True)
+    vector_id = Column(Integer, unique=True)  # row in the vector index, null once removed
+    content = Column(Text, nullable=False)
+    page = Column(Integer)
+    char_start = Column(Integer)  # offsets of the chunk in the extracted document text
+    char_end = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+    
+    document = relationship("Document", back_populates="chunks")
 
 class Feedback(Base):
     """Feedback for message responses."""
@@ -100,6 +172,26 @@ class Feedback(Base):
     
     message = relationship("Message", back_populates="feedback")
 
+class FeedbackRollup(Base):
+    """Feedback counts by day, category and prompt version, kept up to date as feedback arrives."""
+    __tablename__ = "feedback_rollups"
+    
+    day = Column(Date, primary_key=True)  # day the feedback was first given
+    category = Column(String, primary_key=True)  # empty when none was given
+    prompt_version = Column(String, primary_key=True)  # empty when unknown
+    positive = Column(Integer, nullable=False, default=0)
+    negative = Column(Integer, nullable=False, default=0)
+
+class DocumentFeedbackRollup(Base):
+    """Feedback counts of the answers citing a document."""
+    __tablename__ = "document_feedback_rollups"
+    
+    # No foreign key, so rollups never hold up deleting a document
+    document_id = Column(String, primary_key=True)
+    positive = Column(Integer, nullable=False, default=0)
+    negative = Column(Integer, nullable=False, default=0)
+    unhelpful_score = Column(Float, nullable=False, default=0.0, index=True)
+
 class Document(Base):
     """Document model."""
     __tablename__ = "documents"
@@ -112,6 +204,8 @@ class Document(Base):
     mime_type = Column(String, nullable=False)
     status = Column(String, nullable=False, default="pending")
     storage_path = Column(String)
+    content_hash = Column(String, index=True)  # hex SHA-256 of the stored file
+    blob_id = Column(String, ForeignKey("blobs.id"), index=True)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -119,6 +213,45 @@ class Document(Base):
     user = relationship("User", back_populates="documents")
     tags = relationship("Tag", secondary=document_tags, back_populates="documents")
     status_updates = relationship("DocumentStatus", back_populates="document", cascade="all, delete-orphan")
+    chunks = relationship("Chunk", back_populates="document")
+    blob = relationship("Blob")
+
+class Blob(Base):
+    """Stored file content shared by every document with the same digest."""
+    __tablename__ = "blobs"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    content_hash = Column(String, nullable=False, unique=True)  # hex SHA-256
+    storage_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)  # documents using the blob
+    # Document whose chunks index the content; not a foreign key, since the
+    # blob is created before its first document
+    document_id = Column(String, index=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+class UploadSession(Base):
+    """Resumable chunked upload of a document file."""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    title = Column(String, nullable=False)
+    description = Column(Text)
+    file_name = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    mime_type = Column(String, nullable=False)
+    tags = Column(Text)  # JSON list of tag IDs
+    storage_key = Column(String, nullable=False)
+    storage_upload_id = Column(String, nullable=False)
+    part_size = Column(Integer, nullable=False)
+    next_part = Column(Integer, nullable=False, default=1)
+    bytes_received = Column(Integer, nullable=False, default=0)
+    parts = Column(Text)  # JSON list of [part_number, etag]
+    status = Column(String, nullable=False, default="active")
+    document_id = Column(String, ForeignKey("documents.id"))
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
 class DocumentStatus(Base):
     """Document processing status."""
@@ -1,10 +1,22 @@
 
 """Database session management."""
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from typing import Iterator
+import logging
+import re
+import time
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.core.metrics import QueryStats, record_query
+
+logger = logging.getLogger(__name__)
+
+# String literals inlined in statement text, replaced before logging
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
 
 engine = create_engine(
     settings.DATABASE_URL, 
@@ -19,3 +31,68 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def redact_statement(statement: str, parameters, executemany: bool) -> str:
+    """
+    Describe a statement for logging without any parameter values.
+
+    Bound parameters are reported by count only and string literals in the
+    SQL text are masked.
+    """
+    statement = _STRING_LITERAL.sub("'?'", " ".join(statement.split()))
+    if executemany:
+        return f"{statement} [executemany x{len(parameters)}, parameters redacted]"
+    count = len(parameters) if parameters else 0
+    return f"{statement} [{count} parameters redacted]"
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+@event.listens_for(engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context._query_started
+    record_query(statement, seconds)
+    if settings.SLOW_QUERY_MS and seconds * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s",
+            seconds * 1000,
+            redact_statement(statement, parameters, executemany)[:2000]
+        )
+
+@contextmanager
+def assert_max_queries(max_queries: int, bind=None) -> Iterator[QueryStats]:
+    """
+    Fail if a block executes more than ``max_queries`` statements.
+
+    Meant for tests guarding endpoints against per-row query regressions.
+    Every statement on the engine is counted, whichever thread runs it, so
+    it works around ``TestClient`` calls:
+
+        with assert_max_queries(3):
+            client.get(f"/api/v1/chat/conversations/{conversation_id}/messages")
+
+    Args:
+        max_queries: Highest number of statements allowed
+        bind: Engine to watch, defaults to the application engine
+
+    Raises:
+        AssertionError: Listing the executed statements, when over the limit
+    """
+    bind = engine if bind is None else bind
+    stats = QueryStats(capture=True)
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        stats.count += 1
+        stats.statements.append(statement)
+
+    event.listen(bind, "after_cursor_execute", count)
+    try:
+        yield stats
+    finally:
+        event.remove(bind, "after_cursor_execute", count)
+    if stats.count > max_queries:
+        statements = "\n".join(f"  {i + 1}. {statement}" for i, statement in enumerate(stats.statements))
+        raise AssertionError(
+            f"Expected at most {max_queries} queries, {stats.count} were executed:\n{statements}"
+        )
@@ -0,0 +1,18 @@
+
+"""Analytics schema definitions."""
+from pydantic import BaseModel
+
+class FeedbackCount(BaseModel):
+    """Feedback counts of one group of a feedback summary."""
+    key: str  # day, category or prompt version; empty when none was recorded
+    positive: int
+    negative: int
+    negative_rate: float
+
+class DocumentFeedback(BaseModel):
+    """Feedback counts of the answers citing a document."""
+    document_id: str
+    title: str
+    positive: int
+    negative: int
+    unhelpful_score: float  # lower bound of the negative rate's 95% interval
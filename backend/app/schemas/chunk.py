@@ -0,0 +1,34 @@
+
+"""Chunk schema definitions."""
+from typing import List, Optional
+from pydantic import BaseModel
+
+class ChunkBase(BaseModel):
+    """Base chunk schema."""
+    content: str
+    page: Optional[int] = None
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+
+class ChunkCreate(ChunkBase):
+    """Chunk creation schema."""
+    pass
+
+class ChunkInDB(ChunkBase):
+    """Chunk database schema."""
+    id: str
+    document_id: str
+    vector_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class ChunkMetadata(BaseModel):
+    """Metadata resolved for a vector index row."""
+    vector_id: int
+    chunk_id: str
+    document_id: str
+    page: Optional[int] = None
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+    tag_ids: List[str] = []
@@ -18,6 +18,24 @@ class DocumentCreate(DocumentBase):
     mime_type: str
     tags: Optional[List[str]] = []
 
+class UploadCreate(DocumentCreate):
+    """Resumable upload creation schema."""
+    pass
+
+class UploadSession(BaseModel):
+    """Resumable upload state schema."""
+    id: str
+    file_name: str
+    file_size: int
+    part_size: int
+    next_part: int
+    bytes_received: int
+    status: str
+    document_id: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
 class DocumentUpdate(BaseModel):
     """Document update schema."""
     title: Optional[str] = None
@@ -32,6 +50,7 @@ class DocumentInDB(DocumentBase):
     mime_type: str
     status: str
     storage_path: Optional[str] = None
+    content_hash: Optional[str] = None
     user_id: str
     created_at: datetime
     updated_at: datetime
@@ -1,7 +1,7 @@
 
 """Message schema definitions."""
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import List, Optional, Tuple
+from pydantic import AliasChoices, BaseModel, Field
 from datetime import datetime
 
 class SourceBase(BaseModel):
@@ -9,8 +9,14 @@ class SourceBase(BaseModel):
     title: str
     content: str
     score: float
-    documentId: str
+    # Also accept the snake_case attributes of stored sources
+    documentId: str = Field(validation_alias=AliasChoices("documentId", "document_id"))
     page: Optional[int] = None
+    chunkId: Optional[str] = Field(None, validation_alias=AliasChoices("chunkId", "chunk_id"))
+    startOffset: Optional[int] = Field(
+        None, validation_alias=AliasChoices("startOffset", "start_offset")
+    )
+    endOffset: Optional[int] = Field(None, validation_alias=AliasChoices("endOffset", "end_offset"))
 
 class SourceCreate(SourceBase):
     """Source creation schema."""
@@ -27,6 +33,10 @@ class SourceInDB(SourceBase):
 class Source(SourceBase):
     """Source response schema."""
     id: str
+    # Set when history was listed with shortened or omitted source text
+    contentTruncated: bool = Field(
+        False, validation_alias=AliasChoices("contentTruncated", "content_truncated")
+    )
 
 class MessageBase(BaseModel):
     """Base message schema."""
@@ -56,6 +66,18 @@ class Message(MessageBase):
     user_avatar: Optional[str] = None
     user_name: Optional[str] = None
 
+class MessageSearchResult(BaseModel):
+    """Message matching a search, with a snippet of its text."""
+    message_id: str
+    conversation_id: str
+    conversation_title: str
+    role: str
+    created_at: datetime
+    score: float
+    snippet: str
+    # Start and end offsets of the matching words within the snippet
+    highlights: List[Tuple[int, int]] = []
+
 class MessageResponse(BaseModel):
     """Message send response schema."""
     id: str
@@ -0,0 +1,334 @@
+
+"""Archival of idle conversations to compressed files in storage.
+
+An archived conversation keeps its ``conversations`` row as a stub, with
+the message count and the key of its archive; its messages, sources and
+feedback move to one JSON Lines file, zstd-compressed when the
+``zstandard`` package is installed and gzipped otherwise. The first line
+describes the conversation, every following line is a message record
+from ``iter_message_records``. Opening the conversation restores the rows
+and deletes the file.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+import logging
+import zlib
+
+import orjson
+from sqlalchemy import delete, exists, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.crud.conversation import get_idle_conversation_ids
+from app.crud.message import (
+    delete_conversation_messages,
+    iter_message_records,
+    restore_message_records
+)
+from app.db.base import (
+    ArchivedCitation as ArchivedCitationModel,
+    Conversation as ConversationModel,
+    Message as MessageModel
+)
+from app.db.session import SessionLocal
+from app.services.storage import StorageBackend, StorageError, get_storage
+
+try:
+    import zstandard
+except ImportError:
+    # Without the zstandard package archives are gzipped
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "archives/conversations"
+
+# Export output is sent in pieces of about this many bytes
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# Compressed export formats: codec and media type
+EXPORT_CODECS = {
+    "gzip": ("gz", "application/gzip"),
+    "zstd": ("zst", "application/zstd")
+}
+
+def zstd_available() -> bool:
+    """Check whether zstd-compressed files can be written and read."""
+    return zstandard is not None
+
+def archive_key_for(conversation_id: str) -> str:
+    """Get the storage key of a conversation's archive."""
+    codec = "zst" if zstandard is not None else "gz"
+    return f"{ARCHIVE_PREFIX}/{conversation_id}.jsonl.{codec}"
+
+def _compress(lines: Iterable[bytes], codec: str) -> Iterator[bytes]:
+    if codec == "zst":
+        compressor = zstandard.ZstdCompressor(level=6).compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for line in lines:
+        data = compressor.compress(line)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def iter_archive_lines(key: str, storage: Optional[StorageBackend] = None) -> Iterator[bytes]:
+    """
+    Stream the JSON lines of an archive without decompressing it whole.
+
+    Raises:
+        StorageError: The archive is zstd-compressed and the zstandard
+            package is not installed
+    """
+    storage = get_storage() if storage is None else storage
+    if key.endswith(".zst"):
+        if zstandard is None:
+            raise StorageError(f"The zstandard package is needed to read {key}")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = b""
+    for data in storage.iter_object(key):
+        pending += decompressor.decompress(data)
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line:
+                yield line
+    if pending:
+        yield pending
+
+def _conversation_record(conversation: ConversationModel) -> Dict[str, Any]:
+    return {
+        "type": "conversation",
+        "id": conversation.id,
+        "title": conversation.title,
+        "user_id": conversation.user_id,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "archived_at": conversation.archived_at
+    }
+
+def _message_line(conversation_id: str, record: Dict[str, Any]) -> bytes:
+    return orjson.dumps({"type": "message", "conversation_id": conversation_id, **record}) + b"\n"
+
+def archive_conversation(
+    db: Session, conversation_id: str, storage: Optional[StorageBackend] = None
+) -> bool:
+    """
+    Move a conversation's messages to an archive file, keeping a stub row.
+
+    The file is written before any row is deleted, and the rows are only
+    deleted if no message arrived in the meantime, so a failure at any
+    point leaves the conversation as it was. ``updated_at`` is preserved
+    to keep the conversation's place in listings.
+
+    Returns:
+        True if the conversation was archived
+    """
+    storage = get_storage() if storage is None else storage
+    conversation = db.query(ConversationModel).filter(
+        ConversationModel.id == conversation_id,
+        ConversationModel.archived_at.is_(None)
+    ).with_for_update(skip_locked=True).first()
+    if conversation is None:
+        return False
+
+    key = archive_key_for(conversation_id)
+    message_ids = []
+    document_ids = set()
+
+    def lines() -> Iterator[bytes]:
+        yield orjson.dumps(_conversation_record(conversation)) + b"\n"
+        for record in iter_message_records(db, conversation_id):
+            message_ids.append(record["id"])
+            document_ids.update(source["document_id"] for source in record["sources"])
+            yield _message_line(conversation_id, record)
+
+    size = storage.write_stream(key, _compress(lines(), key.rsplit(".", 1)[1]))
+    try:
+        delete_conversation_messages(db, message_ids)
+        if not message_ids or db.query(
+            exists().where(MessageModel.conversation_id == conversation_id)
+        ).scalar():
+            # Nothing to archive, or a message arrived while archiving
+            db.rollback()
+            storage.delete(key)
+            return False
+        if document_ids:
+            db.execute(insert(ArchivedCitationModel), [
+                {"conversation_id": conversation_id, "document_id": document_id}
+                for document_id in sorted(document_ids)
+            ])
+        db.execute(
+            update(ConversationModel).where(
+                ConversationModel.id == conversation_id
+            ).values(
+                archived_at=datetime.utcnow(),
+                archive_key=key,
+                archived_message_count=len(message_ids),
+                updated_at=ConversationModel.updated_at
+            )
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        storage.delete(key)
+        raise
+    logger.info(
+        "Archived conversation %s: %d messages in %d bytes", conversation_id, len(message_ids), size
+    )
+    return True
+
+def archive_idle_conversations(
+    db: Session,
+    idle_before: datetime,
+    limit: int = 100,
+    storage: Optional[StorageBackend] = None
+) -> int:
+    """
+    Archive up to ``limit`` conversations idle since ``idle_before``.
+
+    Returns:
+        Number of conversations archived
+    """
+    archived = 0
+    for conversation_id in get_idle_conversation_ids(db, idle_before, limit):
+        try:
+            archived += archive_conversation(db, conversation_id, storage=storage)
+        except Exception:
+            logger.exception("Archiving conversation %s failed", conversation_id)
+    return archived
+
+def rehydrate_conversation(
+    db: Session, conversation: ConversationModel, storage: Optional[StorageBackend] = None
+) -> ConversationModel:
+    """
+    Restore an archived conversation's messages, if it is archived.
+
+    Concurrent calls for the same conversation restore it once. The
+    archive file is deleted after the restore is committed.
+
+    Returns:
+        The conversation, refreshed
+    """
+    if conversation.archived_at is None:
+        return conversation
+    storage = get_storage() if storage is None else storage
+    conversation = db.query(ConversationModel).filter(
+        ConversationModel.id == conversation.id
+    ).with_for_update().populate_existing().one()
+    if conversation.archived_at is None:
+        return conversation
+
+    key = conversation.archive_key
+    try:
+        lines = iter_archive_lines(key, storage)
+        # The first line describes the conversation, which kept its row
+        next(lines, None)
+        count = restore_message_records(db, conversation.id, (orjson.loads(line) for line in lines))
+        db.execute(delete(ArchivedCitationModel).where(
+            ArchivedCitationModel.conversation_id == conversation.id
+        ))
+        db.execute(
+            update(ConversationModel).where(
+                ConversationModel.id == conversation.id
+            ).values(
+                archived_at=None,
+                archive_key=None,
+                archived_message_count=None,
+                rehydrated_at=datetime.utcnow(),
+                updated_at=ConversationModel.updated_at
+            )
+        )
+        db.commit()
+    except Exception:
+        # On a database without row locks a concurrent request may have
+        # restored it first: the inserts then conflict, or the archive is
+        # already deleted, which each backend reports in its own way
+        db.rollback()
+        db.refresh(conversation)
+        if conversation.archived_at is None:
+            return conversation
+        raise
+    db.refresh(conversation)
+    logger.info("Restored conversation %s: %d messages", conversation.id, count)
+
+    try:
+        storage.delete(key)
+    except StorageError:
+        logger.exception("Could not delete archive %s", key)
+    return conversation
+
+def delete_conversation_archive(key: Optional[str], storage: Optional[StorageBackend] = None) -> None:
+    """Delete the archive file of a deleted conversation, if it had one."""
+    if not key:
+        return
+    try:
+        (get_storage() if storage is None else storage).delete(key)
+    except StorageError:
+        logger.exception("Could not delete archive %s", key)
+
+def _buffered(lines: Iterable[bytes], size: int = EXPORT_BUFFER_SIZE) -> Iterator[bytes]:
+    pieces, length = [], 0
+    for line in lines:
+        pieces.append(line)
+        length += len(line)
+        if length >= size:
+            yield b"".join(pieces)
+            pieces, length = [], 0
+    if pieces:
+        yield b"".join(pieces)
+
+def export_conversations(
+    user_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    compression: Optional[str] = None,
+    batch_size: int = 100
+) -> Iterator[bytes]:
+    """
+    Stream conversations with all their messages as JSON Lines.
+
+    Each conversation is a ``conversation`` line followed by its
+    ``message`` lines. Archived conversations are read straight from their
+    archive file without being restored. Conversations are read through a
+    server-side cursor and messages a batch at a time, so memory does not
+    grow with the export. Uses its own session, as the response is still
+    being streamed after the request's session is closed.
+
+    Args:
+        compression: ``gz`` or ``zst`` to stream a compressed file, None
+            for plain JSON Lines
+    """
+    db = SessionLocal()
+    try:
+        query = select(ConversationModel).order_by(
+            ConversationModel.created_at, ConversationModel.id
+        ).execution_options(yield_per=batch_size)
+        if user_id is not None:
+            query = query.where(ConversationModel.user_id == user_id)
+        if conversation_id is not None:
+            query = query.where(ConversationModel.id == conversation_id)
+        if created_after is not None:
+            query = query.where(ConversationModel.created_at >= created_after)
+        if created_before is not None:
+            query = query.where(ConversationModel.created_at < created_before)
+
+        def lines() -> Iterator[bytes]:
+            for conversation in db.execute(query).scalars():
+                yield orjson.dumps(_conversation_record(conversation)) + b"\n"
+                if conversation.archive_key:
+                    archived = iter_archive_lines(conversation.archive_key)
+                    next(archived, None)
+                    for line in archived:
+                        yield line + b"\n"
+                else:
+                    for record in iter_message_records(db, conversation.id):
+                        yield _message_line(conversation.id, record)
+
+        chunks = _buffered(lines())
+        if compression is not None:
+            chunks = _compress(chunks, compression)
+        yield from chunks
+    finally:
+        db.close()
@@ -0,0 +1,431 @@
+
+"""Columnar chunk metadata store backing vector retrieval."""
+from typing import Dict, Iterable, List, Optional, Sequence
+import os
+import threading
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.crud.chunk import get_chunk_tag_ids
+from app.db.base import Chunk as ChunkModel
+from app.schemas.chunk import ChunkMetadata
+from app.services.vector_index import published_index_path
+
+SIDECAR_FILE = "chunk_store.npz"
+
+# Sentinel for missing page and offset values in the integer columns
+_MISSING = -1
+
+class _Columns:
+    """One consistent set of column arrays, replaced wholesale when grown."""
+
+    __slots__ = ("chunk_id", "document", "page", "char_start", "char_end", "alive", "tags")
+
+    def __init__(self, capacity: int, tag_words: int) -> None:
+        # Keep at least one row so masked lookups can always index row 0
+        capacity = max(capacity, 1)
+        self.chunk_id = np.zeros(capacity, dtype="S36")
+        self.document = np.full(capacity, _MISSING, dtype=np.int32)
+        self.page = np.full(capacity, _MISSING, dtype=np.int32)
+        self.char_start = np.full(capacity, _MISSING, dtype=np.int64)
+        self.char_end = np.full(capacity, _MISSING, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.tags = np.zeros((capacity, tag_words), dtype=np.uint64)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.alive)
+
+    def resized(self, capacity: int, tag_words: int) -> "_Columns":
+        """Copy the columns into larger arrays."""
+        grown = _Columns(capacity, tag_words)
+        size = self.capacity
+        for name in self.__slots__[:-1]:
+            getattr(grown, name)[:size] = getattr(self, name)
+        grown.tags[:size, :self.tags.shape[1]] = self.tags
+        return grown
+
+class _Snapshot:
+    """
+    Columns, the number of rows in use and the dictionaries decoding them.
+
+    Published together in one assignment, so a reader that takes the
+    snapshot once never pairs columns with a size or dictionary they do not
+    belong to. The document dictionary only ever grows, in place. The tag
+    dictionary is copied to grow, since a new tag can need wider columns.
+    """
+
+    __slots__ = ("columns", "size", "documents", "document_index", "tags", "tag_index")
+
+    def __init__(
+        self,
+        columns: _Columns,
+        size: int,
+        documents: List[str],
+        document_index: Dict[str, int],
+        tags: List[str],
+        tag_index: Dict[str, int]
+    ) -> None:
+        self.columns = columns
+        self.size = size
+        self.documents = documents
+        self.document_index = document_index
+        self.tags = tags
+        self.tag_index = tag_index
+
+    def with_columns(self, columns: _Columns, size: int) -> "_Snapshot":
+        """Copy the snapshot with other columns or size."""
+        return _Snapshot(columns, size, self.documents, self.document_index,
+                         self.tags, self.tag_index)
+
+class ChunkStore:
+    """
+    Map vector index rows to chunk metadata.
+
+    Rows are addressed directly by vector ID, so resolving a top-k result is
+    one fancy-indexing lookup per column. Document IDs and tag IDs are
+    dictionary-encoded, and the tag set of a row is a bitset over the tag
+    dictionary. Deleting or replacing a document only clears the ``alive``
+    flag of its rows and appends new ones, so the vector index itself never
+    needs rebuilding.
+
+    Readers never lock: they read the current snapshot once, and writers
+    publish a new one in a single assignment when the arrays grow or rows
+    are added. Writers serialize on a lock.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot(_Columns(0, 1), 0, [], {}, [], {})
+        # Published index version the store was loaded from, if any
+        self.version: Optional[str] = None
+
+    @property
+    def next_vector_id(self) -> int:
+        """One past the highest vector ID the store has seen."""
+        return self._snapshot.size
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return int(np.count_nonzero(snapshot.columns.alive[:snapshot.size]))
+
+    def replace(self, other: "ChunkStore") -> None:
+        """Serve the rows of another store from now on, e.g. a newly loaded one."""
+        with self._lock:
+            self._snapshot = other._snapshot
+            self.version = other.version
+
+    def add_chunks(
+        self, document_id: str, chunks: Sequence[Dict], tag_ids: Iterable[str] = ()
+    ) -> None:
+        """
+        Add rows for a document's chunks.
+
+        Args:
+            document_id: Document the chunks belong to
+            chunks: Chunk rows with ``id``, ``vector_id``, ``page``,
+                ``char_start`` and ``char_end``, as returned by
+                ``app.crud.chunk.create_chunks``
+            tag_ids: Tags of the document
+        """
+        if not chunks:
+            return
+        with self._lock:
+            document = self._intern_document(document_id)
+            bits = self._tag_bits(tag_ids)
+            vector_ids = np.fromiter((chunk["vector_id"] for chunk in chunks), dtype=np.int64)
+            self._ensure_capacity(int(vector_ids.max()) + 1, len(bits))
+
+            # Rows past the published size are invisible to readers until
+            # the new size is published below
+            snapshot = self._snapshot
+            columns = snapshot.columns
+            columns.chunk_id[vector_ids] = [chunk["id"].encode("ascii") for chunk in chunks]
+            columns.document[vector_ids] = document
+            columns.page[vector_ids] = [_value(chunk.get("page")) for chunk in chunks]
+            columns.char_start[vector_ids] = [_value(chunk.get("char_start")) for chunk in chunks]
+            columns.char_end[vector_ids] = [_value(chunk.get("char_end")) for chunk in chunks]
+            columns.tags[vector_ids] = 0
+            columns.tags[vector_ids, :len(bits)] = bits
+            columns.alive[vector_ids] = True
+            size = max(snapshot.size, int(vector_ids.max()) + 1)
+            if size != snapshot.size:
+                self._snapshot = snapshot.with_columns(columns, size)
+
+    def delete_document(self, document_id: str) -> np.ndarray:
+        """
+        Drop a document's rows from retrieval.
+
+        Returns:
+            Vector IDs of the rows that were removed
+        """
+        with self._lock:
+            rows = self._document_rows(document_id)
+            self._snapshot.columns.alive[rows] = False
+            return rows
+
+    def replace_document(
+        self, document_id: str, chunks: Sequence[Dict], tag_ids: Iterable[str] = ()
+    ) -> np.ndarray:
+        """
+        Swap a document's rows for a new set of chunks.
+
+        Returns:
+            Vector IDs of the rows that were removed
+        """
+        removed = self.delete_document(document_id)
+        self.add_chunks(document_id, chunks, tag_ids)
+        return removed
+
+    def reassign_document(self, document_id: str, new_document_id: str) -> None:
+        """Move a document's live rows to another document."""
+        with self._lock:
+            rows = self._document_rows(document_id)
+            self._snapshot.columns.document[rows] = self._intern_document(new_document_id)
+
+    def set_document_tags(self, document_id: str, tag_ids: Iterable[str]) -> None:
+        """Update the tag set of every live row of a document."""
+        with self._lock:
+            bits = self._tag_bits(tag_ids)
+            self._ensure_capacity(self._snapshot.size, len(bits))
+            rows = self._document_rows(document_id)
+            columns = self._snapshot.columns
+            columns.tags[rows] = 0
+            columns.tags[rows, :len(bits)] = bits
+
+    def alive_mask(self, vector_ids: Sequence[int]) -> np.ndarray:
+        """Get a boolean mask of the vector IDs that map to a live chunk."""
+        return _alive_mask(self._snapshot, np.asarray(vector_ids, dtype=np.int64))
+
+    def tag_mask(self, vector_ids: Sequence[int], tag_ids: Iterable[str]) -> np.ndarray:
+        """Get a boolean mask of the live vector IDs carrying any of ``tag_ids``."""
+        snapshot = self._snapshot
+        ids = np.asarray(vector_ids, dtype=np.int64)
+        mask = _alive_mask(snapshot, ids)
+        tag_index = snapshot.tag_index
+        wanted = [tag_index[tag_id] for tag_id in tag_ids if tag_id in tag_index]
+        if not wanted:
+            return np.zeros_like(mask)
+        query = _bits_for(wanted)
+        tags = snapshot.columns.tags[np.where(mask, ids, 0), :len(query)]
+        return mask & np.any(tags & query, axis=1)
+
+    def resolve(self, vector_ids: Sequence[int]) -> List[Optional[ChunkMetadata]]:
+        """
+        Resolve a top-k list of vector IDs to chunk metadata in one lookup.
+
+        Returns:
+            Metadata per vector ID, in input order, or None for rows that
+            are out of range or deleted
+        """
+        snapshot = self._snapshot
+        ids = np.asarray(vector_ids, dtype=np.int64)
+        columns = snapshot.columns
+        mask = _alive_mask(snapshot, ids)
+        rows = np.where(mask, ids, 0)
+
+        chunk_ids = columns.chunk_id[rows]
+        documents = columns.document[rows]
+        pages = columns.page[rows]
+        starts = columns.char_start[rows]
+        ends = columns.char_end[rows]
+        tag_bits = np.unpackbits(
+            np.ascontiguousarray(columns.tags[rows]).view(np.uint8), axis=1, bitorder="little"
+        )
+
+        result = []
+        for i, vector_id in enumerate(ids.tolist()):
+            if not mask[i]:
+                result.append(None)
+                continue
+            result.append(ChunkMetadata(
+                vector_id=vector_id,
+                chunk_id=chunk_ids[i].decode("ascii"),
+                document_id=snapshot.documents[documents[i]],
+                page=_optional(pages[i]),
+                char_start=_optional(starts[i]),
+                char_end=_optional(ends[i]),
+                tag_ids=[snapshot.tags[bit] for bit in np.flatnonzero(tag_bits[i])]
+            ))
+        return result
+
+    def save(self, path: str, version: Optional[str] = None) -> str:
+        """Write the store to disk atomically and return the file path."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            snapshot = self._snapshot
+            arrays = {
+                name: getattr(snapshot.columns, name)[:snapshot.size]
+                for name in _Columns.__slots__
+            }
+            arrays["documents"] = np.array(snapshot.documents, dtype="S36")
+            arrays["tag_names"] = np.array(snapshot.tags, dtype="S36")
+            if version is not None:
+                arrays["version"] = np.array(version)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkStore":
+        """Load a store written by ``save``."""
+        store = cls()
+        with np.load(path) as data:
+            size = len(data["alive"])
+            columns = _Columns(size, data["tags"].shape[1])
+            for name in _Columns.__slots__:
+                getattr(columns, name)[:size] = data[name]
+            documents = [name.decode("ascii") for name in data["documents"]]
+            tags = [name.decode("ascii") for name in data["tag_names"]]
+            if "version" in data:
+                store.version = str(data["version"])
+        store._snapshot = _Snapshot(
+            columns,
+            size,
+            documents,
+            {name: i for i, name in enumerate(documents)},
+            tags,
+            {name: i for i, name in enumerate(tags)}
+        )
+        return store
+
+    @classmethod
+    def build(
+        cls, db: Session, batch_size: int = 10000, next_vector_id: int = 0
+    ) -> "ChunkStore":
+        """
+        Rebuild the store from the chunks table.
+
+        Args:
+            db: Database session
+            batch_size: Chunks read per batch
+            next_vector_id: Lowest vector ID the store hands out next, even
+                if no chunk uses the IDs below it, e.g. ``next_vector_id``
+                of the index, so tombstoned vectors keep their IDs
+        """
+        store = cls()
+        query = db.query(
+            ChunkModel.id,
+            ChunkModel.document_id,
+            ChunkModel.vector_id,
+            ChunkModel.page,
+            ChunkModel.char_start,
+            ChunkModel.char_end
+        ).filter(
+            ChunkModel.vector_id.isnot(None)
+        ).order_by(
+            ChunkModel.document_id
+        ).yield_per(batch_size)
+
+        pending: Dict[str, List[Dict]] = {}
+        for row in query:
+            pending.setdefault(row.document_id, []).append(row._asdict())
+            if len(pending) >= batch_size:
+                store._add_documents(db, pending)
+                pending = {}
+        store._add_documents(db, pending)
+        if next_vector_id > store.next_vector_id:
+            with store._lock:
+                store._ensure_capacity(next_vector_id, 1)
+                store._snapshot = store._snapshot.with_columns(store._snapshot.columns, next_vector_id)
+        return store
+
+    def _add_documents(self, db: Session, chunks_by_document: Dict[str, List[Dict]]) -> None:
+        tags_by_document = get_chunk_tag_ids(db, chunks_by_document)
+        for document_id, chunks in chunks_by_document.items():
+            self.add_chunks(document_id, chunks, tags_by_document[document_id])
+
+    def _intern_document(self, document_id: str) -> int:
+        snapshot = self._snapshot
+        index = snapshot.document_index.get(document_id)
+        if index is None:
+            # Append before indexing, so a reader never sees a code that
+            # is not in the list yet
+            snapshot.documents.append(document_id)
+            index = snapshot.document_index[document_id] = len(snapshot.documents) - 1
+        return index
+
+    def _tag_bits(self, tag_ids: Iterable[str]) -> np.ndarray:
+        """
+        Build the bitset of a tag set, adding tags new to the dictionary.
+
+        New tags go into a copy of the dictionary, published together with
+        columns wide enough for them, so a reader never looks up a tag bit
+        past the columns it holds.
+        """
+        snapshot = self._snapshot
+        tags, tag_index = snapshot.tags, snapshot.tag_index
+        indexes = []
+        for tag_id in tag_ids:
+            index = tag_index.get(tag_id)
+            if index is None:
+                if tags is snapshot.tags:
+                    tags, tag_index = list(tags), dict(tag_index)
+                tags.append(tag_id)
+                index = tag_index[tag_id] = len(tags) - 1
+            indexes.append(index)
+        if tags is not snapshot.tags:
+            columns = snapshot.columns
+            tag_words = (len(tags) - 1) // 64 + 1
+            if tag_words > columns.tags.shape[1]:
+                columns = columns.resized(columns.capacity, tag_words)
+            self._snapshot = _Snapshot(columns, snapshot.size, snapshot.documents,
+                                       snapshot.document_index, tags, tag_index)
+        return _bits_for(indexes)
+
+    def _document_rows(self, document_id: str) -> np.ndarray:
+        snapshot = self._snapshot
+        document = snapshot.document_index.get(document_id)
+        if document is None:
+            return np.empty(0, dtype=np.int64)
+        columns, size = snapshot.columns, snapshot.size
+        return np.flatnonzero((columns.document[:size] == document) & columns.alive[:size])
+
+    def _ensure_capacity(self, size: int, tag_words: int) -> None:
+        snapshot = self._snapshot
+        columns = snapshot.columns
+        tag_words = max(tag_words, columns.tags.shape[1])
+        if size <= columns.capacity and tag_words == columns.tags.shape[1]:
+            return
+        capacity = max(size, columns.capacity)
+        if size > columns.capacity:
+            capacity = max(size, 2 * columns.capacity, 1024)
+        self._snapshot = snapshot.with_columns(columns.resized(capacity, tag_words), snapshot.size)
+
+def _alive_mask(snapshot: _Snapshot, ids: np.ndarray) -> np.ndarray:
+    in_range = (ids >= 0) & (ids < snapshot.size)
+    return in_range & snapshot.columns.alive[np.where(in_range, ids, 0)]
+
+def _bits_for(indexes: Sequence[int]) -> np.ndarray:
+    """Build a bitset, one uint64 word per 64 tags, with ``indexes`` set."""
+    words = np.zeros(max(indexes, default=0) // 64 + 1, dtype=np.uint64)
+    for index in indexes:
+        words[index // 64] |= np.uint64(1) << np.uint64(index % 64)
+    return words
+
+def _value(value: Optional[int]) -> int:
+    return _MISSING if value is None else value
+
+def _optional(value: np.integer) -> Optional[int]:
+    return None if value == _MISSING else int(value)
+
+_chunk_store: Optional[ChunkStore] = None
+_chunk_store_lock = threading.Lock()
+
+def get_chunk_store() -> ChunkStore:
+    """Get the process-wide chunk store, loading the published one on first use."""
+    global _chunk_store
+    if _chunk_store is None:
+        with _chunk_store_lock:
+            if _chunk_store is None:
+                path = published_index_path()
+                path = path and os.path.join(path, SIDECAR_FILE)
+                _chunk_store = (
+                    ChunkStore.load(path) if path and os.path.exists(path) else ChunkStore()
+                )
+    return _chunk_store
@@ -0,0 +1,64 @@
+
+"""Page-aware splitting of extracted text into chunks."""
+from typing import Iterable, Iterator
+
+from app.schemas.chunk import ChunkCreate
+from app.services.parsing import PageText
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+
+# Separator between pages in the document text that chunk offsets refer to
+PAGE_SEPARATOR = "\n"
+
+def chunk_pages(
+    pages: Iterable[PageText],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+) -> Iterator[ChunkCreate]:
+    """
+    Split pages of text into overlapping chunks, lazily and in order.
+
+    Chunks never cross a page boundary, so each one carries the page it
+    came from. Chunks end at whitespace where possible. ``char_start`` and
+    ``char_end`` are offsets in the document text, i.e. the page texts
+    joined with ``PAGE_SEPARATOR``.
+
+    Args:
+        pages: Page texts in page order, e.g. from ``iter_pages``
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared by consecutive chunks of a page
+    """
+    if chunk_overlap >= chunk_size:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+
+    offset = 0
+    for page in pages:
+        text = page.text
+        start = 0
+        while start < len(text):
+            end = min(start + chunk_size, len(text))
+            if end < len(text):
+                # Prefer to break at whitespace in the second half of the chunk
+                half = start + chunk_size // 2
+                split = max(text.rfind(" ", half, end), text.rfind("\n", half, end))
+                if split > start:
+                    end = split
+
+            chunk_start, chunk_end = start, end
+            while chunk_start < chunk_end and text[chunk_start].isspace():
+                chunk_start += 1
+            while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            if chunk_start < chunk_end:
+                yield ChunkCreate(
+                    content=text[chunk_start:chunk_end],
+                    page=page.page,
+                    char_start=offset + chunk_start,
+                    char_end=offset + chunk_end
+                )
+
+            if end >= len(text):
+                break
+            start = max(end - chunk_overlap, start + 1)
+        offset += len(text) + len(PAGE_SEPARATOR)
@@ -0,0 +1,40 @@
+
+"""Single-flight coalescing of identical in-flight calls."""
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Share one in-flight call between concurrent callers using the same key.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it is still running await the same task. The key is released as
+    soon as the task finishes, so later callers always start a fresh call.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, "asyncio.Task"] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn`` for ``key`` unless an identical call is already in flight."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+
+        # Shield the shared task so one caller disconnecting does not cancel
+        # the work the other callers are waiting on.
+        return await asyncio.shield(task)
+
+    def _release(self, key: Hashable, task: "asyncio.Task") -> None:
+        """Forget a finished call and mark its exception as retrieved."""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,84 @@
+
+"""Document lifecycle across the database, index and blob storage."""
+from typing import Optional
+import logging
+
+from sqlalchemy.orm import Session
+
+from app.crud.blob import release_blob
+from app.crud.chunk import delete_document_chunks, reassign_document_chunks
+from app.crud.document import get_blob_documents, is_document_cited
+from app.db.base import (
+    Document as DocumentModel,
+    UploadSession as UploadSessionModel
+)
+from app.services.chunk_store import ChunkStore, get_chunk_store
+from app.services.indexing import refresh_document_tags
+from app.services.storage import StorageError, get_storage
+from app.services.vector_index import SegmentedIndex, get_vector_index
+
+logger = logging.getLogger(__name__)
+
+def delete_document(
+    db: Session,
+    document: DocumentModel,
+    index: Optional[SegmentedIndex] = None,
+    store: Optional[ChunkStore] = None
+) -> None:
+    """
+    Delete a document, purging its content with the last reference to it.
+
+    While other documents share the blob, only this document's title, tags
+    and ownership go away: the stored file, chunks and vectors stay, and if
+    they were indexed through this document they move to the oldest
+    remaining one. A document still cited by conversation history keeps a
+    row marked ``deleted`` so those citations resolve.
+
+    Args:
+        db: Database session
+        document: Document to delete
+        index: Vector index, defaults to the process-wide one
+        store: Chunk store, defaults to the process-wide one
+    """
+    index = get_vector_index() if index is None else index
+    store = get_chunk_store() if store is None else store
+    document_id = document.id
+    blob = document.blob
+
+    purge_path = document.storage_path
+    indexed_by = None
+    if blob is not None:
+        remaining = get_blob_documents(db, blob.id, exclude=document_id)
+        document.blob = None
+        if release_blob(db, blob) > 0:
+            purge_path = None
+            indexed_by = blob.document_id
+            if blob.document_id == document_id:
+                indexed_by = blob.document_id = remaining[0].id
+                reassign_document_chunks(db, document_id, indexed_by)
+        else:
+            purge_path = blob.storage_path
+
+    removed = delete_document_chunks(db, document_id) if indexed_by is None else []
+    document.tags = []
+    if is_document_cited(db, document_id):
+        document.status = "deleted"
+        document.storage_path = None
+    else:
+        db.query(UploadSessionModel).filter(
+            UploadSessionModel.document_id == document_id
+        ).update({UploadSessionModel.document_id: None}, synchronize_session=False)
+        db.delete(document)
+    db.commit()
+
+    if indexed_by is None:
+        store.delete_document(document_id)
+        index.delete(removed)
+        if purge_path:
+            try:
+                get_storage().delete(purge_path)
+            except StorageError:
+                logger.exception("Could not delete stored file %s", purge_path)
+    else:
+        store.reassign_document(document_id, indexed_by)
+        refresh_document_tags(db, indexed_by, store=store)
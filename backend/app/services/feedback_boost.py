@@ -0,0 +1,207 @@
+
+"""Retrieval score boosts learned offline from answer feedback.
+
+``scripts/compute_feedback_boosts.py`` turns every rated answer into credit
+for the chunks it cited and writes one additive boost per vector ID next
+to the index. Searches add the boost of each row to its similarity before
+ranking, so chunks that keep appearing in well rated answers rise and
+chunks behind poorly rated ones sink.
+"""
+from typing import Any, Dict, NamedTuple, Optional
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.base import (
+    Chunk as ChunkModel,
+    Feedback as FeedbackModel,
+    Source as SourceModel
+)
+
+BOOST_FILE = "feedback_boost.npy"
+BOOST_INFO_FILE = "feedback_boost.json"
+
+class FeedbackSignals(NamedTuple):
+    """One row per source of a rated answer, as parallel arrays."""
+    message: np.ndarray  # dense index of the rated message
+    vector_id: np.ndarray  # vector ID of the cited chunk
+    score: np.ndarray  # retrieval score of the source
+    rating: np.ndarray  # +1 for positive feedback, -1 for negative
+
+def load_feedback_signals(db: Session) -> FeedbackSignals:
+    """
+    Load the sources of every rated answer whose chunk is still indexed.
+
+    Rows are ordered by message and source ID, so sums over them, and the
+    boosts computed from them, are the same on every run over the same data.
+    """
+    rows = db.query(
+        SourceModel.message_id,
+        ChunkModel.vector_id,
+        SourceModel.score,
+        FeedbackModel.feedback_type
+    ).join(
+        FeedbackModel, FeedbackModel.message_id == SourceModel.message_id
+    ).join(
+        ChunkModel, ChunkModel.id == SourceModel.chunk_id
+    ).filter(
+        ChunkModel.vector_id.isnot(None)
+    ).order_by(
+        SourceModel.message_id, SourceModel.id
+    ).all()
+    if not rows:
+        empty = np.empty(0, np.int64)
+        return FeedbackSignals(empty, empty, np.empty(0, np.float64), empty)
+    message_ids, vector_ids, scores, feedback_types = zip(*rows)
+    _, message = np.unique(np.array(message_ids, dtype=object), return_inverse=True)
+    return FeedbackSignals(
+        message=message.astype(np.int64),
+        vector_id=np.array(vector_ids, dtype=np.int64),
+        score=np.array([np.nan if score is None else score for score in scores], dtype=np.float64),
+        rating=np.where(np.array(feedback_types) == "positive", 1, -1).astype(np.int64)
+    )
+
+def load_chunk_documents(db: Session) -> np.ndarray:
+    """Get the dense document index of every indexed vector ID, -1 for unused IDs."""
+    rows = db.query(ChunkModel.vector_id, ChunkModel.document_id).filter(
+        ChunkModel.vector_id.isnot(None)
+    ).order_by(ChunkModel.vector_id).all()
+    if not rows:
+        return np.empty(0, np.int64)
+    vector_ids, document_ids = zip(*rows)
+    vector_ids = np.array(vector_ids, dtype=np.int64)
+    _, documents = np.unique(np.array(document_ids, dtype=object), return_inverse=True)
+    result = np.full(int(vector_ids.max()) + 1, -1, dtype=np.int64)
+    result[vector_ids] = documents
+    return result
+
+def compute_boosts(
+    signals: FeedbackSignals,
+    chunk_documents: np.ndarray,
+    strength: float = 0.05,
+    prior: float = 5.0,
+    document_weight: float = 0.5
+) -> np.ndarray:
+    """
+    Compute one additive boost per vector ID.
+
+    Each rated answer hands out one unit of credit, positive or negative,
+    split over its sources in proportion to their retrieval scores. Credit
+    is summed per chunk and per document, and each sum turned into a net
+    rating ``(positive - negative) / (positive + negative + prior)``, so a
+    handful of ratings moves a chunk only a little. The boost of a chunk
+    is its own net rating plus ``document_weight`` times its document's,
+    clipped to [-1, 1] and scaled by ``strength``.
+
+    Args:
+        signals: Sources of rated answers, see ``load_feedback_signals``
+        chunk_documents: Document index by vector ID, see ``load_chunk_documents``
+        strength: Largest boost, in units of similarity score
+        prior: Pseudo-count of neutral ratings every chunk starts with
+        document_weight: Share of the document's rating added to its chunks
+
+    Returns:
+        float32 array of boosts indexed by vector ID
+    """
+    size = len(chunk_documents)
+    if not len(signals.vector_id) or not size:
+        return np.zeros(size, np.float32)
+    in_index = signals.vector_id < size
+    message = signals.message[in_index]
+    vector_id = signals.vector_id[in_index]
+    rating = signals.rating[in_index]
+
+    # Sources without a usable score count as a perfect match
+    score = signals.score[in_index]
+    score = np.where(np.isfinite(score) & (score > 0), score, 1.0)
+    share = score / np.bincount(message, weights=score)[message]
+    positive_credit = np.where(rating > 0, share, 0.0)
+    negative_credit = np.where(rating < 0, share, 0.0)
+
+    def net(groups: np.ndarray, keep: np.ndarray, length: int) -> np.ndarray:
+        positive = np.bincount(groups[keep], weights=positive_credit[keep], minlength=length)
+        negative = np.bincount(groups[keep], weights=negative_credit[keep], minlength=length)
+        return (positive - negative) / (positive + negative + prior)
+
+    chunk_net = net(vector_id, np.ones(len(vector_id), bool), size)
+    documents = chunk_documents[vector_id]
+    document_net = net(documents, documents >= 0, int(chunk_documents.max()) + 1)
+    chunk_document_net = np.where(
+        chunk_documents >= 0, document_net[np.maximum(chunk_documents, 0)], 0.0
+    )
+    boosts = strength * np.clip(chunk_net + document_weight * chunk_document_net, -1.0, 1.0)
+    return boosts.astype(np.float32)
+
+def save_boosts(
+    boosts: np.ndarray, info: Dict[str, Any], path: Optional[str] = None
+) -> str:
+    """
+    Write a boost array, and a JSON description of how it was computed, atomically.
+
+    Returns:
+        Path of the array file
+    """
+    path = path or os.path.join(settings.INDEX_PATH, BOOST_FILE)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    info_path = os.path.join(os.path.dirname(path), BOOST_INFO_FILE)
+    tmp_info = f"{info_path}.{os.getpid()}.tmp"
+    with open(tmp_info, "w") as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp_info, info_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(boosts, dtype=np.float32))
+    os.replace(tmp_path, path)
+    return path
+
+class BoostCache:
+    """
+    Boost array shared by the searches of a process.
+
+    The file is written by an offline job, so the cache looks at its
+    modification time at most every ``check_interval`` seconds and loads
+    a new array when it changed. The array is memory-mapped: workers of
+    one host share its pages.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: float = 60.0) -> None:
+        self.path = path or os.path.join(settings.INDEX_PATH, BOOST_FILE)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._boosts: Optional[np.ndarray] = None
+        self._mtime: Optional[int] = None
+        self._checked_at = float("-inf")
+
+    def get(self) -> Optional[np.ndarray]:
+        """Get the current boosts, or None when no boost file has been written."""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._refresh()
+        return self._boosts
+
+    def _refresh(self) -> None:
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._boosts, self._mtime = None, None
+            return
+        if mtime != self._mtime:
+            # Replaced by rename, so a mapping of the old file stays intact
+            self._boosts = np.load(self.path, mmap_mode="r")
+            self._mtime = mtime
+
+_boost_cache: Optional[BoostCache] = None
+
+def get_feedback_boosts() -> Optional[np.ndarray]:
+    """Get the process-wide feedback boosts for ``SegmentedIndex.search``."""
+    global _boost_cache
+    if _boost_cache is None:
+        _boost_cache = BoostCache(check_interval=settings.FEEDBACK_BOOST_CHECK_INTERVAL)
+    return _boost_cache.get()
@@ -0,0 +1,314 @@
+
+"""Incremental document (re-)indexing."""
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sized
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.chunk import (
+    create_chunks,
+    delete_document_chunks,
+    discard_new_chunks,
+    get_chunk_tag_ids
+)
+from app.crud.document import (
+    create_status_update,
+    get_indexed_document_id,
+    update_status_progress
+)
+from app.db.base import DocumentStatus as DocumentStatusModel
+from app.schemas.chunk import ChunkCreate
+from app.services.chunk_store import SIDECAR_FILE, ChunkStore, get_chunk_store
+from app.services.feedback_boost import get_feedback_boosts
+from app.services.vector_index import (
+    SegmentedIndex,
+    current_index_version,
+    get_vector_index,
+    index_version_path,
+    set_current_index_version
+)
+
+logger = logging.getLogger(__name__)
+
+# Embeds a batch of texts into a (len(texts), dimensions) array
+EmbedFn = Callable[[List[str]], np.ndarray]
+
+# Share of the reported progress spent embedding; the rest is the swap
+EMBEDDING_PROGRESS = 0.9
+
+# Chunk row fields the chunk store keeps
+STORE_KEYS = ("id", "vector_id", "page", "char_start", "char_end")
+
+def _batches(chunks: Iterable[ChunkCreate], size: int) -> Iterator[List[ChunkCreate]]:
+    iterator = iter(chunks)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def reindex_document(
+    db: Session,
+    document_id: str,
+    chunks: Iterable[ChunkCreate],
+    embed: EmbedFn,
+    index: Optional[SegmentedIndex] = None,
+    store: Optional[ChunkStore] = None,
+    batch_size: int = 64,
+    status: str = "reindexing",
+    total: Optional[int] = None
+) -> DocumentStatusModel:
+    """
+    Replace a document's chunks in the index without a rebuild.
+
+    Chunks are taken ``batch_size`` at a time, so an iterator such as
+    ``chunk_pages`` is never held whole: each batch is embedded, its rows
+    committed and its vectors appended to the index's mutable segment.
+    The new rows only become retrievable once the chunk store maps them
+    at the end, when the old vector IDs are tombstoned, so the document is
+    never missing from results. Progress is reported on a status update,
+    ``reindexing`` unless another ``status`` is given, when the number of
+    chunks is known.
+
+    A document sharing its blob with others re-indexes the one set of
+    chunks they all use.
+
+    Args:
+        db: Database session
+        document_id: Document to re-index
+        chunks: New chunks of the document
+        embed: Embedding function for chunk texts
+        index: Vector index, defaults to the process-wide one
+        store: Chunk store, defaults to the process-wide one
+        batch_size: Chunks embedded per call
+        status: State recorded while the run is in progress
+        total: Number of chunks, for progress; ``len(chunks)`` if it has one
+
+    Returns:
+        The status update tracking this run
+    """
+    index = get_vector_index() if index is None else index
+    store = get_chunk_store() if store is None else store
+    document_id = get_indexed_document_id(db, document_id)
+    db_status = create_status_update(db, document_id, status)
+    if total is None and isinstance(chunks, Sized):
+        total = len(chunks)
+
+    rows: List[Dict] = []
+    first_vector_id = None
+    try:
+        # Vectors tombstoned in the index must not get their IDs back
+        next_vector_id = max(store.next_vector_id, index.next_vector_id)
+        for batch in _batches(chunks, batch_size):
+            vectors = np.asarray(embed([chunk.content for chunk in batch]), dtype=np.float32)
+            batch_rows = create_chunks(db, document_id, batch, min_vector_id=next_vector_id)
+            db.commit()
+            if first_vector_id is None:
+                first_vector_id = batch_rows[0]["vector_id"]
+            next_vector_id = batch_rows[-1]["vector_id"] + 1
+            index.add([row["vector_id"] for row in batch_rows], vectors)
+            # The store needs no text, so it is not kept past the batch
+            rows.extend({key: row[key] for key in STORE_KEYS} for row in batch_rows)
+            if total:
+                update_status_progress(db, db_status, EMBEDDING_PROGRESS * min(len(rows) / total, 1.0))
+
+        removed = delete_document_chunks(db, document_id, before_vector_id=first_vector_id)
+        tag_ids = get_chunk_tag_ids(db, [document_id])[document_id]
+        db.commit()
+
+        store.replace_document(document_id, rows, tag_ids)
+        index.delete(removed)
+    except Exception as e:
+        db.rollback()
+        logger.exception("Re-indexing document %s failed", document_id)
+        if first_vector_id is not None:
+            # The old chunks keep serving; drop the ones this run added
+            index.delete(discard_new_chunks(db, document_id, first_vector_id))
+            db.commit()
+        update_status_progress(db, db_status, db_status.progress, status="failed", error=str(e))
+        raise
+
+    return update_status_progress(db, db_status, 1.0, status="processed")
+
+def remove_document_from_index(
+    db: Session,
+    document_id: str,
+    index: Optional[SegmentedIndex] = None,
+    store: Optional[ChunkStore] = None
+) -> List[int]:
+    """
+    Drop a document from retrieval by tombstoning its vectors.
+
+    Returns:
+        Vector IDs that were tombstoned
+    """
+    index = get_vector_index() if index is None else index
+    store = get_chunk_store() if store is None else store
+    removed = delete_document_chunks(db, document_id)
+    db.commit()
+    store.delete_document(document_id)
+    index.delete(removed)
+    return removed
+
+def refresh_document_tags(
+    db: Session, document_id: str, store: Optional[ChunkStore] = None
+) -> None:
+    """Apply a document's current tags to its indexed chunks."""
+    store = get_chunk_store() if store is None else store
+    document_id = get_indexed_document_id(db, document_id)
+    tag_ids = get_chunk_tag_ids(db, [document_id])[document_id]
+    store.set_document_tags(document_id, tag_ids)
+
+def load_index() -> None:
+    """
+    Load the published vector index and chunk store now.
+
+    Called in the serving master before workers are forked, so they share
+    the loaded arrays copy-on-write instead of each loading its own copy.
+    """
+    get_vector_index()
+    get_chunk_store()
+    get_feedback_boosts()
+
+def sync_index_with_database(
+    db: Session,
+    index: Optional[SegmentedIndex] = None,
+    store: Optional[ChunkStore] = None
+) -> int:
+    """
+    Bring an index up to date with chunk changes made by other processes.
+
+    Serving workers delete documents and change tags in the database and
+    in their own copies only. The chunk store is rebuilt from the chunks
+    table and the vectors of chunks that are gone are tombstoned, so the
+    next published version carries those changes.
+
+    Returns:
+        Number of vectors tombstoned
+    """
+    index = get_vector_index() if index is None else index
+    store = get_chunk_store() if store is None else store
+    store.replace(ChunkStore.build(db, next_vector_id=index.next_vector_id))
+    vector_ids = index.vector_ids()
+    stale = vector_ids[~store.alive_mask(vector_ids)]
+    index.delete(stale)
+    return len(stale)
+
+def publish_index(
+    index: Optional[SegmentedIndex] = None,
+    store: Optional[ChunkStore] = None,
+    root: Optional[str] = None,
+    keep: Optional[int] = None
+) -> str:
+    """
+    Write the vector index and chunk store as a new version under ``INDEX_PATH``.
+
+    The version is written to a directory of its own and the ``CURRENT``
+    pointer swapped to it by rename once it is complete, so readers never
+    see a partial version or one mixed from several writers. Serving
+    workers pick it up through ``IndexReloader``. Only the ingestion job
+    publishes.
+
+    Args:
+        index: Vector index, defaults to the process-wide one
+        store: Chunk store, defaults to the process-wide one
+        root: Index directory, ``INDEX_PATH`` by default
+        keep: Versions kept, ``INDEX_KEEP_VERSIONS`` by default; older ones
+            are deleted
+
+    Returns:
+        The new version
+    """
+    index = get_vector_index() if index is None else index
+    store = get_chunk_store() if store is None else store
+    root = root or settings.INDEX_PATH
+    keep = settings.INDEX_KEEP_VERSIONS if keep is None else keep
+
+    # Names sort by publication time
+    version = f"{time.time_ns():020d}-{os.getpid()}"
+    path = index_version_path(version, root)
+    tmp_path = f"{path}.tmp"
+    index.save(tmp_path, version=version)
+    store.save(os.path.join(tmp_path, SIDECAR_FILE), version=version)
+    os.rename(tmp_path, path)
+    set_current_index_version(version, root)
+    index.version = store.version = version
+
+    versions_dir = os.path.dirname(path)
+    published = sorted(name for name in os.listdir(versions_dir) if not name.endswith(".tmp"))
+    for name in published[:-max(keep, 1)]:
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+    logger.info("Published index version %s", version)
+    return version
+
+class IndexReloader:
+    """
+    Background thread that swaps newly published index versions in.
+
+    Serving workers never write the index. They check the ``CURRENT``
+    pointer every ``interval`` seconds and, when it names a version they
+    do not serve, load it and replace the process-wide index and chunk
+    store in place.
+    """
+
+    def __init__(
+        self,
+        index: Optional[SegmentedIndex] = None,
+        store: Optional[ChunkStore] = None,
+        interval: float = 30.0,
+        root: Optional[str] = None
+    ) -> None:
+        self.index = get_vector_index() if index is None else index
+        self.store = get_chunk_store() if store is None else store
+        self.interval = interval
+        self.root = root
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def reload_once(self) -> bool:
+        """
+        Load the current version if it is not the one being served.
+
+        Returns:
+            True if a new version was loaded
+        """
+        version = current_index_version(self.root)
+        if version is None or version == self.index.version == self.store.version:
+            return False
+        path = index_version_path(version, self.root)
+        index = SegmentedIndex.load(path)
+        store = ChunkStore.load(os.path.join(path, SIDECAR_FILE))
+        self.index.replace(index)
+        self.store.replace(store)
+        logger.info("Loaded index version %s", version)
+        return True
+
+    def start(self) -> None:
+        """Start checking in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload_once()
+            except Exception:
+                # E.g. the version was pruned while loading; the next check retries
+                logger.exception("Reloading the index failed")
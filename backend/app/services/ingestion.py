@@ -0,0 +1,137 @@
+
+"""Ingestion of uploaded documents: parse, chunk, embed and index."""
+from contextlib import ExitStack, contextmanager
+from typing import Iterator, List, Optional, Tuple
+import logging
+import os
+import tempfile
+
+from sqlalchemy.orm import Session
+
+from app.crud.document import create_status_update, get_document_by_id
+from app.db.base import (
+    Blob as BlobModel,
+    ChunkingSettings as ChunkingSettingsModel,
+    Document as DocumentModel,
+    DocumentStatus as DocumentStatusModel
+)
+from app.services.chunk_store import ChunkStore
+from app.services.chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, chunk_pages
+from app.services.indexing import EmbedFn, reindex_document
+from app.services.parsing import iter_pages
+from app.services.providers import get_embedding_provider
+from app.services.storage import LocalStorageBackend, get_storage
+from app.services.vector_index import SegmentedIndex
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def local_file(key: str) -> Iterator[str]:
+    """
+    Get a local path for a stored object.
+
+    Parse workers need a file they can open themselves, so objects in
+    remote storage are downloaded to a temporary file first.
+    """
+    storage = get_storage()
+    if isinstance(storage, LocalStorageBackend):
+        yield storage.path(key)
+        return
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(key)[1]) as f:
+        for data in storage.iter_object(key):
+            f.write(data)
+        f.flush()
+        yield f.name
+
+def get_chunking_params(db: Session) -> Tuple[int, int]:
+    """Get the active chunk size and overlap."""
+    chunking = db.query(ChunkingSettingsModel).filter(
+        ChunkingSettingsModel.is_active == True
+    ).order_by(ChunkingSettingsModel.updated_at.desc()).first()
+    if chunking is None:
+        return DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+    return chunking.chunk_size, chunking.chunk_overlap
+
+def ingest_document(
+    db: Session,
+    document_id: str,
+    embed: EmbedFn,
+    index: Optional[SegmentedIndex] = None,
+    store: Optional[ChunkStore] = None
+) -> DocumentStatusModel:
+    """
+    Parse, chunk and index a document's stored file.
+
+    Pages are extracted in parallel and streamed through the chunker into
+    the index in batches, in order, so every chunk records the page it
+    came from and neither the text nor the chunks of a large document are
+    held whole.
+
+    Raises:
+        ParseError: If the file cannot be parsed; the document is marked failed
+    """
+    document = get_document_by_id(db, document_id)
+    if document is None or not document.storage_path:
+        raise ValueError(f"Document {document_id} has no stored file")
+
+    chunk_size, chunk_overlap = get_chunking_params(db)
+    with ExitStack() as stack:
+        try:
+            path = stack.enter_context(local_file(document.storage_path))
+        except OSError as e:
+            logger.warning("Fetching document %s failed: %s", document_id, e)
+            create_status_update(db, document_id, "failed", error=str(e))
+            raise
+        # Parse errors surface while the chunks are consumed, and mark
+        # the run failed there
+        chunks = chunk_pages(
+            iter_pages(path, document.mime_type),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        return reindex_document(
+            db, document_id, chunks, embed, index=index, store=store, status="processing"
+        )
+
+def get_queued_document_ids(db: Session, limit: int = 10) -> List[str]:
+    """
+    Get documents waiting for ingestion, oldest first.
+
+    Documents sharing a blob are ingested once, through the document that
+    indexes the blob.
+    """
+    rows = db.query(DocumentModel.id).outerjoin(
+        BlobModel, BlobModel.id == DocumentModel.blob_id
+    ).filter(
+        DocumentModel.status == "queued",
+        (BlobModel.id.is_(None)) | (BlobModel.document_id == DocumentModel.id)
+    ).order_by(DocumentModel.created_at).limit(limit)
+    return [document_id for (document_id,) in rows]
+
+def ingest_queued_documents(
+    db: Session, embed: Optional[EmbedFn] = None, limit: int = 10
+) -> int:
+    """
+    Ingest up to ``limit`` queued documents.
+
+    A document that fails is marked failed and does not stop the others.
+
+    Args:
+        db: Database session
+        embed: Embedding function; the active embedding provider by default
+        limit: Maximum number of documents
+
+    Returns:
+        Number of documents ingested
+    """
+    document_ids = get_queued_document_ids(db, limit)
+    if document_ids and embed is None:
+        embed = get_embedding_provider(db).embed
+    ingested = 0
+    for document_id in document_ids:
+        try:
+            ingest_document(db, document_id, embed)
+            ingested += 1
+        except Exception:
+            logger.exception("Ingesting document %s failed", document_id)
+    return ingested
@@ -0,0 +1,555 @@
+
+"""Full-text search over the messages of a user's conversations.
+
+The index used depends on the database:
+
+- SQLite: the FTS5 table ``message_search``, filled by triggers on
+  ``messages``. It also indexes the owner of each message as a token, so
+  matching intersects the query words with the caller's postings instead
+  of walking every match in the table. The table holds only the index;
+  the text is read from ``messages`` through the ``message_search_source``
+  view.
+- Postgres: the stored ``messages.search_vector`` tsvector column and its
+  GIN index, ranked by ``ts_rank_cd``.
+- Any other database, one created before the search structures existed,
+  or ``MESSAGE_SEARCH_BACKEND=memory``: an in-process positional inverted
+  index per user, built on the user's first search and caught up with new
+  messages on later ones.
+
+SQLite and in-process matches are ranked here by BM25, with statistics
+over the caller's own messages. FTS5's ``bm25()`` is not used: it counts
+the matches of every query word across the whole table, which takes
+longer than the rest of a search once the table holds a million
+messages. Only the ``MESSAGE_SEARCH_MAX_CANDIDATES`` most recent matches
+are ranked, so a search costs the same however many messages match.
+Words are compared case- and accent-insensitively but not stemmed,
+except on Postgres.
+
+Messages of archived conversations are not searched until the
+conversation is restored.
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+
+from sqlalchemy import DateTime, bindparam, func, select, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.base import (
+    Conversation as ConversationModel,
+    Message as MessageModel
+)
+
+logger = logging.getLogger(__name__)
+
+# Marks matching words in snippets; control characters, so message text
+# cannot pass for a highlight
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+# Words of message text shown around the matches
+SNIPPET_WORDS = 24
+ELLIPSIS = "…"
+
+# Text search configuration of the Postgres search_vector column
+POSTGRES_CONFIG = "english"
+
+# BM25 parameters, the usual defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Letters and digits, like the FTS5 unicode61 tokenizer
+_WORD = re.compile(r"[^\W_]+")
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+_HIGHLIGHT = re.compile(f"([{HIGHLIGHT_START}{HIGHLIGHT_END}])")
+
+def _fold(text: str) -> str:
+    text = text.lower()
+    if text.isascii():
+        return text
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into lowercase words without accents, as the search indexes do."""
+    return _WORD.findall(_fold(text))
+
+def parse_query(query: str) -> List[Tuple[str, ...]]:
+    """
+    Split a search query into words and quoted phrases.
+
+    Every part has to match. Punctuation is dropped, so the query can
+    never be read as operators of a database's own query syntax.
+
+    Returns:
+        One tuple of words per part, a single word unless it is a phrase
+    """
+    parts = []
+    for phrase, term in _QUERY_PART.findall(query):
+        words = tuple(tokenize(phrase or term))
+        if phrase:
+            parts.append(words)
+        else:
+            parts.extend((word,) for word in words)
+    return list(dict.fromkeys(part for part in parts if part))
+
+def bm25(
+    frequencies: Sequence[int],
+    document_frequencies: Sequence[int],
+    count: int,
+    length: int,
+    average_length: float
+) -> float:
+    """
+    BM25 score of a message.
+
+    Args:
+        frequencies: Occurrences of each query part in the message
+        document_frequencies: Messages containing each query part
+        count: Messages searched
+        length: Words in the message
+        average_length: Average words per message
+    """
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1.0))
+    return sum(
+        math.log(1 + (count - df + 0.5) / (df + 0.5)) * tf * (BM25_K1 + 1) / (tf + norm)
+        for tf, df in zip(frequencies, document_frequencies)
+    )
+
+def _frequency(words: List[str], part: Tuple[str, ...]) -> int:
+    if len(part) == 1:
+        return words.count(part[0])
+    size = len(part)
+    return sum(
+        1 for i in range(len(words) - size + 1)
+        if words[i] == part[0] and tuple(words[i:i + size]) == part
+    )
+
+def _rank(
+    documents: Iterable[Tuple[int, str]],
+    parts: List[Tuple[str, ...]],
+    document_frequencies: Sequence[int],
+    count: int,
+    limit: int
+) -> List[Tuple[int, float]]:
+    """Score matching ``(key, content)`` pairs by BM25, returning the best keys first."""
+    scored = []
+    for key, content in documents:
+        words = tokenize(content)
+        scored.append((key, len(words), [_frequency(words, part) for part in parts]))
+    # The matches stand in for all of the messages' lengths
+    average_length = sum(length for _, length, _ in scored) / len(scored)
+    best = heapq.nlargest(limit, (
+        (bm25(frequencies, document_frequencies, count, length, average_length), key)
+        for key, length, frequencies in scored
+    ))
+    return [(key, score) for score, key in best]
+
+def split_highlights(marked: str) -> Tuple[str, List[Tuple[int, int]]]:
+    """Strip highlight markers from a snippet, returning it and the offsets they marked."""
+    pieces, highlights = [], []
+    length, start = 0, None
+    for piece in _HIGHLIGHT.split(marked):
+        if piece == HIGHLIGHT_START:
+            start = length
+        elif piece == HIGHLIGHT_END:
+            if start is not None and length > start:
+                highlights.append((start, length))
+            start = None
+        else:
+            pieces.append(piece)
+            length += len(piece)
+    return "".join(pieces), highlights
+
+def make_snippet(content: str, parts: List[Tuple[str, ...]], size: int = SNIPPET_WORDS) -> str:
+    """
+    Cut the window of ``size`` words with the most matches out of a text.
+
+    Returns:
+        The window with the words of the query parts between highlight
+        markers
+    """
+    tokens = list(_WORD.finditer(content))
+    if not tokens:
+        return content[:200]
+    wanted = {word for part in parts for word in part}
+    hits = [i for i, token in enumerate(tokens) if _fold(token.group()) in wanted]
+    first = 0
+    if hits:
+        # Leave a little context before the first match of the window
+        lead = size // 4
+        first = max(
+            (max(0, hit - lead) for hit in hits),
+            key=lambda start: bisect_left(hits, start + size) - bisect_left(hits, start)
+        )
+    last = min(len(tokens), first + size)
+    begin = 0 if first == 0 else tokens[first].start()
+    end = len(content) if last == len(tokens) else tokens[last - 1].end()
+
+    pieces, position = [], begin
+    for hit in hits:
+        if first <= hit < last:
+            token = tokens[hit]
+            pieces.append(content[position:token.start()])
+            pieces.append(HIGHLIGHT_START + token.group() + HIGHLIGHT_END)
+            position = token.end()
+    pieces.append(content[position:end])
+    return (ELLIPSIS if begin else "") + "".join(pieces) + (ELLIPSIS if end < len(content) else "")
+
+def _result(row: Any, score: float, marked_snippet: str) -> Dict[str, Any]:
+    snippet, highlights = split_highlights(marked_snippet)
+    return {
+        "message_id": row.id,
+        "conversation_id": row.conversation_id,
+        "conversation_title": row.title,
+        "role": row.role,
+        "created_at": row.created_at,
+        "score": score,
+        "snippet": snippet,
+        "highlights": highlights
+    }
+
+def _owner_token(user_id: str) -> str:
+    # Matches what the insert trigger indexes: the ID without hyphens
+    return user_id.replace("-", "").replace('"', '""')
+
+_SQLITE_COUNT = text("SELECT count(*) FROM message_search WHERE message_search MATCH :match")
+
+_SQLITE_CANDIDATES = text("""
+    SELECT rowid, content FROM message_search
+    WHERE message_search MATCH :match
+    ORDER BY rowid DESC
+    LIMIT :limit
+""")
+
+_SQLITE_MESSAGES = text("""
+    SELECT m.rowid, m.id, m.conversation_id, c.title, m.role, m.created_at
+    FROM messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE m.rowid IN :rowids AND c.user_id = :user_id
+""").bindparams(bindparam("rowids", expanding=True)).columns(created_at=DateTime)
+
+def _search_sqlite(
+    db: Session, user_id: str, parts: List[Tuple[str, ...]], limit: int
+) -> List[Dict[str, Any]]:
+    owner = f'owner : "{_owner_token(user_id)}"'
+    phrases = ['"' + " ".join(part) + '"' for part in parts]
+    candidates = db.execute(_SQLITE_CANDIDATES, {
+        "match": f"{owner} AND content : ({' AND '.join(phrases)})",
+        "limit": settings.MESSAGE_SEARCH_MAX_CANDIDATES
+    }).all()
+    if not candidates:
+        return []
+
+    # Owner-scoped counts only walk the caller's postings
+    count = db.execute(_SQLITE_COUNT, {"match": owner}).scalar()
+    document_frequencies = [
+        db.execute(_SQLITE_COUNT, {"match": f"{owner} AND content : {phrase}"}).scalar()
+        for phrase in phrases
+    ]
+    best = _rank(candidates, parts, document_frequencies, count, limit)
+
+    contents = dict(candidates)
+    rows = {
+        row.rowid: row
+        for row in db.execute(_SQLITE_MESSAGES, {
+            "rowids": [rowid for rowid, _ in best],
+            "user_id": user_id
+        })
+    }
+    return [
+        _result(rows[rowid], score, make_snippet(contents[rowid], parts))
+        for rowid, score in best
+        if rowid in rows
+    ]
+
+_POSTGRES_SEARCH = text(f"""
+    SELECT m.id, m.conversation_id, c.title, m.role, m.created_at, top.rank,
+        ts_headline('{POSTGRES_CONFIG}', m.content, top.query, :options) AS snippet
+    FROM (
+        SELECT m.id, q.query, ts_rank_cd(m.search_vector, q.query) AS rank
+        FROM messages m
+        JOIN conversations c ON c.id = m.conversation_id
+        CROSS JOIN websearch_to_tsquery('{POSTGRES_CONFIG}', :query) AS q(query)
+        WHERE c.user_id = :user_id AND m.search_vector @@ q.query
+        ORDER BY rank DESC
+        LIMIT :limit
+    ) top
+    JOIN messages m ON m.id = top.id
+    JOIN conversations c ON c.id = m.conversation_id
+    ORDER BY top.rank DESC
+""")
+
+def _search_postgres(
+    db: Session, user_id: str, parts: List[Tuple[str, ...]], limit: int
+) -> List[Dict[str, Any]]:
+    query = " ".join(part[0] if len(part) == 1 else '"' + " ".join(part) + '"' for part in parts)
+    # Headlines are only made for the page of best matches
+    options = (
+        f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_END}", '
+        f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}"
+    )
+    rows = db.execute(_POSTGRES_SEARCH, {
+        "query": query,
+        "user_id": user_id,
+        "limit": limit,
+        "options": options
+    })
+    return [_result(row, float(row.rank), row.snippet) for row in rows]
+
+class UserIndex:
+    """
+    Positional inverted index over one user's messages.
+
+    Messages are numbered in the order they were added, oldest first.
+    ``signature`` is the message count and latest message time the index
+    was brought up to date with.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.message_ids: List[str] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, List[int]]] = {}
+        self.documents: Dict[str, int] = {}
+        self.total_length = 0
+        self.signature: Tuple[int, Optional[datetime]] = (0, None)
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    def add(self, message_id: str, content: str) -> None:
+        """Index a message, unless it already is."""
+        if message_id in self.documents:
+            return
+        document = len(self.message_ids)
+        self.documents[message_id] = document
+        self.message_ids.append(message_id)
+        words = tokenize(content)
+        for position, word in enumerate(words):
+            self.postings.setdefault(word, {}).setdefault(document, []).append(position)
+        self.lengths.append(len(words))
+        self.total_length += len(words)
+
+    def _frequencies(self, part: Tuple[str, ...]) -> Dict[int, int]:
+        """Occurrences of a word or phrase per message that contains it."""
+        postings = [self.postings.get(word) for word in part]
+        if not all(postings):
+            return {}
+        if len(part) == 1:
+            return {document: len(positions) for document, positions in postings[0].items()}
+        frequencies = {}
+        for document in set.intersection(*(set(p) for p in postings)):
+            following = [set(p[document]) for p in postings[1:]]
+            count = sum(
+                all(start + offset + 1 in positions for offset, positions in enumerate(following))
+                for start in postings[0][document]
+            )
+            if count:
+                frequencies[document] = count
+        return frequencies
+
+    def search(
+        self, parts: List[Tuple[str, ...]], limit: int, max_candidates: int
+    ) -> List[Tuple[str, float]]:
+        """Rank the most recent ``max_candidates`` messages matching every part by BM25."""
+        frequencies = [self._frequencies(part) for part in parts]
+        if not all(frequencies):
+            return []
+        candidates = set.intersection(*(set(f) for f in frequencies))
+        if len(candidates) > max_candidates:
+            candidates = sorted(candidates)[-max_candidates:]
+
+        document_frequencies = [len(f) for f in frequencies]
+        average_length = self.total_length / len(self.message_ids)
+        best = heapq.nlargest(limit, (
+            (
+                bm25(
+                    [f[document] for f in frequencies],
+                    document_frequencies,
+                    len(self.message_ids),
+                    self.lengths[document],
+                    average_length
+                ),
+                document
+            )
+            for document in candidates
+        ))
+        return [(self.message_ids[document], score) for score, document in best]
+
+def _user_messages(db: Session, user_id: str, since: Optional[datetime] = None):
+    query = select(MessageModel.id, MessageModel.content).join(
+        ConversationModel, ConversationModel.id == MessageModel.conversation_id
+    ).where(
+        ConversationModel.user_id == user_id
+    ).order_by(MessageModel.created_at, MessageModel.id)
+    if since is not None:
+        query = query.where(MessageModel.created_at >= since)
+    return db.execute(query.execution_options(yield_per=1000))
+
+class MemorySearchIndex:
+    """
+    In-process inverted indexes of the most recently searching users.
+
+    Before each search the user's message count and latest message time
+    are compared with the index. New messages are added to it; if the
+    count still differs, messages were deleted, archived or restored and
+    the user's index is rebuilt.
+    """
+
+    def __init__(self, max_users: int = 256) -> None:
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, UserIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, user_id: str) -> UserIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = self._indexes[user_id] = UserIndex()
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+            return index
+
+    def _refresh(self, db: Session, user_id: str, index: UserIndex) -> UserIndex:
+        signature = tuple(db.execute(
+            select(func.count(MessageModel.id), func.max(MessageModel.created_at)).join(
+                ConversationModel, ConversationModel.id == MessageModel.conversation_id
+            ).where(ConversationModel.user_id == user_id)
+        ).one())
+        if signature == index.signature:
+            return index
+        if len(index) and index.signature[1] is not None:
+            for row in _user_messages(db, user_id, since=index.signature[1]):
+                index.add(row.id, row.content)
+        if len(index) != signature[0]:
+            rebuilt = UserIndex()
+            for row in _user_messages(db, user_id):
+                rebuilt.add(row.id, row.content)
+            rebuilt.lock = index.lock
+            index = rebuilt
+            with self._lock:
+                if user_id in self._indexes:
+                    self._indexes[user_id] = index
+        index.signature = signature
+        return index
+
+    def search(
+        self, db: Session, user_id: str, parts: List[Tuple[str, ...]], limit: int
+    ) -> List[Dict[str, Any]]:
+        """Search a user's messages, bringing their index up to date first."""
+        index = self._get(user_id)
+        with index.lock:
+            index = self._refresh(db, user_id, index)
+            if not len(index):
+                return []
+            best = index.search(parts, limit, settings.MESSAGE_SEARCH_MAX_CANDIDATES)
+        if not best:
+            return []
+
+        rows = {
+            row.id: row for row in db.execute(
+                select(
+                    MessageModel.id,
+                    MessageModel.conversation_id,
+                    ConversationModel.title,
+                    MessageModel.role,
+                    MessageModel.created_at,
+                    MessageModel.content
+                ).join(
+                    ConversationModel, ConversationModel.id == MessageModel.conversation_id
+                ).where(
+                    MessageModel.id.in_([message_id for message_id, _ in best]),
+                    ConversationModel.user_id == user_id
+                )
+            )
+        }
+        return [
+            _result(rows[message_id], score, make_snippet(rows[message_id].content, parts))
+            for message_id, score in best
+            if message_id in rows
+        ]
+
+MEMORY_INDEX = MemorySearchIndex(settings.MESSAGE_SEARCH_CACHE_USERS)
+
+_backends: Dict[str, str] = {}
+
+def get_search_backend(db: Session) -> str:
+    """
+    Get the backend searches on this database use.
+
+    Returns:
+        ``sqlite`` or ``postgresql`` when the database has its full-text
+        index, ``memory`` otherwise
+    """
+    if settings.MESSAGE_SEARCH_BACKEND == "memory":
+        return "memory"
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _backends:
+        dialect = bind.dialect.name
+        if dialect == "sqlite":
+            found = db.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_search'"
+            )).first()
+        elif dialect == "postgresql":
+            found = db.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'messages' AND column_name = 'search_vector'"
+            )).first()
+        else:
+            found = None
+        _backends[key] = dialect if found else "memory"
+        if not found:
+            logger.warning("No full-text index on the %s database, searching messages in memory", dialect)
+    return _backends[key]
+
+def search_messages(db: Session, user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Search the messages of a user's conversations.
+
+    Args:
+        query: Words that must all appear, in any order, and quoted
+            phrases that must appear as written
+        limit: Most results to return
+
+    Returns:
+        The best matches first, each with a snippet of the message and
+        the start and end offsets of the matching words in it
+    """
+    parts = parse_query(query)
+    if not parts:
+        return []
+    backend = get_search_backend(db)
+    if backend == "sqlite":
+        return _search_sqlite(db, user_id, parts, limit)
+    if backend == "postgresql":
+        return _search_postgres(db, user_id, parts, limit)
+    return MEMORY_INDEX.search(db, user_id, parts, limit)
+
+def rebuild_search_index(db: Session) -> int:
+    """
+    Rebuild the database's full-text index from the messages table.
+
+    Only needed for an index that fell out of step, e.g. after messages
+    were written with the triggers dropped; Postgres and the in-process
+    index keep themselves up to date.
+
+    Returns:
+        Number of messages indexed
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return 0
+    # Re-reads every message through the message_search_source view
+    db.execute(text("INSERT INTO message_search (message_search) VALUES ('rebuild')"))
+    db.execute(text("INSERT INTO message_search (message_search) VALUES ('optimize')"))
+    db.commit()
+    return db.execute(text("SELECT count(*) FROM message_search")).scalar()
@@ -0,0 +1,202 @@
+
+"""Parallel, page-aware text extraction from document files."""
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Deque, Iterator, List, NamedTuple, Optional, Tuple
+import os
+import threading
+
+from app.core.config import settings
+
+PDF_MIME_TYPES = {"application/pdf"}
+DOCX_MIME_TYPES = {
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+}
+TEXT_MIME_TYPES = {"text/plain", "text/markdown", "text/csv"}
+
+class ParseError(Exception):
+    """Raised when a document file cannot be parsed."""
+
+class PageText(NamedTuple):
+    """Extracted text of one page, numbered from 1."""
+    page: int
+    text: str
+
+def _limit_memory(max_bytes: int) -> None:
+    """Cap the address space of a pool worker so one bad file cannot exhaust memory."""
+    if max_bytes <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    """Extract pages ``start`` to ``end`` (exclusive, zero-based) of a PDF."""
+    # Parsers are only needed for the file types actually ingested
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _count_pdf_pages(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+def _extract_docx_pages(path: str) -> List[str]:
+    """
+    Extract a DOCX file split into pages.
+
+    DOCX files carry no layout, so pages follow the page breaks Word
+    recorded when the file was last saved, or explicit page breaks if
+    there are none.
+    """
+    from docx import Document
+    from docx.oxml.ns import qn
+
+    body = Document(path).element.body
+    paragraph, text, tab = qn("w:p"), qn("w:t"), qn("w:tab")
+    rendered_break, line_break = qn("w:lastRenderedPageBreak"), qn("w:br")
+    has_rendered_breaks = next(body.iter(rendered_break), None) is not None
+
+    pages: List[List[str]] = [[]]
+    for element in body.iter():
+        if element.tag == paragraph:
+            if pages[-1]:
+                pages[-1].append("\n")
+        elif element.tag == text:
+            pages[-1].append(element.text or "")
+        elif element.tag == tab:
+            pages[-1].append("\t")
+        elif has_rendered_breaks and element.tag == rendered_break:
+            pages.append([])
+        elif (
+            not has_rendered_breaks
+            and element.tag == line_break
+            and element.get(qn("w:type")) == "page"
+        ):
+            pages.append([])
+    return ["".join(parts) for parts in pages]
+
+def _extract_text_pages(path: str) -> List[str]:
+    """Extract a plain text file, split into pages at form feeds."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read().split("\f")
+
+def _plan(
+    path: str, mime_type: str, pages_per_task: int
+) -> Tuple[Callable[..., List[str]], List[Tuple]]:
+    """Split a file into independent extraction tasks, in page order."""
+    if mime_type in PDF_MIME_TYPES:
+        page_count = _count_pdf_pages(path)
+        return _extract_pdf_pages, [
+            (path, start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)
+        ]
+    if mime_type in DOCX_MIME_TYPES:
+        return _extract_docx_pages, [(path,)]
+    if mime_type in TEXT_MIME_TYPES:
+        return _extract_text_pages, [(path,)]
+    raise ParseError(f"Unsupported file type: {mime_type}")
+
+def iter_pages(
+    path: str,
+    mime_type: str,
+    executor: Optional[Executor] = None,
+    pages_per_task: Optional[int] = None
+) -> Iterator[PageText]:
+    """
+    Extract the text of a file page by page, in page order.
+
+    PDFs are split into ranges of ``pages_per_task`` pages that are
+    extracted in parallel on the process pool. Pages are yielded as soon as
+    every earlier range is done, and only two ranges per worker are in
+    flight at a time, so the text of a large document is never held whole.
+
+    Args:
+        path: Local path of the file
+        mime_type: MIME type of the file
+        executor: Executor running the extraction, defaults to the
+            process-wide parse pool
+        pages_per_task: Pages per extraction task, defaults to
+            ``PARSE_PAGES_PER_TASK``
+
+    Raises:
+        ParseError: If the file type is not supported or extraction fails
+    """
+    executor = get_parse_pool() if executor is None else executor
+    pages_per_task = pages_per_task or settings.PARSE_PAGES_PER_TASK
+    try:
+        extract, tasks = _plan(path, mime_type, pages_per_task)
+    except ParseError:
+        raise
+    except Exception as e:
+        raise ParseError(f"Could not read {os.path.basename(path)}: {e}") from e
+
+    window = 2 * getattr(executor, "_max_workers", 1)
+    pending: Deque[Future] = deque()
+    remaining = iter(tasks)
+    page = 1
+    try:
+        while True:
+            while len(pending) < window:
+                task = next(remaining, None)
+                if task is None:
+                    break
+                pending.append(executor.submit(extract, *task))
+            if not pending:
+                return
+            try:
+                texts = pending.popleft().result()
+            except BrokenProcessPool as e:
+                # A worker died, e.g. killed for memory; start a fresh pool next time
+                _discard_parse_pool(executor)
+                raise ParseError(f"Could not extract text from {os.path.basename(path)}: {e}") from e
+            except Exception as e:
+                raise ParseError(f"Could not extract text from {os.path.basename(path)}: {e}") from e
+            for text in texts:
+                yield PageText(page, text)
+                page += 1
+    finally:
+        for future in pending:
+            future.cancel()
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool used for text extraction.
+
+    Workers are recycled after ``PARSE_MAX_TASKS_PER_CHILD`` tasks and have
+    their address space capped at ``PARSE_WORKER_MEMORY_MB``, so memory
+    leaked or ballooned by a parser does not accumulate.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=settings.PARSE_WORKERS or os.cpu_count() or 1,
+                    initializer=_limit_memory,
+                    initargs=(settings.PARSE_WORKER_MEMORY_MB * 1024 * 1024,),
+                    max_tasks_per_child=settings.PARSE_MAX_TASKS_PER_CHILD or None
+                )
+    return _parse_pool
+
+def _discard_parse_pool(executor: Executor) -> None:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is executor:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
+def shutdown_parse_pool() -> None:
+    """Stop the parse pool's workers, if it was started."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=True, cancel_futures=True)
+            _parse_pool = None
@@ -0,0 +1,135 @@
+
+"""Clients for model providers, created on first use.
+
+Provider SDKs take seconds and hundreds of MB to import, so each client
+class imports its SDK in its constructor instead of at module level; a
+worker that never embeds or generates never loads them.
+"""
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+import threading
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.base import (
+    EmbeddingSettings as EmbeddingSettingsModel,
+    LLMSettings as LLMSettingsModel
+)
+
+class EmbeddingProvider:
+    """Embeds texts with a provider's model."""
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a float32 array of shape (len(texts), dimensions)."""
+        raise NotImplementedError
+
+class ChatProvider:
+    """Generates replies with a provider's chat model."""
+
+    async def complete(self, messages: Sequence[Tuple[str, str]]) -> str:
+        """
+        Generate a reply.
+
+        Args:
+            messages: (role, content) pairs with roles ``system``, ``user``
+                and ``assistant``
+        """
+        raise NotImplementedError
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI embeddings through langchain-openai."""
+
+    def __init__(self, config: EmbeddingSettingsModel) -> None:
+        from langchain_openai import OpenAIEmbeddings
+
+        options = {}
+        # Only the text-embedding-3 models can shorten their vectors
+        if config.model_name.startswith("text-embedding-3"):
+            options["dimensions"] = config.dimensions
+        self._client = OpenAIEmbeddings(
+            model=config.model_name,
+            api_key=config.api_key or settings.OPENAI_API_KEY,
+            base_url=config.api_base or None,
+            **options
+        )
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self._client.embed_documents(texts), dtype=np.float32)
+
+class OpenAIChatProvider(ChatProvider):
+    """OpenAI chat models through langchain-openai."""
+
+    def __init__(self, config: LLMSettingsModel) -> None:
+        from langchain_openai import ChatOpenAI
+
+        self._client = ChatOpenAI(
+            model=config.model_name,
+            max_tokens=config.max_tokens,
+            temperature=config.temperature,
+            top_p=config.top_p,
+            frequency_penalty=config.frequency_penalty,
+            presence_penalty=config.presence_penalty,
+            api_key=config.api_key or settings.OPENAI_API_KEY,
+            base_url=config.api_base or None
+        )
+
+    async def complete(self, messages: Sequence[Tuple[str, str]]) -> str:
+        reply = await self._client.ainvoke(list(messages))
+        return reply.content
+
+EMBEDDING_PROVIDERS: Dict[str, Callable[[EmbeddingSettingsModel], EmbeddingProvider]] = {
+    "openai": OpenAIEmbeddingProvider,
+}
+CHAT_PROVIDERS: Dict[str, Callable[[LLMSettingsModel], ChatProvider]] = {
+    "openai": OpenAIChatProvider,
+}
+
+# Clients by kind and the settings they were created from
+_clients: Dict[Tuple[Any, ...], Any] = {}
+_clients_lock = threading.Lock()
+
+def _active(db: Session, model):
+    config = db.query(model).filter(
+        model.is_active == True
+    ).order_by(model.updated_at.desc()).first()
+    if config is None:
+        raise ValueError(f"No active {model.__tablename__} configured")
+    return config
+
+def _client(kind: str, factories: Dict[str, Callable], config, fields: Sequence[str]):
+    factory = factories.get(config.provider)
+    if factory is None:
+        raise ValueError(f"Unsupported {kind} provider: {config.provider}")
+    key = (kind,) + tuple(getattr(config, field) for field in fields)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                # Clients of settings that were replaced are dropped
+                for stale in [other for other in _clients if other[0] == kind]:
+                    del _clients[stale]
+                client = _clients[key] = factory(config)
+    return client
+
+def get_embedding_provider(db: Session) -> EmbeddingProvider:
+    """Get the client for the active embedding settings."""
+    return _client(
+        "embedding",
+        EMBEDDING_PROVIDERS,
+        _active(db, EmbeddingSettingsModel),
+        ("provider", "model_name", "dimensions", "api_key", "api_base")
+    )
+
+def get_chat_provider(db: Session) -> ChatProvider:
+    """Get the client for the active LLM settings."""
+    return _client(
+        "chat",
+        CHAT_PROVIDERS,
+        _active(db, LLMSettingsModel),
+        (
+            "provider", "model_name", "max_tokens", "temperature", "top_p",
+            "frequency_penalty", "presence_penalty", "api_key", "api_base"
+        )
+    )
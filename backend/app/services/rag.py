@@ -1,16 +1,36 @@
 
 """RAG (Retrieval-Augmented Generation) service."""
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 import asyncio
+import hashlib
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
+from app.core.admission import LLM_LIMITER
+from app.core.metrics import span
+from app.db.base import (
+    LLMSettings,
+    EmbeddingSettings,
+    ChunkingSettings,
+    Message as MessageModel,
+    VectorDBSettings,
+    SystemPrompt
+)
+from app.db.session import SessionLocal
 from app.schemas.message import Source
+from app.services.coalescing import SingleFlight
+
+# Identical queries currently being answered, shared across requests
+_inflight_queries = SingleFlight()
+
+# Latest messages of a conversation an answer takes into account
+HISTORY_MESSAGES = 20
 
 # This is a placeholder implementation that would be replaced with actual RAG implementation
 async def process_query(
     db: Session,
     query: str,
-    conversation_id: str,
+    history: List[Tuple[str, str]],
     context_filter: str = None
 ) -> Tuple[str, List[Source]]:
     """
@@ -19,21 +39,30 @@ async def process_query(
     Args:
         db: Database session
         query: User query text
-        conversation_id: ID of the conversation
+        history: Earlier ``(role, content)`` messages of the conversation,
+            oldest first, see ``get_history``
         context_filter: Optional tag ID to filter context
         
     Returns:
         Tuple containing the response text and list of sources
+
+    Raises:
+        Overloaded: The LLM is saturated and the call was shed
     """
-    # In a real implementation, this would:
-    # 1. Retrieve conversation history
-    # 2. Get relevant documents from vector DB
-    # 3. Apply any filters based on context_filter
-    # 4. Call LLM with context and query
-    # 5. Return response and sources
+    # In a real implementation, this would, each step timed under its span:
+    # 1. Build the prompt from ``history`` (span "history")
+    # 2. Embed the query (span "embedding")
+    # 3. Get relevant documents from vector DB, adding get_feedback_boosts()
+    #    to the similarities (span "retrieval")
+    # 4. Apply any filters based on context_filter and rerank (span "rerank")
+    # 5. Call LLM with context and query (span "llm")
+    # 6. Return response and sources
     
-    # Mock implementation for now
-    await asyncio.sleep(1)  # Simulate processing time
+    # Mock implementation for now. Generation waits for admission, so a
+    # slow LLM sheds load with ``Overloaded`` instead of piling up calls
+    async with LLM_LIMITER.slot():
+        with span("llm"):
+            await asyncio.sleep(1)  # Simulate processing time
     
     if "hello" in query.lower():
         response = "Hello! I'm the RAG Assistant. How can I help you today?"
@@ -77,3 +106,137 @@ async def process_query(
         ]
     
     return response, sources
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different spellings coalesce."""
+    return " ".join(query.casefold().split())
+
+def get_settings_version(db: Session) -> Tuple[Any, ...]:
+    """
+    Get a version marker for the settings that shape a RAG answer.
+
+    Any change to the LLM, embedding, chunking, vector DB or system prompt
+    settings bumps ``updated_at`` on the changed row, so the latest timestamp
+    of each table identifies the configuration in one round-trip.
+    """
+    row = db.execute(
+        select(
+            *(
+                select(func.max(model.updated_at)).scalar_subquery()
+                for model in (
+                    LLMSettings,
+                    EmbeddingSettings,
+                    ChunkingSettings,
+                    VectorDBSettings,
+                    SystemPrompt
+                )
+            )
+        )
+    ).one()
+    return tuple(row)
+
+def get_prompt_version(db: Session) -> Optional[str]:
+    """
+    Get a short hash identifying the default system prompt's content.
+
+    Stored on assistant messages so feedback can be compared between prompt
+    revisions; None when no default prompt is configured.
+    """
+    content = db.query(SystemPrompt.content).filter(
+        SystemPrompt.is_default == True
+    ).order_by(SystemPrompt.updated_at.desc()).limit(1).scalar()
+    if content is None:
+        return None
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+
+def get_history(
+    db: Session,
+    conversation_id: str,
+    exclude_message_id: Optional[str] = None,
+    limit: int = HISTORY_MESSAGES
+) -> List[Tuple[str, str]]:
+    """Get the latest messages of a conversation as ``(role, content)`` pairs, oldest first."""
+    query = db.query(MessageModel.role, MessageModel.content).filter(
+        MessageModel.conversation_id == conversation_id
+    )
+    if exclude_message_id is not None:
+        query = query.filter(MessageModel.id != exclude_message_id)
+    rows = query.order_by(MessageModel.created_at.desc()).limit(limit).all()
+    return [(role, content) for role, content in reversed(rows)]
+
+def history_digest(history: List[Tuple[str, str]]) -> str:
+    """Hash a conversation history, so only answers to the same history are shared."""
+    digest = hashlib.sha256()
+    for role, content in history:
+        digest.update(f"{role}\0{content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+async def _process_shared_query(
+    query: str,
+    history: List[Tuple[str, str]],
+    context_filter: Optional[str]
+) -> Tuple[str, List[Source]]:
+    """
+    Run ``process_query`` on a session of its own.
+
+    The call is shared, so it must not use the session of the request that
+    happened to start it, which is closed when that request ends.
+    """
+    db = SessionLocal()
+    try:
+        return await process_query(
+            db=db,
+            query=query,
+            history=history,
+            context_filter=context_filter
+        )
+    finally:
+        db.close()
+
+async def process_query_coalesced(
+    db: Session,
+    query: str,
+    conversation_id: str,
+    context_filter: Optional[str] = None,
+    access_scope: Optional[str] = None,
+    exclude_message_id: Optional[str] = None
+) -> Tuple[str, List[Source]]:
+    """
+    Process a query, sharing the work with identical in-flight queries.
+
+    Concurrent requests with the same normalized query, conversation
+    history, context filter, access scope and settings version await a
+    single ``process_query`` call. The history is read here, on the
+    caller's session, and only its content reaches the shared call, so an
+    answer never draws on another caller's conversation; questions opening
+    new conversations all share the empty history. Callers persist the
+    shared result in their own conversations.
+
+    Args:
+        db: Database session
+        query: User query text
+        conversation_id: ID of the conversation
+        context_filter: Optional tag ID to filter context
+        access_scope: Role the answer is retrieved for, so documents hidden
+            from one role never reach another through a shared answer
+        exclude_message_id: Message left out of the history, i.e. the
+            just saved message asking ``query``
+
+    Returns:
+        Tuple containing the response text and list of sources
+    """
+    with span("history"):
+        history = get_history(db, conversation_id, exclude_message_id)
+    with span("settings_version"):
+        settings_version = get_settings_version(db)
+    key = (
+        normalize_query(query),
+        history_digest(history),
+        context_filter,
+        access_scope,
+        settings_version
+    )
+    return await _inflight_queries.do(
+        key,
+        lambda: _process_shared_query(query, history, context_filter)
+    )
@@ -0,0 +1,577 @@
+
+"""Blob storage backends for uploaded documents."""
+from collections import OrderedDict
+from typing import BinaryIO, Iterable, Iterator, List, Optional, TextIO, Tuple
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Size of each read when streaming a stored object
+READ_CHUNK_SIZE = 1024 * 1024
+
+class StorageError(Exception):
+    """Raised when a storage backend cannot complete an operation."""
+
+class PartWriter:
+    """Streams one part of a multipart upload into a storage backend."""
+
+    def write(self, data: bytes) -> None:
+        """Write the next bytes of the part."""
+        raise NotImplementedError
+
+    def commit(self) -> str:
+        """Finish the part and return its ETag."""
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """Discard everything written to this part."""
+        raise NotImplementedError
+
+class StorageBackend:
+    """
+    Interface for blob storage.
+
+    Uploads are multipart: ``start_upload`` returns an upload ID, parts are
+    streamed through ``open_part`` writers in order, and
+    ``complete_upload`` makes the object visible under its key.
+    """
+
+    def start_upload(self, key: str) -> str:
+        """Start a multipart upload for ``key`` and return its upload ID."""
+        raise NotImplementedError
+
+    def open_part(self, key: str, upload_id: str, part_number: int, offset: int) -> PartWriter:
+        """Open a writer for a part starting at byte ``offset`` of the object."""
+        raise NotImplementedError
+
+    def complete_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        """Assemble the uploaded ``(part_number, etag)`` parts into the object."""
+        raise NotImplementedError
+
+    def abort_upload(self, key: str, upload_id: str) -> None:
+        """Discard an unfinished upload and its parts."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """Open a stored object for reading."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Delete a stored object if it exists."""
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        """Get the size of a stored object in bytes."""
+        raise NotImplementedError
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        """
+        Read ``length`` bytes of a stored object from byte ``offset``.
+
+        Reading past the end returns the bytes up to the end.
+        """
+        with self.open(key) as f:
+            remaining = offset
+            while remaining > 0:
+                skipped = len(f.read(min(remaining, READ_CHUNK_SIZE)))
+                if not skipped:
+                    return b""
+                remaining -= skipped
+            return f.read(length)
+
+    def iter_object(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """Stream a stored object in chunks."""
+        with self.open(key) as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    return
+                yield data
+
+    def write_stream(self, key: str, chunks: Iterable[bytes]) -> int:
+        """
+        Store an object from an iterable of byte chunks.
+
+        Goes through a multipart upload, starting a new part every
+        ``UPLOAD_PART_SIZE`` bytes, so the object is never held in memory
+        and only becomes visible once complete.
+
+        Returns:
+            Size of the object in bytes
+        """
+        upload_id = self.start_upload(key)
+        parts: List[Tuple[int, str]] = []
+        offset = part_size = 0
+        writer = self.open_part(key, upload_id, 1, 0)
+        try:
+            for data in chunks:
+                writer.write(data)
+                offset += len(data)
+                part_size += len(data)
+                if part_size >= settings.UPLOAD_PART_SIZE:
+                    parts.append((len(parts) + 1, writer.commit()))
+                    writer = self.open_part(key, upload_id, len(parts) + 1, offset)
+                    part_size = 0
+            parts.append((len(parts) + 1, writer.commit()))
+            self.complete_upload(key, upload_id, parts)
+        except BaseException:
+            writer.abort()
+            self.abort_upload(key, upload_id)
+            raise
+        return offset
+
+class _LocalPartWriter(PartWriter):
+    def __init__(self, path: str, offset: int) -> None:
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        # Drop anything left by an earlier, failed attempt at this part
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        self._md5 = hashlib.md5()
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._md5.update(data)
+
+    def commit(self) -> str:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return self._md5.hexdigest()
+
+    def abort(self) -> None:
+        self._file.close()
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Store objects as files under a root directory.
+
+    An upload appends its parts in order to one ``.partial`` file, and
+    completing it renames that file into place, so no part is copied twice.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self._uploads = os.path.join(self.root, ".uploads")
+        os.makedirs(self._uploads, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """Get the file path of ``key``, refusing keys outside the root."""
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise StorageError(f"Invalid storage key: {key}")
+        return path
+
+    def _partial_path(self, upload_id: str) -> str:
+        if not upload_id.isalnum():
+            raise StorageError(f"Invalid upload ID: {upload_id}")
+        return os.path.join(self._uploads, f"{upload_id}.partial")
+
+    def start_upload(self, key: str) -> str:
+        upload_id = uuid.uuid4().hex
+        open(self._partial_path(upload_id), "wb").close()
+        return upload_id
+
+    def open_part(self, key: str, upload_id: str, part_number: int, offset: int) -> PartWriter:
+        path = self._partial_path(upload_id)
+        if not os.path.exists(path):
+            raise StorageError(f"Unknown upload: {upload_id}")
+        return _LocalPartWriter(path, offset)
+
+    def complete_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self._partial_path(upload_id), target)
+
+    def abort_upload(self, key: str, upload_id: str) -> None:
+        try:
+            os.remove(self._partial_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self.path(key))
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+class _S3PartWriter(PartWriter):
+    def __init__(self, backend: "S3StorageBackend", key: str, upload_id: str, part_number: int) -> None:
+        self._backend = backend
+        self._key = key
+        self._upload_id = upload_id
+        self._part_number = part_number
+        # Parts are bounded by UPLOAD_PART_SIZE; anything past the threshold
+        # spills to disk instead of staying in memory
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_SIZE)
+
+    def write(self, data: bytes) -> None:
+        self._buffer.write(data)
+
+    def commit(self) -> str:
+        self._buffer.seek(0)
+        try:
+            response = self._backend.client.upload_part(
+                Bucket=self._backend.bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                PartNumber=self._part_number,
+                Body=self._buffer
+            )
+        finally:
+            self._buffer.close()
+        return response["ETag"]
+
+    def abort(self) -> None:
+        self._buffer.close()
+
+class S3StorageBackend(StorageBackend):
+    """
+    Store objects in an S3-compatible bucket.
+
+    ``endpoint_url`` points the backend at any S3-compatible service, such
+    as MinIO or a local moto server. A preconfigured ``client`` can be
+    passed instead.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        client=None
+    ) -> None:
+        if client is None:
+            # boto3 is only needed when S3 storage is configured
+            import boto3
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region_name)
+        self.client = client
+        self.bucket = bucket
+
+    def start_upload(self, key: str) -> str:
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        return response["UploadId"]
+
+    def open_part(self, key: str, upload_id: str, part_number: int, offset: int) -> PartWriter:
+        return _S3PartWriter(self, key, upload_id, part_number)
+
+    def complete_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": part_number, "ETag": etag}
+                    for part_number, etag in sorted(parts)
+                ]
+            }
+        )
+
+    def abort_upload(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+    def open(self, key: str) -> BinaryIO:
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        return response["Body"]
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def size(self, key: str) -> int:
+        response = self.client.head_object(Bucket=self.bucket, Key=key)
+        return response["ContentLength"]
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        if length <= 0:
+            return b""
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=key,
+            Range=f"bytes={offset}-{offset + length - 1}"
+        )
+        return response["Body"].read()
+
+class CachedStorageBackend(StorageBackend):
+    """
+    Serve range reads of a remote backend from a bounded on-disk LRU cache.
+
+    Objects are cached in fixed-size blocks, so re-reading a few pages of a
+    large file only fetches the blocks covering them, and neighbouring
+    missing blocks are fetched in one request. Stored objects are never
+    modified in place, so a cached block stays valid until its object is
+    deleted. Uploads and whole-object reads go straight to the wrapped
+    backend and do not churn the cache.
+
+    Worker processes share ``root`` but not their bookkeeping, so each one
+    caches into a slot of its own: the subdirectory ``<n>``, held with an
+    exclusive lock on ``slot-<n>.lock`` from the first cache access on.
+    Each slot gets ``max_bytes / processes``, which bounds the cache on
+    disk as long as no more than ``processes`` processes read through it
+    at once. A slot freed by an exited worker is taken over, blocks and
+    all, by the next process to start. Object sizes are remembered for the
+    ``max_sizes`` most recently read keys.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        root: str,
+        max_bytes: int,
+        block_size: int = 256 * 1024,
+        processes: int = 1,
+        max_sizes: int = 10000
+    ) -> None:
+        self.backend = backend
+        self.root = os.path.abspath(root)
+        self.processes = max(1, processes)
+        self.max_bytes = max_bytes // self.processes
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        # Block file name -> size in bytes, least recently used first
+        self._blocks: "OrderedDict[str, int]" = OrderedDict()
+        self._cached_bytes = 0
+        # Object key -> size in bytes, least recently used first
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self.max_sizes = max_sizes
+        # Directory and lock of this process's slot, taken on first use
+        # rather than here, so a worker forked after loading the app does
+        # not inherit its parent's lock
+        self.directory: Optional[str] = None
+        self._slot_lock: Optional[TextIO] = None
+        self._pid: Optional[int] = None
+        os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def cached_bytes(self) -> int:
+        """Total size of the cached blocks."""
+        return self._cached_bytes
+
+    def start_upload(self, key: str) -> str:
+        return self.backend.start_upload(key)
+
+    def open_part(self, key: str, upload_id: str, part_number: int, offset: int) -> PartWriter:
+        return self.backend.open_part(key, upload_id, part_number, offset)
+
+    def complete_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        self.backend.complete_upload(key, upload_id, parts)
+
+    def abort_upload(self, key: str, upload_id: str) -> None:
+        self.backend.abort_upload(key, upload_id)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.backend.open(key)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+        prefix = self._block_prefix(key)
+        self._claim_slot()
+        with self._lock:
+            self._sizes.pop(key, None)
+            for name in [name for name in self._blocks if name.startswith(prefix)]:
+                self._evict(name)
+
+    def size(self, key: str) -> int:
+        with self._lock:
+            size = self._sizes.get(key)
+            if size is not None:
+                self._sizes.move_to_end(key)
+                return size
+        size = self.backend.size(key)
+        with self._lock:
+            self._sizes[key] = size
+            self._sizes.move_to_end(key)
+            while len(self._sizes) > self.max_sizes:
+                self._sizes.popitem(last=False)
+        return size
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        end = min(offset + length, self.size(key))
+        if offset >= end:
+            return b""
+        first = offset // self.block_size
+        last = (end - 1) // self.block_size
+        self._claim_slot()
+
+        blocks: List[Optional[bytes]] = [self._get_block(key, block) for block in range(first, last + 1)]
+        block = first
+        while block <= last:
+            if blocks[block - first] is not None:
+                block += 1
+                continue
+            # Fetch the whole run of missing blocks in one request
+            run_end = block
+            while run_end < last and blocks[run_end + 1 - first] is None:
+                run_end += 1
+            data = self.backend.read_range(
+                key, block * self.block_size, (run_end - block + 1) * self.block_size
+            )
+            for i in range(block, run_end + 1):
+                start = (i - block) * self.block_size
+                blocks[i - first] = data[start:start + self.block_size]
+                self._put_block(key, i, blocks[i - first])
+            block = run_end + 1
+
+        data = b"".join(blocks)
+        start = offset - first * self.block_size
+        return data[start:start + end - offset]
+
+    def _block_prefix(self, key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:40] + "."
+
+    def _get_block(self, key: str, block: int) -> Optional[bytes]:
+        name = f"{self._block_prefix(key)}{block}"
+        with self._lock:
+            if name not in self._blocks:
+                return None
+            self._blocks.move_to_end(name)
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted by another thread since the lookup
+            return None
+
+    def _put_block(self, key: str, block: int, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        name = f"{self._block_prefix(key)}{block}"
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if name in self._blocks:
+                self._cached_bytes -= self._blocks.pop(name)
+            self._blocks[name] = len(data)
+            self._cached_bytes += len(data)
+            while self._cached_bytes > self.max_bytes:
+                self._evict(next(iter(self._blocks)))
+
+    def _evict(self, name: str) -> None:
+        self._cached_bytes -= self._blocks.pop(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _claim_slot(self) -> None:
+        """Take the first slot no other live process holds, once per process."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            slot = 0
+            while True:
+                lock = open(os.path.join(self.root, f"slot-{slot}.lock"), "a")
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    lock.close()
+                    slot += 1
+            if self._slot_lock is not None:
+                # Inherited from the parent process, which still holds it
+                self._slot_lock.close()
+            self._slot_lock = lock
+            self.directory = os.path.join(self.root, str(slot))
+            os.makedirs(self.directory, exist_ok=True)
+            self._blocks.clear()
+            self._cached_bytes = 0
+            self._load()
+            self._pid = os.getpid()
+        self._prune_slots()
+
+    def _load(self) -> None:
+        """Pick up the blocks the slot's previous holder cached, oldest access first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                # Only this process writes to the slot, so the block was
+                # left half-written by its previous holder
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._blocks[name] = size
+            self._cached_bytes += size
+        while self._cached_bytes > self.max_bytes:
+            self._evict(next(iter(self._blocks)))
+        if self._blocks:
+            logger.info(
+                "Loaded %d cached storage blocks (%d bytes) from %s",
+                len(self._blocks), self._cached_bytes, self.directory
+            )
+
+    def _prune_slots(self) -> None:
+        """Empty slots beyond ``processes`` that no process holds, e.g. after fewer workers were configured."""
+        for entry in os.scandir(self.root):
+            if not entry.name.startswith("slot-") or not entry.name.endswith(".lock"):
+                continue
+            slot = entry.name[len("slot-"):-len(".lock")]
+            if not slot.isdigit() or int(slot) < self.processes:
+                continue
+            with open(entry.path, "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                # The lock file stays, so a process opening it now still
+                # locks the same file as any other
+                shutil.rmtree(os.path.join(self.root, slot), ignore_errors=True)
+
+_storage: Optional[StorageBackend] = None
+
+def get_storage() -> StorageBackend:
+    """
+    Get the storage backend selected by ``STORAGE_TYPE``.
+
+    Remote backends sit behind the on-disk read cache unless
+    ``STORAGE_CACHE_MAX_BYTES`` is 0.
+    """
+    global _storage
+    if _storage is None:
+        if settings.STORAGE_TYPE == "local":
+            _storage = LocalStorageBackend(settings.STORAGE_PATH)
+        elif settings.STORAGE_TYPE == "s3":
+            _storage = S3StorageBackend(
+                settings.S3_BUCKET,
+                endpoint_url=settings.S3_ENDPOINT_URL or None,
+                region_name=settings.S3_REGION or None
+            )
+            if settings.STORAGE_CACHE_MAX_BYTES > 0:
+                _storage = CachedStorageBackend(
+                    _storage,
+                    settings.STORAGE_CACHE_PATH,
+                    max_bytes=settings.STORAGE_CACHE_MAX_BYTES,
+                    block_size=settings.STORAGE_CACHE_BLOCK_SIZE,
+                    # Split between the web workers, as gunicorn.conf.py counts them
+                    processes=settings.WEB_WORKERS or os.cpu_count() or 1
+                )
+        else:
+            raise StorageError(f"Unsupported storage type: {settings.STORAGE_TYPE}")
+    return _storage
@@ -0,0 +1,331 @@
+
+"""Resumable chunked uploads streamed straight to storage."""
+from collections import OrderedDict
+from typing import AsyncIterator, Optional, Tuple
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.blob import acquire_blob, release_blob
+from app.crud.document import create_document, get_document_by_id
+from app.crud.upload import (
+    create_upload_session,
+    get_upload_parts,
+    record_upload_part,
+    transition_upload_status,
+    update_upload_status
+)
+from app.db.base import (
+    generate_uuid,
+    Document as DocumentModel,
+    UploadSession as UploadSessionModel
+)
+from app.schemas.document import DocumentCreate, UploadCreate
+from app.services.indexing import refresh_document_tags
+from app.services.storage import PartWriter, StorageBackend, get_storage
+
+logger = logging.getLogger(__name__)
+
+# Request body bytes gathered before each write to storage
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+class UploadError(Exception):
+    """Raised when an upload request does not fit the session state."""
+
+class UploadConflict(UploadError):
+    """Raised when a part is already being written or was already received."""
+
+class _HashStates:
+    """
+    Running SHA-256 of the uploads this worker receives, with the number of bytes each covers.
+
+    Parts arrive in order, so the digest is ready as soon as the last part
+    lands. Uploads resumed on another worker have no entry there, and leave
+    a stale one here; ``complete_upload`` re-reads those to hash them.
+    Entries idle for ``max_idle`` seconds, e.g. of abandoned uploads, and
+    the least recently used beyond ``max_entries`` are dropped, which only
+    costs that re-read.
+    """
+
+    def __init__(self, max_entries: int, max_idle: float):
+        self.max_entries = max_entries
+        self.max_idle = max_idle
+        self._entries: "OrderedDict[str, Tuple[hashlib._Hash, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            upload_id, (_, _, touched) = next(iter(self._entries.items()))
+            if now - touched < self.max_idle and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[upload_id]
+
+    def get(self, upload_id: str, offset: int) -> Optional["hashlib._Hash"]:
+        """The digest of an upload if it covers exactly its first ``offset`` bytes."""
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get(upload_id)
+            if entry is None:
+                return None
+            if entry[1] != offset:
+                # Parts went to another worker meanwhile; this digest is of no use
+                del self._entries[upload_id]
+                return None
+            return entry[0]
+
+    def put(self, upload_id: str, hasher: "hashlib._Hash", offset: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._entries[upload_id] = (hasher, offset, now)
+            self._entries.move_to_end(upload_id)
+            self._expire(now)
+
+    def pop(self, upload_id: str) -> None:
+        with self._lock:
+            self._entries.pop(upload_id, None)
+
+_hashers = _HashStates(settings.UPLOAD_HASH_MAX_ENTRIES, settings.UPLOAD_HASH_MAX_IDLE)
+# Uploads with a part being written by this worker, cleared when the part ends
+_parts_in_flight = set()
+
+def start_upload(db: Session, upload: UploadCreate, user_id: str) -> UploadSessionModel:
+    """Start a resumable upload and its multipart upload in storage."""
+    upload_session_id = generate_uuid()
+    storage_key = f"documents/{upload_session_id}"
+    storage_upload_id = get_storage().start_upload(storage_key)
+    _hashers.put(upload_session_id, hashlib.sha256(), 0)
+    return create_upload_session(
+        db,
+        upload,
+        user_id=user_id,
+        storage_key=storage_key,
+        storage_upload_id=storage_upload_id,
+        part_size=settings.UPLOAD_PART_SIZE,
+        upload_session_id=upload_session_id
+    )
+
+def _write(writer: PartWriter, hasher: Optional["hashlib._Hash"], data: bytes) -> None:
+    writer.write(data)
+    if hasher is not None:
+        hasher.update(data)
+
+async def write_part(
+    db: Session,
+    db_upload: UploadSessionModel,
+    part_number: int,
+    body: AsyncIterator[bytes]
+) -> UploadSessionModel:
+    """
+    Stream one part of an upload from the request body into storage.
+
+    The body is written through in buffers of ``WRITE_BUFFER_SIZE`` and
+    hashed on the way, so a part never sits in memory whole. Storage I/O,
+    hashing and recording the part run in the thread pool to keep the event
+    loop free.
+
+    Raises:
+        UploadConflict: If the part is not the next one expected or is
+            already being written
+        UploadError: If the part has the wrong size
+    """
+    if db_upload.status != "active":
+        raise UploadConflict(f"Upload is {db_upload.status}")
+    if part_number != db_upload.next_part:
+        raise UploadConflict(f"Expected part {db_upload.next_part}, got part {part_number}")
+    if db_upload.id in _parts_in_flight:
+        raise UploadConflict("A part of this upload is already being written")
+
+    offset = db_upload.bytes_received
+    remaining = db_upload.file_size - offset
+    expected_size = min(db_upload.part_size, remaining)
+
+    # Hash into a copy so a failed part leaves the running digest untouched
+    hasher = _hashers.get(db_upload.id, offset)
+    if hasher is not None:
+        hasher = hasher.copy()
+
+    _parts_in_flight.add(db_upload.id)
+    try:
+        writer = await run_in_threadpool(
+            get_storage().open_part,
+            db_upload.storage_key,
+            db_upload.storage_upload_id,
+            part_number,
+            offset
+        )
+        size = 0
+        try:
+            buffer = bytearray()
+            async for data in body:
+                size += len(data)
+                if size > expected_size:
+                    raise UploadError(f"Part {part_number} must be {expected_size} bytes")
+                buffer += data
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await run_in_threadpool(_write, writer, hasher, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_in_threadpool(_write, writer, hasher, bytes(buffer))
+            if size != expected_size:
+                raise UploadError(f"Part {part_number} must be {expected_size} bytes")
+            etag = await run_in_threadpool(writer.commit)
+        except BaseException:
+            await run_in_threadpool(writer.abort)
+            raise
+
+        recorded = await run_in_threadpool(
+            record_upload_part, db, db_upload, part_number, etag, size
+        )
+        if not recorded:
+            raise UploadConflict(f"Part {part_number} was already received")
+        if hasher is not None:
+            _hashers.put(db_upload.id, hasher, offset + size)
+    finally:
+        _parts_in_flight.discard(db_upload.id)
+
+    return db_upload
+
+def _hash_stored_object(key: str) -> str:
+    """Hash a stored object by reading it back."""
+    hasher = hashlib.sha256()
+    for data in get_storage().iter_object(key):
+        hasher.update(data)
+    return hasher.hexdigest()
+
+def _is_assembled(storage: StorageBackend, key: str) -> bool:
+    """Whether an earlier completion that failed later on already assembled the object."""
+    try:
+        storage.size(key)
+    except Exception:
+        return False
+    return True
+
+def _discard_document(db: Session, document_id: str) -> None:
+    """Delete a document created by a completion that then failed, and its blob reference."""
+    db.rollback()
+    document = get_document_by_id(db, document_id)
+    if document is None:
+        return
+    blob = document.blob
+    document.blob = None
+    if blob is not None:
+        release_blob(db, blob)
+    db.delete(document)
+    db.commit()
+
+def complete_upload(db: Session, db_upload: UploadSessionModel) -> DocumentModel:
+    """
+    Finish an upload and create its document, queued for ingestion.
+
+    The content hash comes from the digest built while the parts streamed
+    in, so the file is not read again. Only an upload whose parts were
+    spread over several workers is re-read to hash it.
+
+    The session moves from active to completing in a single conditional
+    update, so of concurrent requests only one assembles the file. If
+    storage cannot assemble it, or the document cannot be created, the
+    session becomes active again, without a document or blob reference,
+    and the request can be retried. A retry finds the file already
+    assembled.
+
+    Content that was uploaded before is not stored or ingested again: the
+    document takes a reference to the existing blob, shares its chunks and
+    status, and the new copy is deleted. The shared chunks take on the
+    new document's tags too.
+
+    Raises:
+        UploadConflict: If the upload is not active
+        UploadError: If parts are still missing
+    """
+    if db_upload.status != "active":
+        raise UploadConflict(f"Upload is {db_upload.status}")
+    if db_upload.bytes_received != db_upload.file_size:
+        raise UploadError(
+            f"Received {db_upload.bytes_received} of {db_upload.file_size} bytes"
+        )
+
+    if not transition_upload_status(db, db_upload, "active", "completing"):
+        raise UploadConflict(f"Upload is {db_upload.status}")
+
+    storage = get_storage()
+    try:
+        if not _is_assembled(storage, db_upload.storage_key):
+            storage.complete_upload(
+                db_upload.storage_key,
+                db_upload.storage_upload_id,
+                get_upload_parts(db_upload)
+            )
+    except Exception:
+        transition_upload_status(db, db_upload, "completing", "active")
+        raise
+
+    hasher = _hashers.get(db_upload.id, db_upload.file_size)
+    if hasher is not None:
+        content_hash = hasher.hexdigest()
+    else:
+        logger.info("Re-reading upload %s to hash it", db_upload.id)
+        content_hash = _hash_stored_object(db_upload.storage_key)
+
+    document_id = generate_uuid()
+    try:
+        blob, created = acquire_blob(
+            db,
+            content_hash,
+            storage_path=db_upload.storage_key,
+            file_size=db_upload.file_size,
+            document_id=document_id
+        )
+        status = "queued"
+        if not created:
+            indexed = get_document_by_id(db, blob.document_id)
+            if indexed is not None:
+                status = indexed.status
+
+        document = create_document(
+            db,
+            DocumentCreate(
+                title=db_upload.title,
+                description=db_upload.description,
+                file_name=db_upload.file_name,
+                file_size=db_upload.file_size,
+                mime_type=db_upload.mime_type,
+                tags=json.loads(db_upload.tags or "[]")
+            ),
+            user_id=db_upload.user_id,
+            storage_path=blob.storage_path,
+            content_hash=content_hash,
+            blob_id=blob.id,
+            status=status,
+            document_id=document_id
+        )
+        update_upload_status(db, db_upload, "completed", document_id=document.id)
+    except Exception:
+        _discard_document(db, document_id)
+        transition_upload_status(db, db_upload, "completing", "active")
+        raise
+    _hashers.pop(db_upload.id)
+
+    if not created:
+        logger.info("Upload %s duplicates blob %s", db_upload.id, blob.id)
+        storage.delete(db_upload.storage_key)
+        refresh_document_tags(db, document.id)
+    return document
+
+def abort_upload(db: Session, db_upload: UploadSessionModel) -> UploadSessionModel:
+    """
+    Abort an upload and discard its stored parts.
+
+    Raises:
+        UploadConflict: If the upload is not active, e.g. is being completed
+    """
+    if not transition_upload_status(db, db_upload, "active", "aborted"):
+        raise UploadConflict(f"Upload is {db_upload.status}")
+    _hashers.pop(db_upload.id)
+    get_storage().abort_upload(db_upload.storage_key, db_upload.storage_upload_id)
+    return db_upload
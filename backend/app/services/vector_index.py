@@ -0,0 +1,445 @@
+
+"""Segmented in-process vector index with tombstones and compaction."""
+from typing import BinaryIO, Callable, List, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+TOMBSTONES_FILE = "tombstones.npy"
+
+# Published versions each live in their own directory under VERSIONS_DIR;
+# CURRENT_FILE names the one to serve
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+
+class Segment:
+    """Immutable block of vectors and the vector IDs of its rows."""
+
+    __slots__ = ("vectors", "ids")
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        self.vectors = vectors
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+class _State:
+    """Snapshot of the index that searches read without locking."""
+
+    __slots__ = ("segments", "mutable_vectors", "mutable_ids", "mutable_count", "dead")
+
+    def __init__(self, segments, mutable_vectors, mutable_ids, mutable_count, dead) -> None:
+        self.segments: Tuple[Segment, ...] = segments
+        self.mutable_vectors: np.ndarray = mutable_vectors
+        self.mutable_ids: np.ndarray = mutable_ids
+        self.mutable_count: int = mutable_count
+        self.dead: np.ndarray = dead
+
+class SegmentedIndex:
+    """
+    Brute-force vector index split into segments.
+
+    New vectors go into a small preallocated mutable segment, which is
+    sealed into an immutable segment once full. Deletions set a bit in a
+    tombstone bitmap indexed by vector ID; searches mask tombstoned rows
+    instead of rewriting segments. ``compact`` merges sealed segments and
+    drops tombstoned rows off the write path.
+
+    Searches take a snapshot of the current state and never lock. Writers
+    build a new state and publish it with a single assignment. Rows are
+    only ever appended past a snapshot's count and tombstones are single
+    bits flipped in place, so a snapshot stays valid while writers proceed.
+    """
+
+    def __init__(
+        self,
+        dimensions: Optional[int] = None,
+        metric: str = "cosine",
+        mutable_capacity: int = 4096
+    ) -> None:
+        if metric not in ("cosine", "dot"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dimensions = dimensions
+        self.metric = metric
+        self.mutable_capacity = mutable_capacity
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._state = _State((), np.empty((0, dimensions or 0), np.float32),
+                             np.empty(0, np.int64), 0, np.zeros(0, bool))
+        # Published version the index was loaded from, if any
+        self.version: Optional[str] = None
+
+    def __len__(self) -> int:
+        """Number of live vectors."""
+        state = self._state
+        return self._physical_rows(state) - self._dead_rows(state)
+
+    @property
+    def next_vector_id(self) -> int:
+        """One past the highest vector ID held, live or tombstoned."""
+        state = self._state
+        blocks = [segment.ids for segment in state.segments]
+        blocks.append(state.mutable_ids[:state.mutable_count])
+        return max((int(ids.max()) + 1 for ids in blocks if len(ids)), default=0)
+
+    def vector_ids(self) -> np.ndarray:
+        """Get the IDs of all live vectors."""
+        state = self._state
+        blocks = [segment.ids for segment in state.segments]
+        blocks.append(state.mutable_ids[:state.mutable_count])
+        ids = np.concatenate(blocks)
+        return ids[~self._is_dead(state.dead, ids)]
+
+    def replace(self, other: "SegmentedIndex") -> None:
+        """Serve the vectors of another index from now on, e.g. a newly loaded one."""
+        with self._compact_lock, self._lock:
+            self.dimensions = other.dimensions
+            self.metric = other.metric
+            self.mutable_capacity = other.mutable_capacity
+            self.version = other.version
+            self._state = other._state
+
+    def stats(self) -> dict:
+        """Describe segments and tombstones for monitoring and compaction."""
+        state = self._state
+        rows = self._physical_rows(state)
+        dead = self._dead_rows(state)
+        return {
+            "segments": len(state.segments),
+            "mutable_rows": state.mutable_count,
+            "rows": rows,
+            "tombstones": dead,
+            "tombstone_ratio": dead / rows if rows else 0.0
+        }
+
+    def add(self, vector_ids: Sequence[int], vectors: np.ndarray) -> None:
+        """Append vectors to the mutable segment, sealing it when full."""
+        ids = np.asarray(vector_ids, dtype=np.int64)
+        vectors = self._prepare(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("vector_ids and vectors must have the same length")
+
+        with self._lock:
+            state = self._state
+            segments = state.segments
+            buffer, buffer_ids, count = state.mutable_vectors, state.mutable_ids, state.mutable_count
+            dead = self._grown_dead(state.dead, int(ids.max()) + 1 if len(ids) else 0)
+            # Re-adding a vector ID revives it
+            dead[ids] = False
+
+            offset = 0
+            while offset < len(ids):
+                if count == len(buffer_ids):
+                    if count:
+                        segments = segments + (Segment(buffer[:count], buffer_ids[:count]),)
+                    buffer = np.empty((self.mutable_capacity, self.dimensions), np.float32)
+                    buffer_ids = np.empty(self.mutable_capacity, np.int64)
+                    count = 0
+                take = min(len(ids) - offset, len(buffer_ids) - count)
+                buffer[count:count + take] = vectors[offset:offset + take]
+                buffer_ids[count:count + take] = ids[offset:offset + take]
+                count += take
+                offset += take
+
+            self._state = _State(segments, buffer, buffer_ids, count, dead)
+
+    def delete(self, vector_ids: Sequence[int]) -> None:
+        """Tombstone vectors; they stop matching immediately."""
+        ids = np.asarray(vector_ids, dtype=np.int64)
+        if not len(ids):
+            return
+        with self._lock:
+            state = self._state
+            dead = self._grown_dead(state.dead, int(ids.max()) + 1)
+            dead[ids] = True
+            if dead is not state.dead:
+                self._state = _State(state.segments, state.mutable_vectors,
+                                     state.mutable_ids, state.mutable_count, dead)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        filter_fn: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        boosts: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the ``k`` nearest live vectors.
+
+        Args:
+            query: Query vector
+            k: Number of results
+            filter_fn: Optional callable mapping an array of vector IDs to a
+                boolean mask of the rows allowed in the result
+            boosts: Optional scores added to each row's similarity before
+                ranking, indexed by vector ID; rows past its end get none
+
+        Returns:
+            Tuple of vector IDs and scores, best first
+        """
+        state = self._state
+        if self.dimensions is None:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        query = self._prepare(query.reshape(1, -1))[0]
+
+        blocks = list(state.segments)
+        if state.mutable_count:
+            count = state.mutable_count
+            blocks.append(Segment(state.mutable_vectors[:count], state.mutable_ids[:count]))
+
+        best_ids, best_scores = [], []
+        for segment in blocks:
+            scores = segment.vectors @ query
+            if boosts is not None:
+                scores = scores + _lookup(boosts, segment.ids)
+            allowed = ~self._is_dead(state.dead, segment.ids)
+            if filter_fn is not None:
+                allowed &= filter_fn(segment.ids)
+            scores = np.where(allowed, scores, -np.inf)
+            top = _top_k(scores, k)
+            top = top[np.isfinite(scores[top])]
+            best_ids.append(segment.ids[top])
+            best_scores.append(scores[top])
+
+        if not best_ids:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        ids = np.concatenate(best_ids)
+        scores = np.concatenate(best_scores)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return ids[order], scores[order]
+
+    def compact(self, max_segment_rows: Optional[int] = None) -> bool:
+        """
+        Merge sealed segments and drop tombstoned rows.
+
+        The merge runs without holding the write lock, so searches and
+        writes continue while it works. Only the segments it merged are
+        swapped out; segments sealed in the meantime are kept.
+
+        Returns:
+            True if anything was compacted
+        """
+        with self._compact_lock:
+            state = self._state
+            has_dead = [self._is_dead(state.dead, segment.ids).any() for segment in state.segments]
+            candidates = [
+                segment for segment, dead in zip(state.segments, has_dead)
+                if dead or max_segment_rows is None or len(segment) < max_segment_rows
+            ]
+            if len(candidates) < 2 and not any(has_dead):
+                return False
+
+            vectors = np.concatenate([segment.vectors for segment in candidates])
+            ids = np.concatenate([segment.ids for segment in candidates])
+            keep = ~self._is_dead(state.dead, ids)
+            merged = Segment(vectors[keep], ids[keep])
+
+            with self._lock:
+                current = self._state
+                merged_ids = {id(segment) for segment in candidates}
+                remaining = tuple(s for s in current.segments if id(s) not in merged_ids)
+                segments = ((merged,) if len(merged) else ()) + remaining
+                self._state = _State(segments, current.mutable_vectors, current.mutable_ids,
+                                     current.mutable_count, current.dead)
+
+            logger.info(
+                "Compacted %d segments into %d rows, purged %d tombstones",
+                len(candidates), len(merged), int((~keep).sum())
+            )
+            return True
+
+    def save(self, path: str, version: Optional[str] = None) -> str:
+        """
+        Write all segments, the mutable rows and tombstones to the directory ``path``.
+
+        Only one process should write a directory; ``publish_index`` in
+        ``app.services.indexing`` gives each version a directory of its own.
+        """
+        os.makedirs(path, exist_ok=True)
+        state = self._state
+        blocks = list(state.segments)
+        if state.mutable_count:
+            count = state.mutable_count
+            blocks.append(Segment(state.mutable_vectors[:count], state.mutable_ids[:count]))
+
+        files = []
+        for i, segment in enumerate(blocks):
+            name = f"segment-{i:05d}.npz"
+            _write_atomic(os.path.join(path, name),
+                          lambda f: np.savez(f, vectors=segment.vectors, ids=segment.ids))
+            files.append(name)
+        _write_atomic(os.path.join(path, TOMBSTONES_FILE), lambda f: np.save(f, state.dead))
+
+        manifest = {
+            "version": version,
+            "dimensions": self.dimensions,
+            "metric": self.metric,
+            "mutable_capacity": self.mutable_capacity,
+            "segments": files
+        }
+        # Written last: a directory without a manifest is incomplete
+        _write_atomic(os.path.join(path, MANIFEST_FILE),
+                      lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentedIndex":
+        """Load an index written by ``save``."""
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        index = cls(manifest["dimensions"], manifest["metric"], manifest["mutable_capacity"])
+        index.version = manifest.get("version")
+        segments = []
+        for name in manifest["segments"]:
+            with np.load(os.path.join(path, name)) as data:
+                segments.append(Segment(data["vectors"], data["ids"]))
+        dead = np.load(os.path.join(path, TOMBSTONES_FILE))
+        index._state = _State(tuple(segments), index._state.mutable_vectors,
+                              index._state.mutable_ids, 0, dead)
+        return index
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("vectors must be a 2-D array")
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(
+                f"Expected {self.dimensions}-dimensional vectors, got {vectors.shape[1]}"
+            )
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors
+
+    @staticmethod
+    def _grown_dead(dead: np.ndarray, size: int) -> np.ndarray:
+        if size <= len(dead):
+            return dead
+        grown = np.zeros(max(size, 2 * len(dead)), dtype=bool)
+        grown[:len(dead)] = dead
+        return grown
+
+    @staticmethod
+    def _is_dead(dead: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        in_range = ids < len(dead)
+        return in_range & dead[np.where(in_range, ids, 0)] if len(dead) else np.zeros(len(ids), bool)
+
+    @staticmethod
+    def _physical_rows(state: _State) -> int:
+        return sum(len(segment) for segment in state.segments) + state.mutable_count
+
+    def _dead_rows(self, state: _State) -> int:
+        dead = sum(int(self._is_dead(state.dead, s.ids).sum()) for s in state.segments)
+        return dead + int(self._is_dead(state.dead, state.mutable_ids[:state.mutable_count]).sum())
+
+def _write_atomic(path: str, write: Callable[[BinaryIO], None]) -> None:
+    """Write a file through a temporary name, so readers see it whole or not at all."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def current_index_version(root: Optional[str] = None) -> Optional[str]:
+    """Get the published index version to serve, or None if none was published."""
+    try:
+        with open(os.path.join(root or settings.INDEX_PATH, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def index_version_path(version: str, root: Optional[str] = None) -> str:
+    """Get the directory of a published index version."""
+    return os.path.join(root or settings.INDEX_PATH, VERSIONS_DIR, version)
+
+def set_current_index_version(version: str, root: Optional[str] = None) -> None:
+    """Point readers at a published version, atomically."""
+    root = root or settings.INDEX_PATH
+    _write_atomic(os.path.join(root, CURRENT_FILE), lambda f: f.write(version.encode("ascii")))
+
+def published_index_path(root: Optional[str] = None) -> Optional[str]:
+    """
+    Get the directory holding the index to serve.
+
+    Returns:
+        The current published version, else ``root`` itself if it holds an
+        index saved before versions existed, else None
+    """
+    root = root or settings.INDEX_PATH
+    version = current_index_version(root)
+    if version is not None:
+        return index_version_path(version, root)
+    if os.path.exists(os.path.join(root, MANIFEST_FILE)):
+        return root
+    return None
+
+def _lookup(values: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Per-ID values, 0 for IDs past the end of ``values``."""
+    in_range = ids < len(values)
+    return np.where(in_range, values[np.where(in_range, ids, 0)], 0) if len(values) else 0
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the ``k`` highest scores, unordered."""
+    if len(scores) <= k:
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k)[:k]
+
+class Compactor:
+    """
+    Compacts an index when it gets fragmented.
+
+    Segments of ``max_segment_rows`` rows or more are only rewritten to
+    purge tombstones, so a run does not keep re-merging the large
+    segments earlier runs produced.
+    """
+
+    def __init__(
+        self,
+        index: SegmentedIndex,
+        max_segments: int = 8,
+        max_tombstone_ratio: float = 0.1,
+        max_segment_rows: Optional[int] = None
+    ) -> None:
+        self.index = index
+        self.max_segments = max_segments
+        self.max_tombstone_ratio = max_tombstone_ratio
+        self.max_segment_rows = max_segment_rows
+
+    def needs_compaction(self) -> bool:
+        """Check whether the index has too many segments or tombstones."""
+        stats = self.index.stats()
+        return (
+            stats["segments"] > self.max_segments
+            or stats["tombstone_ratio"] > self.max_tombstone_ratio
+        )
+
+    def run_once(self) -> bool:
+        """Compact the index if it needs it."""
+        if not self.needs_compaction():
+            return False
+        return self.index.compact(max_segment_rows=self.max_segment_rows)
+
+_vector_index: Optional[SegmentedIndex] = None
+_vector_index_lock = threading.Lock()
+
+def get_vector_index() -> SegmentedIndex:
+    """Get the process-wide vector index, loading the published one on first use."""
+    global _vector_index
+    if _vector_index is None:
+        with _vector_index_lock:
+            if _vector_index is None:
+                path = published_index_path()
+                _vector_index = SegmentedIndex.load(path) if path else SegmentedIndex()
+    return _vector_index
@@ -0,0 +1,289 @@
+
+"""Write-behind buffer for low-priority writes.
+
+Writes whose result a request does not need, such as feedback and login
+times, are queued in memory and written in batches by a background thread
+instead of committing on the request path. Every write kind has a handler
+that applies a list of payloads in an open transaction; handlers must be
+idempotent, since a write may be applied more than once.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.message import upsert_feedback
+from app.crud.user import record_last_logins
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+WriteHandler = Callable[[Session, List[Dict[str, Any]]], None]
+
+# Handlers by write kind; payloads must be JSON-serializable to be spooled
+WRITE_HANDLERS: Dict[str, WriteHandler] = {
+    "feedback": upsert_feedback,
+    "last_login": record_last_logins,
+}
+
+class WriteBehindQueue:
+    """
+    Background thread writing queued writes in batches.
+
+    ``enqueue`` only appends to a list. The thread writes everything
+    pending in one transaction every ``interval`` seconds, or as soon as
+    ``max_batch`` writes are waiting. A batch that fails is put back and
+    retried, except writes the database rejects as invalid, which are
+    logged and dropped. ``stop`` flushes what is pending; anything that
+    still cannot be written is saved under ``spool_path`` and replayed by
+    the next ``start``, so writes survive a graceful restart.
+
+    While the database is failing, no more than ``max_pending`` writes are
+    held in memory: the queue is spilled to the spool instead, and the
+    thread replays it once a flush succeeds again. Spool files a worker
+    had claimed for replay but not finished when it died are replayed
+    too, by the next worker to start.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval: float = 0.5,
+        max_batch: int = 500,
+        max_pending: int = 10000,
+        spool_path: Optional[str] = None,
+        handlers: Optional[Dict[str, WriteHandler]] = None
+    ) -> None:
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max(max_pending, max_batch)
+        self.spool_path = spool_path
+        self.handlers = WRITE_HANDLERS if handlers is None else handlers
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        # Replayed spool files, removed once their writes are committed
+        self._claimed: List[str] = []
+        # Whether spool files may be waiting for this process to replay
+        self._spooled = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> None:
+        """
+        Queue a write.
+
+        When the queue is not running, e.g. in scripts, the write is
+        applied immediately instead. A write that finds ``max_pending``
+        writes waiting spills them all to the spool.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown write kind: {kind}")
+        if self._thread is None:
+            self._write([(kind, payload)])
+            return
+        with self._lock:
+            self._pending.append((kind, payload))
+            full = len(self._pending) >= self.max_batch
+            overflow = len(self._pending) >= self.max_pending
+        if overflow and self.spool_path:
+            self._spool()
+        elif full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """
+        Write everything pending in one transaction.
+
+        Returns:
+            Number of writes applied
+
+        Raises:
+            Exception: The batch failed; its writes are queued again
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+            claimed, self._claimed = self._claimed, []
+        if batch:
+            try:
+                self._write_isolating_invalid(batch)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch
+                    self._claimed[:0] = claimed
+                raise
+        for path in claimed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(batch)
+
+    def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        by_kind: Dict[str, List[Dict[str, Any]]] = {}
+        for kind, payload in batch:
+            by_kind.setdefault(kind, []).append(payload)
+        db = self.session_factory()
+        try:
+            for kind, payloads in by_kind.items():
+                self.handlers[kind](db, payloads)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_isolating_invalid(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        try:
+            self._write(batch)
+            return
+        except (IntegrityError, DataError):
+            pass
+        # Some write is invalid, e.g. feedback on a deleted message, and
+        # would fail every retry; write one at a time and drop the invalid
+        for write in batch:
+            try:
+                self._write([write])
+            except (IntegrityError, DataError) as e:
+                logger.error("Dropping invalid %s write: %s", write[0], e.orig)
+
+    def start(self) -> None:
+        """Replay spooled writes and start flushing in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._spooled = True
+        self._replay()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the thread and flush, spooling writes that cannot be written."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final write-behind flush failed")
+            self._spool()
+
+    def _run(self) -> None:
+        healthy = True
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if healthy and self._spooled:
+                # Only bring spilled writes back while they can be written
+                self._replay()
+            try:
+                self.flush()
+                healthy = True
+            except Exception:
+                healthy = False
+                logger.exception("Write-behind flush failed, retrying")
+                # Back off instead of retrying on every wake-up
+                self._stop.wait(self.interval)
+
+    def _spool(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            claimed, self._claimed = self._claimed, []
+        if not batch or not self.spool_path:
+            if batch:
+                logger.error("Lost %d queued writes, no spool path is set", len(batch))
+            return
+        os.makedirs(self.spool_path, exist_ok=True)
+        path = os.path.join(self.spool_path, f"pending-{os.getpid()}-{time.time_ns()}.jsonl")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            for kind, payload in batch:
+                f.write(json.dumps({"kind": kind, "payload": payload}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._spooled = True
+        # Their writes are in the new file now
+        for claimed_path in claimed:
+            os.remove(claimed_path)
+        logger.warning("Spooled %d queued writes to %s", len(batch), path)
+
+    def _replayable(self) -> List[str]:
+        """Spool files waiting for replay, oldest first: spilled ones and those claimed by dead workers."""
+        paths = glob.glob(os.path.join(self.spool_path, "pending-*.jsonl"))
+        for path in glob.glob(os.path.join(self.spool_path, "claimed-*.jsonl")):
+            pid = int(os.path.basename(path).split("-")[1])
+            if pid != os.getpid() and not _process_alive(pid):
+                paths.append(path)
+        return sorted(paths, key=_spooled_at)
+
+    def _replay(self) -> None:
+        """Queue spooled writes, stopping once ``max_pending`` are waiting."""
+        # Cleared first, so a spill while this runs is picked up next time
+        self._spooled = False
+        if not self.spool_path:
+            return
+        paths = self._replayable()
+        replayed: List[Tuple[str, Dict[str, Any]]] = []
+        claimed = []
+        for path in paths:
+            if len(replayed) + len(self) >= self.max_pending:
+                self._spooled = True
+                break
+            claimed_path = os.path.join(
+                self.spool_path, f"claimed-{os.getpid()}-{_spooled_name(path)}"
+            )
+            try:
+                # Only one worker wins the rename of each file
+                os.rename(path, claimed_path)
+            except FileNotFoundError:
+                continue
+            with open(claimed_path) as f:
+                writes = [json.loads(line) for line in f if line.strip()]
+            replayed.extend((write["kind"], write["payload"]) for write in writes)
+            claimed.append(claimed_path)
+            logger.info("Replaying %d spooled writes from %s", len(writes), path)
+        with self._lock:
+            # Spooled writes are older than anything queued since
+            self._pending[:0] = replayed
+            self._claimed.extend(claimed)
+
+def _spooled_name(path: str) -> str:
+    """Name a spool file was written under, also once it was claimed."""
+    name = os.path.basename(path)
+    return name.split("-", 2)[2] if name.startswith("claimed-") else name
+
+def _spooled_at(path: str) -> int:
+    # pending-<pid>-<time_ns>.jsonl
+    return int(_spooled_name(path)[:-len(".jsonl")].rsplit("-", 1)[1])
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by someone else
+        return True
+    return True
+
+WRITE_BEHIND = WriteBehindQueue(
+    interval=settings.WRITE_BEHIND_INTERVAL_MS / 1000,
+    max_batch=settings.WRITE_BEHIND_MAX_BATCH,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+    spool_path=settings.WRITE_BEHIND_SPOOL_PATH
+)
@@ -0,0 +1,128 @@
+
+"""Benchmark of LLM admission control against a slow fake provider.
+
+The fake provider serves ``--capacity`` calls at its base latency; beyond
+that, calls share it and every call slows down in proportion, like a
+saturated model server. Requests arrive at ``--rate`` per second, more
+than it can serve, and each client gives up after ``--client-timeout``.
+Without admission control calls pile up until nearly every one times out;
+with the adaptive limiter the excess is shed early and the rest are
+answered in time.
+
+Usage:
+    python benchmarks/bench_admission.py --rate 40 --capacity 8 --latency 0.5 --duration 20
+"""
+import argparse
+import asyncio
+import contextlib
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Sequence, Tuple
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.admission import AdaptiveLimiter, Overloaded
+from app.services.providers import ChatProvider
+from harness import summarize
+
+class SlowChatProvider(ChatProvider):
+    """Fake provider whose latency grows once it is over capacity."""
+
+    def __init__(self, capacity: int, latency: float) -> None:
+        self.capacity = capacity
+        self.latency = latency
+        self.inflight = 0
+
+    async def complete(self, messages: Sequence[Tuple[str, str]]) -> str:
+        self.inflight += 1
+        try:
+            await asyncio.sleep(self.latency * max(1.0, self.inflight / self.capacity))
+            return "reply"
+        finally:
+            self.inflight -= 1
+
+async def run(limiter, args) -> Dict[str, Any]:
+    provider = SlowChatProvider(args.capacity, args.latency)
+    rng = random.Random(args.seed)
+    latencies = []
+    counts = {"ok": 0, "shed": 0, "timeout": 0}
+    limits = []
+    max_queue = 0
+
+    async def request() -> None:
+        nonlocal max_queue
+        start = time.perf_counter()
+        slot = limiter.slot() if limiter else contextlib.nullcontext()
+        try:
+            async with asyncio.timeout(args.client_timeout):
+                async with slot:
+                    await provider.complete([("user", "question")])
+        except Overloaded:
+            counts["shed"] += 1
+            return
+        except TimeoutError:
+            counts["timeout"] += 1
+            return
+        counts["ok"] += 1
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        tasks.append(asyncio.create_task(request()))
+        if limiter:
+            limits.append(limiter.limit)
+            max_queue = max(max_queue, limiter.queue_depth)
+        # Poisson arrivals
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+
+    return {
+        **counts,
+        "goodput": counts["ok"] / args.duration,
+        "latency": summarize(latencies) if latencies else None,
+        "limit": (min(limits), sum(limits) / len(limits), max(limits)) if limits else None,
+        "max_queue": max_queue
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=40.0, help="Arrivals per second")
+    parser.add_argument("--capacity", type=int, default=8, help="Calls the provider serves at full speed")
+    parser.add_argument("--latency", type=float, default=0.5, help="Provider latency under capacity")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--client-timeout", type=float, default=5.0)
+    parser.add_argument("--queue-timeout", type=float, default=2.0)
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"offered {args.rate:.0f}/s, provider serves {args.capacity / args.latency:.0f}/s "
+        f"at {args.latency * 1000:.0f} ms"
+    )
+    print(f"{'mode':>10} {'ok':>6} {'shed':>6} {'timeout':>7} {'ok/s':>6} {'p50 ms':>7} "
+          f"{'p95 ms':>7} {'limit min/avg/max':>18} {'queue':>5}")
+    for mode in ("unlimited", "adaptive"):
+        limiter = None
+        if mode == "adaptive":
+            limiter = AdaptiveLimiter(
+                initial_limit=args.capacity,
+                max_queue=args.queue_size,
+                queue_timeout=args.queue_timeout
+            )
+        result = asyncio.run(run(limiter, args))
+        latency = result["latency"]
+        p50 = f"{latency['median'] * 1000:.0f}" if latency else "-"
+        p95 = f"{latency['p95'] * 1000:.0f}" if latency else "-"
+        limit = "/".join(f"{value:.1f}" for value in result["limit"]) if result["limit"] else "-"
+        print(
+            f"{mode:>10} {result['ok']:>6} {result['shed']:>6} {result['timeout']:>7} "
+            f"{result['goodput']:>6.1f} {p50:>7} {p95:>7} {limit:>18} {result['max_queue']:>5}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+
+"""Microbenchmark for persisting assistant messages with sources.
+
+Compares the per-object ORM write path (add each Source, flush, commit,
+refresh) with the bulk core INSERT path used by ``create_message`` and
+reports rows/sec for both.
+
+Usage:
+    python benchmarks/bench_create_message.py --messages 500 --sources 15
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.crud.message import create_message
+from app.db.base import (
+    Base,
+    Conversation as ConversationModel,
+    Message as MessageModel,
+    Source as SourceModel,
+    User as UserModel
+)
+from app.schemas.message import SourceBase
+
+def create_message_orm(db, content, role, conversation_id, sources=None):
+    """Baseline write path: one ORM object per source plus a refresh."""
+    db_message = MessageModel(content=content, role=role, conversation_id=conversation_id)
+    db.add(db_message)
+    db.flush()
+    for source in sources or []:
+        db.add(SourceModel(
+            message_id=db_message.id,
+            document_id=source.documentId,
+            title=source.title,
+            content=source.content,
+            page=source.page,
+            score=source.score
+        ))
+    db.commit()
+    db.refresh(db_message)
+    return db_message
+
+def make_sources(count: int, content_size: int):
+    """Build ``count`` sources carrying ``content_size`` characters of text."""
+    text = ("lorem ipsum dolor sit amet " * (content_size // 27 + 1))[:content_size]
+    return [
+        SourceBase(
+            title=f"Document {i}",
+            content=text,
+            score=1.0 - i / (count + 1),
+            documentId=f"doc-{i}",
+            page=i
+        )
+        for i in range(count)
+    ]
+
+def run(write, database_url: str, messages: int, sources) -> float:
+    """Write ``messages`` assistant messages and return rows/sec."""
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+
+    user = UserModel(name="bench", email=f"bench-{time.time_ns()}@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    conversation = ConversationModel(title="bench", user_id=user.id)
+    db.add(conversation)
+    db.commit()
+    conversation_id = conversation.id
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        write(db, "answer", "assistant", conversation_id, sources)
+    elapsed = time.perf_counter() - start
+
+    db.close()
+    engine.dispose()
+    return messages * (len(sources) + 1) / elapsed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--sources", type=int, default=15)
+    parser.add_argument("--content-size", type=int, default=1000)
+    parser.add_argument("--database-url", default=None,
+                        help="Defaults to a temporary SQLite file per run")
+    args = parser.parse_args()
+
+    sources = make_sources(args.sources, args.content_size)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, write in (("orm", create_message_orm), ("bulk", create_message)):
+            url = args.database_url or f"sqlite:///{tmp}/{name}.db"
+            rate = run(write, url, args.messages, sources)
+            print(f"{name:>5}: {rate:12,.0f} rows/sec")
+
+if __name__ == "__main__":
+    main()
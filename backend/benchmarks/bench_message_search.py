@@ -0,0 +1,137 @@
+
+"""Latency of full-text search over a user's messages.
+
+Seeds a database with messages of Zipf-distributed words spread over many
+users, then times ``search_messages`` for one user with common, mid and
+rare words, a two-word query and a phrase, on the database's full-text
+index and on the in-process index. The first in-process search also
+builds the user's index, so it is reported separately.
+
+Usage:
+    python benchmarks/bench_message_search.py --messages 1000000 --users 1000
+    python benchmarks/bench_message_search.py --database postgresql://localhost/bench
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from harness import measure
+import app.services.message_search as message_search
+from app.db.base import (
+    Base,
+    Conversation as ConversationModel,
+    Message as MessageModel,
+    User as UserModel
+)
+
+def make_vocabulary(size: int, rng: random.Random):
+    """Pronounceable made-up words and their cumulative Zipf weights, most frequent first."""
+    syllables = [consonant + vowel for consonant in "bdgklmnprstv" for vowel in "aeiou"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words, list(accumulate(1.0 / (rank + 1) for rank in range(size)))
+
+def seed(engine, args, rng: random.Random):
+    """Fill the database; returns the ID of the user to search as and the vocabulary."""
+    Base.metadata.create_all(bind=engine)
+    words, cum_weights = make_vocabulary(args.vocabulary, rng)
+    user_ids = [f"00000000-0000-4000-8000-{i:012d}" for i in range(args.users)]
+    conversations = args.users * args.conversations_per_user
+    per_conversation = max(1, args.messages // conversations)
+    start_time = datetime(2026, 1, 1)
+
+    with engine.begin() as conn:
+        conn.execute(insert(UserModel), [
+            {"id": user_id, "name": f"user {i}", "email": f"user{i}@example.com", "password_hash": "x"}
+            for i, user_id in enumerate(user_ids)
+        ])
+        conn.execute(insert(ConversationModel), [
+            {"id": f"conversation-{i}", "title": f"Conversation {i}", "user_id": user_ids[i % args.users]}
+            for i in range(conversations)
+        ])
+
+    started = time.perf_counter()
+    batch = []
+    with engine.begin() as conn:
+        for i in range(conversations * per_conversation):
+            length = max(3, int(rng.expovariate(1 / args.words)))
+            batch.append({
+                "id": f"message-{i}",
+                "conversation_id": f"conversation-{i // per_conversation}",
+                "content": " ".join(rng.choices(words, cum_weights=cum_weights, k=length)),
+                "role": "user" if i % 2 == 0 else "assistant",
+                "created_at": start_time + timedelta(seconds=i)
+            })
+            if len(batch) == 10000:
+                conn.execute(insert(MessageModel), batch)
+                batch.clear()
+        if batch:
+            conn.execute(insert(MessageModel), batch)
+    print(
+        f"Seeded {conversations * per_conversation:,} messages of {args.users:,} users "
+        f"in {time.perf_counter() - started:.0f}s"
+    )
+    return user_ids[args.users // 2], words
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", help="Database URL, a temporary SQLite file by default")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--conversations-per-user", type=int, default=20)
+    parser.add_argument("--words", type=int, default=40, help="Mean words per message")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database or f"sqlite:///{os.path.join(tmp, 'search.db')}"
+        engine = create_engine(url)
+        user_id, words = seed(engine, args, random.Random(args.seed))
+        queries = {
+            "common": words[0],
+            "mid": words[100],
+            "rare": words[2000],
+            "two words": f"{words[3]} {words[40]}",
+            "phrase": f'"{words[0]} {words[1]}"'
+        }
+
+        db = sessionmaker(bind=engine)()
+        for backend in ("auto", "memory"):
+            message_search.settings.MESSAGE_SEARCH_BACKEND = backend
+            name = message_search.get_search_backend(db)
+            if backend == "memory":
+                start = time.perf_counter()
+                message_search.search_messages(db, user_id, words[0], args.limit)
+                print(f"{name:>10} build index: {(time.perf_counter() - start) * 1000:8.1f} ms")
+            for label, query in queries.items():
+                result = measure(
+                    lambda: message_search.search_messages(db, user_id, query, args.limit),
+                    rounds=args.rounds
+                )
+                print(
+                    f"{name:>10} {label:>11}: {result['median'] * 1000:8.2f} ms median  "
+                    f"{result['p95'] * 1000:8.2f} ms p95"
+                )
+        db.close()
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
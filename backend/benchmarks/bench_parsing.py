@@ -0,0 +1,121 @@
+
+"""Benchmark for page-parallel PDF text extraction.
+
+Generates a corpus of text PDFs, then extracts them page by page with
+``iter_pages`` on process pools of increasing size and reports pages/sec.
+A pool of one worker is the sequential baseline.
+
+Usage:
+    python benchmarks/bench_parsing.py --documents 8 --pages 200 --workers 1 2 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.services.chunking import chunk_pages
+from app.services.parsing import iter_pages
+
+WORDS = (
+    "policy retrieval assistant document section clause employee leave "
+    "request approval manager security access compliance report quarter"
+).split()
+
+def page_lines(document: int, page: int, lines: int):
+    """Build deterministic lines of text for one page."""
+    for line in range(lines):
+        seed = document * 7919 + page * 104729 + line * 31
+        yield " ".join(WORDS[(seed + i * 13) % len(WORDS)] for i in range(12))
+
+def write_pdf(path: str, document: int, pages: int, lines: int = 45) -> None:
+    """
+    Write a minimal text-only PDF with ``pages`` pages of Helvetica text.
+
+    Objects: 1 catalog, 2 page tree, 3 font, then a page and a content
+    stream per page.
+    """
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for page in range(pages):
+        page_id, content_id = 4 + 2 * page, 5 + 2 * page
+        kids.append(f"{page_id} 0 R")
+        text = ["BT /F1 10 Tf 12 TL 50 770 Td"]
+        for line in page_lines(document, page, lines):
+            text.append(f"({line}) Tj T*")
+        text.append("ET")
+        stream = "\n".join(text).encode("latin-1")
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode("latin-1")
+        objects[content_id] = (
+            f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream"
+        )
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode("latin-1")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += f"{object_id} 0 obj\n".encode("latin-1") + objects[object_id] + b"\nendobj\n"
+    xref = len(out)
+    size = max(objects) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode("latin-1")
+    for object_id in range(1, size):
+        out += f"{offsets[object_id]:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+def run(paths, workers: int, pages_per_task: int):
+    """Extract and chunk every file, returning (chunks, seconds)."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Start the workers before timing
+        list(pool.map(abs, range(workers)))
+        start = time.perf_counter()
+        chunks = 0
+        for path in paths:
+            pages = iter_pages(path, "application/pdf", executor=pool, pages_per_task=pages_per_task)
+            chunks += sum(1 for _ in chunk_pages(pages))
+        elapsed = time.perf_counter() - start
+    return chunks, elapsed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for document in range(args.documents):
+            path = os.path.join(tmp, f"doc-{document}.pdf")
+            write_pdf(path, document, args.pages)
+            paths.append(path)
+        total_pages = args.documents * args.pages
+        size_mb = sum(os.path.getsize(path) for path in paths) / 1e6
+        print(f"corpus: {args.documents} PDFs, {total_pages} pages, {size_mb:.1f} MB")
+
+        baseline = None
+        for workers in args.workers:
+            chunks, elapsed = run(paths, workers, args.pages_per_task)
+            rate = total_pages / elapsed
+            baseline = baseline or rate
+            print(
+                f"workers={workers:<3} {rate:8.0f} pages/sec  "
+                f"{chunks} chunks  {elapsed:6.2f}s  x{rate / baseline:.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+
+"""Benchmark of history page serialization and compression.
+
+Builds a page of messages whose assistant replies cite ``--sources``
+sources of ``--source-chars`` characters each, then for every
+``source_content`` mode reports the time to render it with the standard
+library encoder, pydantic's own JSON encoder and orjson, and the bytes on
+the wire uncompressed, gzipped and, with the brotli package installed,
+brotli-compressed through ``CompressionMiddleware``, with the time
+compression adds.
+
+Usage:
+    python benchmarks/bench_serialization.py --messages 100 --sources 5 --source-chars 1000
+"""
+import argparse
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse, Response
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.compression import CompressionMiddleware, ORJSONResponse, brotli
+from app.core.config import settings
+from app.schemas.message import Message
+from app.schemas.pagination import PaginatedResponse
+from harness import measure
+
+PAGE = TypeAdapter(PaginatedResponse[Message])
+
+WORDS = (
+    "retrieval augmented generation answers questions from documents chunked "
+    "embedded indexed ranked cited policy report contract invoice section "
+    "table figure revenue quarter employee benefit security access"
+).split()
+
+def build_page(args, source_chars) -> Any:
+    """A validated history page, sources cut like ``get_messages`` does."""
+    rng = random.Random(0)
+
+    def text(chars: int) -> str:
+        words = []
+        length = 0
+        while length < chars:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)[:chars]
+
+    start = datetime(2024, 1, 1)
+    items = []
+    for i in range(args.messages):
+        sources = []
+        if i % 2:
+            for j in range(args.sources):
+                content = text(args.source_chars)
+                truncated = source_chars is not None and len(content) > source_chars
+                sources.append({
+                    "id": f"source-{i}-{j}",
+                    "title": text(30),
+                    "content": content[:source_chars] if truncated else content,
+                    "contentTruncated": truncated,
+                    "score": rng.random(),
+                    "documentId": f"document-{j}",
+                    "page": j + 1,
+                    "chunkId": f"chunk-{j}",
+                    "startOffset": 0,
+                    "endOffset": args.source_chars
+                })
+        items.append({
+            "id": f"message-{i}",
+            "content": text(args.reply_chars if i % 2 else 80),
+            "role": "assistant" if i % 2 else "user",
+            "created_at": start + timedelta(seconds=30 * i),
+            "sources": sources
+        })
+    return PAGE.validate_python({
+        "items": items,
+        "total": args.messages,
+        "page": 1,
+        "page_size": args.messages,
+        "total_pages": 1
+    })
+
+async def send_through_middleware(body: bytes, accept_encoding: str) -> bytes:
+    """Send a JSON body through the compression middleware, return the wire bytes."""
+    app = CompressionMiddleware(
+        Response(body, media_type="application/json"),
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+    )
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", accept_encoding.encode())]
+    }
+    chunks = []
+
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": b""}
+
+    async def send(message) -> None:
+        if message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(chunks)
+
+def encode(body: bytes, accept_encoding: str) -> bytes:
+    return asyncio.run(send_through_middleware(body, accept_encoding))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--sources", type=int, default=5, help="Sources per assistant message")
+    parser.add_argument("--source-chars", type=int, default=1000)
+    parser.add_argument("--reply-chars", type=int, default=800)
+    parser.add_argument("--rounds", type=int, default=30)
+    args = parser.parse_args()
+
+    modes: Dict[str, Any] = {
+        "full": None,
+        "truncated": settings.SOURCE_PREVIEW_CHARS,
+        "none": 0
+    }
+    codings: Tuple[str, ...] = ("gzip", "br") if brotli is not None else ("gzip",)
+    print(f"{args.messages} messages, {args.sources} sources of {args.source_chars} chars per reply")
+    print(
+        f"{'sources':>9} {'stdlib ms':>9} {'pydantic ms':>11} {'orjson ms':>9} {'raw KB':>8}  "
+        + "  ".join(f"{coding + ' KB':>8} {'+ms':>6}" for coding in codings)
+    )
+    for mode, source_chars in modes.items():
+        page = build_page(args, source_chars)
+        encoders = {
+            "stdlib": lambda: JSONResponse(PAGE.dump_python(page, mode="json")).body,
+            "pydantic": lambda: PAGE.dump_json(page),
+            "orjson": lambda: ORJSONResponse(PAGE.dump_python(page, mode="json")).body,
+        }
+        times = {name: measure(render, rounds=args.rounds)["mean"] for name, render in encoders.items()}
+        body = encoders["orjson"]()
+        # Compression time is measured on top of passing the body through
+        baseline = measure(lambda: encode(body, "identity"), rounds=args.rounds)["mean"]
+        columns = []
+        for coding in codings:
+            wire = encode(body, coding)
+            seconds = measure(lambda: encode(body, coding), rounds=args.rounds)["mean"] - baseline
+            columns.append(f"{len(wire) / 1024:>8.1f} {max(0.0, seconds) * 1000:>6.2f}")
+        print(
+            f"{mode:>9} {times['stdlib'] * 1000:>9.2f} {times['pydantic'] * 1000:>11.2f} "
+            f"{times['orjson'] * 1000:>9.2f} {len(body) / 1024:>8.1f}  " + "  ".join(columns)
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+
+"""Storage and history read latency for copied vs shared source text.
+
+Seeds the same conversation twice: once with every source carrying its own
+copy of the chunk text (the layout before the ``chunks`` table), once with
+sources referencing shared chunks. Reports the database size and the time
+to read history pages through ``get_messages``.
+
+Usage:
+    python benchmarks/bench_source_storage.py --messages 5000 --pool 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.crud.message import create_message, get_messages
+from app.db.base import (
+    Base,
+    generate_uuid,
+    Conversation as ConversationModel,
+    Source as SourceModel,
+    User as UserModel
+)
+from app.schemas.message import SourceBase
+
+def make_pool(size: int, content_size: int, rng: random.Random):
+    """Build a pool of chunks that answers cite."""
+    words = ["policy", "vpn", "access", "leave", "expense", "device", "travel", "security"]
+    pool = []
+    for i in range(size):
+        text = " ".join(rng.choice(words) for _ in range(content_size // 7))[:content_size]
+        pool.append(SourceBase(
+            title=f"Document {i % 50}",
+            content=text,
+            score=0.5,
+            documentId=f"doc-{i % 50}",
+            page=i % 30
+        ))
+    return pool
+
+def seed(db, conversation_id: str, pool, messages: int, per_message: int, shared: bool, seed_value: int):
+    """Write ``messages`` assistant answers citing popular chunks."""
+    rng = random.Random(seed_value)
+    # Popularity follows a long tail, like real incident questions
+    weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+    for _ in range(messages):
+        sources = rng.choices(pool, weights=weights, k=per_message)
+        if shared:
+            create_message(db, "answer", "assistant", conversation_id, sources)
+            continue
+        message = create_message(db, "answer", "assistant", conversation_id)
+        db.execute(insert(SourceModel), [
+            {
+                "id": generate_uuid(),
+                "message_id": message.id,
+                "document_id": source.documentId,
+                "title": source.title,
+                "content": source.content,
+                "page": source.page,
+                "score": source.score
+            }
+            for source in sources
+        ])
+        db.commit()
+
+def run(path: str, shared: bool, args) -> dict:
+    """Seed one database and measure its size and history read latency."""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+
+    user = UserModel(name="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    conversation = ConversationModel(title="bench", user_id=user.id)
+    db.add(conversation)
+    db.commit()
+    conversation_id = conversation.id
+
+    pool = make_pool(args.pool, args.content_size, random.Random(args.seed))
+    seed(db, conversation_id, pool, args.messages, args.sources, shared, args.seed)
+    db.close()
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    size = os.path.getsize(path)
+
+    pages = args.messages // args.page_size
+    db = sessionmaker(bind=engine, autoflush=False)()
+    start = time.perf_counter()
+    for page in range(1, pages + 1):
+        get_messages(db, conversation_id, page=page, page_size=args.page_size)
+        db.expunge_all()
+    elapsed = time.perf_counter() - start
+    db.close()
+    engine.dispose()
+
+    return {"size_mb": size / 1e6, "page_ms": elapsed / pages * 1000}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--sources", type=int, default=10, help="Sources per message")
+    parser.add_argument("--pool", type=int, default=200, help="Distinct chunks cited")
+    parser.add_argument("--content-size", type=int, default=1200)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, shared in (("copied", False), ("shared", True)):
+            result = run(os.path.join(tmp, f"{name}.db"), shared, args)
+            print(
+                f"{name:>7}: {result['size_mb']:8.1f} MB  "
+                f"{result['page_ms']:7.2f} ms/page of {args.page_size}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+
+"""Startup benchmark: time to first request and memory after boot.
+
+Starts the API with uvicorn in a subprocess against a scratch database,
+polls until it answers its first request and reads its resident set size
+from /proc. It also checks that no heavy provider SDK is imported at boot.
+Exits non-zero when a budget is exceeded; tests/test_startup.py enforces
+the same budget in the test suite.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5 --max-seconds 4 --max-rss-mb 200
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND = Path(__file__).parent.parent
+
+# Budget for the median time to first request and RSS after it
+MAX_SECONDS = 4.0
+MAX_RSS_MB = 200.0
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = (
+    "langchain", "langchain_core", "langchain_openai", "openai", "tiktoken",
+    "boto3", "botocore", "pymongo", "pypdf", "docx",
+)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError(f"No VmRSS for process {pid}")
+
+def _environment(tmp: str) -> Dict[str, str]:
+    return {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp}/startup.db",
+        "STORAGE_TYPE": "local",
+        "STORAGE_PATH": os.path.join(tmp, "storage"),
+        "INDEX_PATH": os.path.join(tmp, "index"),
+    }
+
+def heavy_imports() -> List[str]:
+    """Heavy modules loaded by importing the app."""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = subprocess.run(
+            [
+                sys.executable, "-c",
+                "import json, sys, main; "
+                f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+            ],
+            cwd=BACKEND, env=_environment(tmp), capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_startup(timeout: float = 60.0) -> Tuple[float, float]:
+    """
+    Start one server process and time it to its first response.
+
+    Returns:
+        (seconds to the first response, RSS in MB after it)
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/api/v1/auth/me"
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND, env=_environment(tmp)
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Server exited with {process.returncode}")
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("Server did not answer in time")
+                try:
+                    urllib.request.urlopen(url, timeout=1)
+                    break
+                except urllib.error.HTTPError:
+                    # Unauthenticated, but answered
+                    break
+                except OSError:
+                    time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            return elapsed, _rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=MAX_SECONDS,
+                        help="Budget for the median time to first request")
+    parser.add_argument("--max-rss-mb", type=float, default=MAX_RSS_MB,
+                        help="Budget for the median RSS after the first request")
+    args = parser.parse_args()
+
+    loaded = heavy_imports()
+    runs = [measure_startup() for _ in range(args.runs)]
+    seconds = statistics.median(run[0] for run in runs)
+    rss = statistics.median(run[1] for run in runs)
+    print(f"time to first request: median {seconds:.2f}s  (runs: "
+          + ", ".join(f"{run[0]:.2f}" for run in runs) + ")")
+    print(f"RSS after boot:        median {rss:.0f} MB")
+    print(f"heavy modules at boot: {', '.join(loaded) or 'none'}")
+
+    failures = []
+    if seconds > args.max_seconds:
+        failures.append(f"startup {seconds:.2f}s over budget {args.max_seconds:.2f}s")
+    if rss > args.max_rss_mb:
+        failures.append(f"RSS {rss:.0f} MB over budget {args.max_rss_mb:.0f} MB")
+    if loaded:
+        failures.append(f"imported at boot: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
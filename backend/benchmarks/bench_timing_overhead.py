@@ -0,0 +1,64 @@
+
+"""Microbenchmark for the request timing middleware.
+
+Drives a trivial ASGI app directly, with and without ``TimingMiddleware``,
+and reports the added cost per request. A request with three spans is
+measured too, as the message pipeline records several.
+
+Usage:
+    python benchmarks/bench_timing_overhead.py --requests 100000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.metrics import TimingMiddleware, span
+
+class _Route:
+    path = "/api/v1/chat/messages"
+
+def make_app(spans: int):
+    """Build an ASGI app that sets a route and answers 200 with no body."""
+    async def app(scope, receive, send):
+        scope["route"] = _Route
+        for i in range(spans):
+            with span(f"stage{i}"):
+                pass
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+async def drive(app, requests: int) -> float:
+    """Call ``app`` ``requests`` times and return seconds per request."""
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "POST", "path": "/"}, receive, send)
+    return (time.perf_counter() - start) / requests
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100000)
+    args = parser.parse_args()
+
+    for spans in (0, 3):
+        app = make_app(spans)
+        bare = asyncio.run(drive(app, args.requests))
+        timed = asyncio.run(drive(TimingMiddleware(app), args.requests))
+        print(
+            f"spans={spans}  bare {bare * 1e6:6.2f} us  timed {timed * 1e6:6.2f} us  "
+            f"overhead {(timed - bare) * 1e6:6.2f} us/request"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+
+"""Benchmark of pre-forked serving with 1, 4 and 8 workers.
+
+Seeds a scratch database and vector index with ``scripts/synthetic.py``,
+then for each worker count starts ``gunicorn -c gunicorn.conf.py``, drives
+a history/listing load over HTTP and reports throughput and memory. RSS
+counts pages shared between workers once per process; PSS divides them
+among the processes sharing them, so the PSS total shows what the
+preloaded index really costs.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 4 8 --documents 5000 --dimensions 384
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+BACKEND = Path(__file__).parent.parent
+# Add parent directory to path so we can import app modules
+sys.path.append(str(BACKEND))
+sys.path.append(str(BACKEND / "scripts"))
+
+from load import make_scenario, run_load
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _children(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name is in parentheses and may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+def _memory_mb(pid: int) -> Dict[str, float]:
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                memory[name.lower()] = int(value.split()[0]) / 1024
+    return memory
+
+def _wait_ready(url: str, process: subprocess.Popen, workers: int, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        if len(_children(process.pid)) >= workers:
+            try:
+                httpx.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                pass
+        time.sleep(0.1)
+    raise RuntimeError("Workers did not start in time")
+
+def run(workers: int, env: Dict[str, str], headers, conversations, args) -> Dict[str, float]:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}", "--log-level", "warning"
+        ],
+        cwd=BACKEND,
+        env={**env, "WEB_WORKERS": str(workers), "WEB_MAX_REQUESTS": "0"}
+    )
+    try:
+        _wait_ready(f"{base_url}/api/v1/auth/me", process, workers)
+
+        async def drive():
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+                scenario = make_scenario(args.scenario, headers, conversations)
+                return await run_load(client, scenario, args.concurrency, args.duration)
+
+        report = asyncio.run(drive())
+        pids = [process.pid] + _children(process.pid)
+        memory = [_memory_mb(pid) for pid in pids]
+
+        start = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+        drain = time.perf_counter() - start
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    return {
+        "throughput": report["throughput"],
+        "p95_ms": report["latency"]["p95"] * 1000,
+        "errors": report["errors"],
+        "rss_mb": sum(m["rss"] for m in memory),
+        "pss_mb": sum(m["pss"] for m in memory),
+        "worker_rss_mb": max(m["rss"] for m in memory[1:]),
+        "shutdown_s": drain
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--chunks-per-document", type=int, default=20)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--scenario", choices=["list", "history"], default="history")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{tmp}/workers.db",
+            "STORAGE_TYPE": "local",
+            "STORAGE_PATH": os.path.join(tmp, "storage"),
+            "INDEX_PATH": os.path.join(tmp, "index"),
+            "SLOW_QUERY_MS": "0",
+            "RATE_LIMIT_ENABLED": "false",
+        }
+        # Settings are read at import, so point them at the scratch
+        # directory before any app module is loaded
+        os.environ.update(env)
+        from app.core.security import create_access_token
+        from app.db.session import engine
+        from synthetic import seed
+
+        ids = seed(
+            engine,
+            users=20,
+            conversations_per_user=20,
+            messages_per_conversation=40,
+            documents=args.documents,
+            chunks_per_document=args.chunks_per_document,
+            dimensions=args.dimensions
+        )
+        engine.dispose()
+        index_mb = args.documents * args.chunks_per_document * args.dimensions * 4 / 1e6
+        print(f"index: {args.documents * args.chunks_per_document} vectors, {index_mb:.0f} MB")
+
+        headers = {"Authorization": f"Bearer {create_access_token(ids['users'][1])}"}
+        conversations = ids["conversations"][20:40]
+        print(
+            f"{'workers':>7} {'req/s':>8} {'p95 ms':>8} {'errors':>6} {'RSS MB':>8} "
+            f"{'PSS MB':>8} {'worker RSS':>10} {'drain s':>7}"
+        )
+        for workers in args.workers:
+            result = run(workers, env, headers, conversations, args)
+            print(
+                f"{workers:>7} {result['throughput']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['errors']:>6} {result['rss_mb']:>8.0f} {result['pss_mb']:>8.0f} "
+                f"{result['worker_rss_mb']:>10.0f} {result['shutdown_s']:>7.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+
+"""Timing helpers and machine-readable results for the benchmark suite.
+
+Results are written as JSON with the commit and machine they were taken
+on, so runs from two commits can be compared with ``run.py --compare``.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Summary statistics for a list of durations in seconds."""
+    ordered = sorted(samples)
+    mean = statistics.fmean(ordered)
+    return {
+        "rounds": len(ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": mean,
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "stddev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "ops": 1 / mean if mean else 0.0
+    }
+
+def measure(fn: Callable[[], Any], rounds: int = 20, warmup: int = 1) -> Dict[str, float]:
+    """Time ``rounds`` calls of ``fn`` after ``warmup`` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+async def measure_async(
+    fn: Callable[[], Awaitable[Any]], rounds: int = 20, warmup: int = 1
+) -> Dict[str, float]:
+    """Async variant of ``measure``; calls run one after another."""
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Results:
+    """Benchmark results collected during one run."""
+
+    def __init__(self) -> None:
+        self.benchmarks: List[Dict[str, Any]] = []
+
+    def add(
+        self,
+        name: str,
+        stats: Dict[str, float],
+        params: Optional[Dict[str, Any]] = None,
+        **extra: Any
+    ) -> None:
+        """
+        Record a benchmark and print a one-line summary.
+
+        Args:
+            name: Unique name, e.g. ``api.login``
+            stats: Output of ``measure`` or ``summarize``
+            params: Parameters the benchmark ran with
+            extra: Additional figures such as throughput
+        """
+        self.benchmarks.append({
+            "name": name, "params": params or {}, "stats": stats, "extra": extra
+        })
+        figures = "  ".join(f"{key}={value:.1f}" for key, value in extra.items())
+        print(
+            f"{name:<40} median {stats['median'] * 1000:9.3f} ms  "
+            f"p95 {stats['p95'] * 1000:9.3f} ms  {figures}"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "machine": {
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "processor": platform.machine(),
+                "cpus": os.cpu_count()
+            },
+            "benchmarks": self.benchmarks
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.1) -> int:
+    """
+    Print median changes between two result files.
+
+    Returns:
+        Number of benchmarks more than ``threshold`` slower than the baseline
+    """
+    previous = {bench["name"]: bench for bench in baseline["benchmarks"]}
+    print(f"\ncompared with {baseline.get('commit') or 'baseline'}:")
+    regressions = 0
+    for bench in current["benchmarks"]:
+        old = previous.get(bench["name"])
+        if old is None:
+            continue
+        change = bench["stats"]["median"] / old["stats"]["median"] - 1
+        marker = ""
+        if change > threshold:
+            marker = "  SLOWER"
+            regressions += 1
+        elif change < -threshold:
+            marker = "  faster"
+        print(f"{bench['name']:<40} {change * 100:+7.1f}%{marker}")
+    return regressions
@@ -0,0 +1,176 @@
+
+"""Concurrent load driver for the chat API.
+
+Runs a scenario from many concurrent asyncio workers for a fixed duration
+and reports throughput and latency percentiles. It can target a running
+server, or the app in-process through ``httpx.ASGITransport`` as the suite
+in ``run.py`` does.
+
+Usage:
+    python benchmarks/load.py --url http://localhost:8000 \\
+        --email user1@example.com --password benchmark-password \\
+        --scenario mixed --concurrency 32 --duration 30
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+import httpx
+
+from harness import summarize
+
+API = "/api/v1"
+
+# One request of a scenario: receives the client and a running request
+# number, and returns the response
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+async def run_load(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    concurrency: int = 16,
+    duration: float = 10.0
+) -> Dict[str, Any]:
+    """
+    Drive ``scenario`` from ``concurrency`` workers for ``duration`` seconds.
+
+    Returns:
+        Request and error counts, throughput and latency statistics
+    """
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, next(counter))
+                status_code = response.status_code
+            except httpx.HTTPError:
+                status_code = 0
+            latencies.append(time.perf_counter() - start)
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    errors = sum(count for code, count in statuses.items() if not 200 <= code < 400)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "throughput": len(latencies) / elapsed,
+        "latency": summarize(latencies) if latencies else None
+    }
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> Dict[str, str]:
+    """Log in and get the authorization header."""
+    response = await client.post(
+        f"{API}/auth/login", data={"username": email, "password": password}
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def make_scenario(
+    name: str,
+    headers: Dict[str, str],
+    conversation_ids: Sequence[str],
+    seed: int = 0
+) -> Scenario:
+    """
+    Build a named scenario for one logged-in user.
+
+    ``list`` pages through conversations, ``history`` reads random message
+    pages, ``chat`` sends messages, and ``mixed`` does all three at a
+    20/70/10 ratio.
+    """
+    rng = random.Random(seed)
+
+    async def list_conversations(client, i):
+        return await client.get(
+            f"{API}/chat/conversations",
+            params={"page": i % 3 + 1, "page_size": 20},
+            headers=headers
+        )
+
+    async def history(client, i):
+        conversation_id = rng.choice(conversation_ids)
+        return await client.get(
+            f"{API}/chat/conversations/{conversation_id}/messages",
+            params={"page": rng.randint(1, 3), "page_size": 20},
+            headers=headers
+        )
+
+    async def chat(client, i):
+        return await client.post(
+            f"{API}/chat/messages",
+            json={
+                "conversation_id": rng.choice(conversation_ids),
+                "message": f"What does the leave policy say? ({i})"
+            },
+            headers=headers
+        )
+
+    async def mixed(client, i):
+        roll = rng.random()
+        if roll < 0.2:
+            return await list_conversations(client, i)
+        if roll < 0.9:
+            return await history(client, i)
+        return await chat(client, i)
+
+    scenarios = {
+        "list": list_conversations, "history": history, "chat": chat, "mixed": mixed
+    }
+    return scenarios[name]
+
+async def main_async(args) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        headers = await login(client, args.email, args.password)
+        response = await client.get(
+            f"{API}/chat/conversations", params={"page_size": 100}, headers=headers
+        )
+        response.raise_for_status()
+        conversation_ids = [item["id"] for item in response.json()["items"]]
+        if not conversation_ids:
+            raise SystemExit("The user has no conversations; seed with scripts/synthetic.py")
+        scenario = make_scenario(args.scenario, headers, conversation_ids)
+        return await run_load(client, scenario, args.concurrency, args.duration)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", default="user1@example.com")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--scenario", choices=["list", "history", "chat", "mixed"], default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    latency = report["latency"] or {}
+    print(
+        f"{report['requests']} requests, {report['errors']} errors, "
+        f"{report['throughput']:.1f} req/s"
+    )
+    if latency:
+        print(
+            f"latency median {latency['median'] * 1000:.1f} ms  "
+            f"p95 {latency['p95'] * 1000:.1f} ms  max {latency['max'] * 1000:.1f} ms"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
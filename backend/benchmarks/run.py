@@ -0,0 +1,325 @@
+
+"""Benchmark suite for the API and the RAG pipeline.
+
+Suites:
+    api        login, conversation listing, message history paging and
+               send_message with a stubbed model, plus a short concurrent
+               load run, all against the app in-process
+    vector     vector search over random embeddings at several index sizes
+    chunking   chunking throughput over synthetic pages
+    ingestion  PDF parse, chunk, embed and index end to end
+    startup    time from process start to the first response, and RSS
+
+Every run uses a fresh temporary database and storage directory seeded by
+``scripts/synthetic.py``, and can write its results as JSON to compare two
+commits.
+
+Usage:
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --suites vector --vector-sizes 10000 100000 1000000
+    python benchmarks/run.py --output new.json --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND = Path(__file__).parent.parent
+# Add parent directory to path so we can import app modules
+sys.path.append(str(BACKEND))
+sys.path.append(str(BACKEND / "scripts"))
+
+from harness import Results, compare, measure, measure_async, summarize
+
+SUITES = ("api", "vector", "chunking", "ingestion", "startup")
+
+def fake_embed(dimensions: int):
+    """Embedding stub returning deterministic random unit vectors."""
+    rng = np.random.default_rng(0)
+
+    def embed(texts):
+        vectors = rng.standard_normal((len(texts), dimensions)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return embed
+
+async def _api_suite(results: Results, args) -> None:
+    import httpx
+
+    import app.services.rag as rag
+    from app.core.security import create_access_token
+    from app.db.session import engine
+    from load import make_scenario, run_load
+    from main import app
+    from synthetic import PASSWORD, seed
+
+    ids = seed(
+        engine,
+        users=args.users,
+        conversations_per_user=args.conversations_per_user,
+        messages_per_conversation=args.messages_per_conversation
+    )
+
+    async def process_query(db, query, history, context_filter=None):
+        # Stands in for retrieval and the model call so only the API and
+        # database work is measured
+        return "Synthetic answer.", []
+
+    rag.process_query = process_query
+
+    user_id = ids["users"][1]
+    headers = {"Authorization": f"Bearer {create_access_token(user_id)}"}
+    conversations = ids["conversations"][args.conversations_per_user:2 * args.conversations_per_user]
+    last_page = max(1, args.messages_per_conversation // 20)
+    params = {
+        "users": args.users,
+        "conversations_per_user": args.conversations_per_user,
+        "messages_per_conversation": args.messages_per_conversation
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login():
+            response = await client.post(
+                "/api/v1/auth/login",
+                data={"username": "user1@example.com", "password": PASSWORD}
+            )
+            response.raise_for_status()
+
+        async def list_conversations():
+            response = await client.get("/api/v1/chat/conversations", headers=headers)
+            response.raise_for_status()
+
+        def history(page):
+            async def call():
+                response = await client.get(
+                    f"/api/v1/chat/conversations/{conversations[0]}/messages",
+                    params={"page": page, "page_size": 20},
+                    headers=headers
+                )
+                response.raise_for_status()
+            return call
+
+        async def send_message():
+            response = await client.post(
+                "/api/v1/chat/messages",
+                json={"conversation_id": conversations[1], "message": "What is the leave policy?"},
+                headers=headers
+            )
+            response.raise_for_status()
+
+        # Password hashing dominates login, so fewer rounds
+        results.add("api.login", await measure_async(login, rounds=5), params)
+        results.add(
+            "api.list_conversations", await measure_async(list_conversations, args.rounds), params
+        )
+        results.add("api.history_first_page", await measure_async(history(1), args.rounds), params)
+        results.add(
+            "api.history_last_page", await measure_async(history(last_page), args.rounds), params
+        )
+        results.add("api.send_message", await measure_async(send_message, args.rounds), params)
+
+        scenario = make_scenario("mixed", headers, conversations)
+        report = await run_load(client, scenario, args.concurrency, args.load_duration)
+        results.add(
+            "api.load_mixed",
+            report["latency"],
+            {**params, "concurrency": args.concurrency, "duration": args.load_duration},
+            throughput=report["throughput"],
+            errors=report["errors"]
+        )
+
+def api_suite(results: Results, args) -> None:
+    asyncio.run(_api_suite(results, args))
+
+def vector_suite(results: Results, args) -> None:
+    from app.services.vector_index import SegmentedIndex
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.rounds, args.dimensions)).astype(np.float32)
+    for size in args.vector_sizes:
+        index = SegmentedIndex(args.dimensions)
+        start = time.perf_counter()
+        for offset in range(0, size, 50_000):
+            count = min(50_000, size - offset)
+            vectors = rng.standard_normal((count, args.dimensions)).astype(np.float32)
+            index.add(np.arange(offset, offset + count), vectors)
+        index.compact()
+        build = time.perf_counter() - start
+        # One in a hundred vectors deleted, as after ordinary churn
+        index.delete(np.arange(0, size, 100))
+        allowed = rng.random(size) < 0.5
+
+        params = {"size": size, "dimensions": args.dimensions, "k": 10}
+        queue = iter(np.tile(queries, (3, 1)))
+        results.add(
+            f"vector.search.{size}",
+            measure(lambda: index.search(next(queue), k=10), rounds=args.rounds),
+            params,
+            build_seconds=build
+        )
+        queue = iter(np.tile(queries, (3, 1)))
+        results.add(
+            f"vector.search_filtered.{size}",
+            measure(
+                lambda: index.search(next(queue), k=10, filter_fn=lambda ids: allowed[ids]),
+                rounds=args.rounds
+            ),
+            params
+        )
+        # Feedback boosts, as written by scripts/compute_feedback_boosts.py
+        boosts = (0.05 * rng.uniform(-1, 1, size)).astype(np.float32)
+        queue = iter(np.tile(queries, (3, 1)))
+        results.add(
+            f"vector.search_boosted.{size}",
+            measure(lambda: index.search(next(queue), k=10, boosts=boosts), rounds=args.rounds),
+            params
+        )
+
+def chunking_suite(results: Results, args) -> None:
+    from app.services.chunking import chunk_pages
+    from app.services.parsing import PageText
+    from synthetic import Generator
+
+    gen = Generator(0)
+    pages = [PageText(page + 1, gen.text(500)) for page in range(args.pages)]
+    characters = sum(len(page.text) for page in pages)
+    stats = measure(lambda: sum(1 for _ in chunk_pages(pages)), rounds=5)
+    results.add(
+        "chunking.chunk_pages",
+        stats,
+        {"pages": args.pages, "characters": characters},
+        pages_per_sec=args.pages / stats["median"],
+        mb_per_sec=characters / stats["median"] / 1e6
+    )
+
+def ingestion_suite(results: Results, args) -> None:
+    from sqlalchemy import insert
+
+    from app.db.base import Base, Document, User
+    from app.db.session import SessionLocal, engine
+    from app.services.chunk_store import ChunkStore
+    from app.services.ingestion import ingest_document
+    from app.services.storage import get_storage
+    from app.services.vector_index import SegmentedIndex
+    from bench_parsing import write_pdf
+    from synthetic import Generator
+
+    Base.metadata.create_all(bind=engine)
+    storage = get_storage()
+    gen = Generator(1)
+    user_id = gen.id("user", 0)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{
+            "id": user_id, "name": "Ingestion", "email": "ingestion@example.com",
+            "password_hash": "-", "role": "admin"
+        }])
+
+    embed = fake_embed(args.dimensions)
+    index, store = SegmentedIndex(args.dimensions), ChunkStore()
+    samples = []
+    # The first round is untimed; it also spawns the parse workers
+    for document in range(4):
+        document_id = gen.id("document", document)
+        key = f"documents/{document_id}.pdf"
+        path = storage.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_pdf(path, document, args.ingestion_pages)
+        with engine.begin() as conn:
+            conn.execute(insert(Document), [{
+                "id": document_id, "title": f"Ingestion {document}",
+                "file_name": f"{document}.pdf", "file_size": os.path.getsize(path),
+                "mime_type": "application/pdf", "status": "queued",
+                "storage_path": key, "user_id": user_id
+            }])
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            ingest_document(db, document_id, embed, index=index, store=store)
+            if document:
+                samples.append(time.perf_counter() - start)
+        finally:
+            db.close()
+
+    stats = summarize(samples)
+    results.add(
+        "ingestion.pdf",
+        stats,
+        {"pages": args.ingestion_pages, "dimensions": args.dimensions},
+        pages_per_sec=args.ingestion_pages / stats["median"]
+    )
+
+def startup_suite(results: Results, args) -> None:
+    from bench_startup import measure_startup
+
+    runs = [measure_startup() for _ in range(3)]
+    results.add(
+        "startup.first_request",
+        summarize([seconds for seconds, _ in runs]),
+        rss_mb=statistics.median(rss for _, rss in runs)
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Results file to compare medians against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Slowdown reported as a regression")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--conversations-per-user", type=int, default=20)
+    parser.add_argument("--messages-per-conversation", type=int, default=100)
+    # Kept below the default connection pool size (5 + 10 overflow): async
+    # endpoints wait for a connection on the event loop
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--load-duration", type=float, default=5.0)
+    parser.add_argument("--vector-sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--ingestion-pages", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Settings are read at import, so point them at the scratch
+        # directory before any app module is loaded
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        os.environ["STORAGE_TYPE"] = "local"
+        os.environ["STORAGE_PATH"] = os.path.join(tmp, "storage")
+        os.environ["INDEX_PATH"] = os.path.join(tmp, "index")
+        os.environ.setdefault("SLOW_QUERY_MS", "0")
+        # Load tests send far more than a user's budget
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+        results = Results()
+        suites = {
+            "api": api_suite,
+            "vector": vector_suite,
+            "chunking": chunking_suite,
+            "ingestion": ingestion_suite,
+            "startup": startup_suite
+        }
+        for name in args.suites:
+            suites[name](results, args)
+
+        from app.services.parsing import shutdown_parse_pool
+        shutdown_parse_pool()
+
+    current = results.to_dict()
+    if args.output:
+        results.save(args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(current, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
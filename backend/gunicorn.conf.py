@@ -0,0 +1,43 @@
+
+"""Gunicorn settings for production serving.
+
+Usage:
+    gunicorn main:app -c gunicorn.conf.py
+
+The app, its settings and the vector index are loaded once in the master
+before workers are forked, so workers share those pages copy-on-write.
+Workers never write the index: they load each version the ingestion job
+publishes within ``INDEX_RELOAD_INTERVAL`` seconds.
+Workers are recycled after ``WEB_MAX_REQUESTS`` requests, and on SIGTERM
+they stop accepting connections and get ``WEB_GRACEFUL_TIMEOUT`` seconds to
+finish in-flight requests.
+"""
+import gc
+import os
+
+from app.core.config import settings
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = settings.WEB_WORKERS or os.cpu_count() or 1
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+max_requests = settings.WEB_MAX_REQUESTS
+max_requests_jitter = settings.WEB_MAX_REQUESTS_JITTER
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT
+timeout = 120
+keepalive = 5
+
+def on_starting(server):
+    """Load shared state in the master, after the app is imported."""
+    from app.services.indexing import load_index
+
+    load_index()
+    # Keep the garbage collector from writing to the preloaded objects'
+    # headers in the workers, which would copy their pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master."""
+    from app.db.session import engine
+
+    engine.dispose(close=False)
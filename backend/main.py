@@ -1,11 +1,38 @@
 
 """Entry point for the RAG Assistant API."""
-import uvicorn
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.api_v1.api import api_router
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.metrics import TimingMiddleware
+from app.core.profiling import (
+    ProfilingMiddleware,
+    start_background_sampler,
+    stop_background_sampler
+)
+from app.services.indexing import IndexReloader
+from app.services.parsing import shutdown_parse_pool
+from app.services.write_behind import WRITE_BEHIND
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background workers for the lifetime of the application."""
+    # Workers only read the index; the ingestion job compacts and publishes
+    # new versions
+    reloader = IndexReloader(interval=settings.INDEX_RELOAD_INTERVAL)
+    reloader.start()
+    WRITE_BEHIND.start()
+    start_background_sampler(settings.PROFILE_BACKGROUND_INTERVAL_MS / 1000)
+    yield
+    stop_background_sampler()
+    # Flush queued writes before the worker exits
+    WRITE_BEHIND.stop()
+    reloader.stop()
+    shutdown_parse_pool()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -14,6 +41,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url=f"{settings.API_V1_STR}/docs",
     redoc_url=f"{settings.API_V1_STR}/redoc",
+    lifespan=lifespan,
 )
 
 # Set up CORS
@@ -25,8 +53,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses for clients that accept it
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+)
+
+# Profile requests from admins that ask for it
+app.add_middleware(ProfilingMiddleware)
+
+# Time every request; added last so it wraps the other middleware
+app.add_middleware(TimingMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 if __name__ == "__main__":
+    # Imported here so importing the app does not load the server
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
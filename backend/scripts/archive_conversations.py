@@ -0,0 +1,42 @@
+
+"""Archive conversations that have been idle for a while.
+
+Moves the messages of conversations without activity for ``--idle-days``
+days to compressed files in storage, keeping a stub row per conversation.
+Meant to run periodically, e.g. nightly from cron; archived conversations
+are restored as soon as they are opened.
+
+Usage:
+    python scripts/archive_conversations.py --idle-days 180 --limit 1000
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.archive import archive_idle_conversations
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--idle-days", type=int, default=settings.ARCHIVE_IDLE_DAYS)
+    parser.add_argument("--limit", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        archived = archive_idle_conversations(
+            db, datetime.utcnow() - timedelta(days=args.idle_days), limit=args.limit
+        )
+    finally:
+        db.close()
+    print(f"Archived {archived} conversations in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
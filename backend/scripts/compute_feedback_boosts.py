@@ -0,0 +1,77 @@
+
+"""Compute retrieval score boosts from answer feedback.
+
+Reads every rated answer and the chunks it cited, computes one additive
+boost per vector ID and writes it to ``INDEX_PATH/feedback_boost.npy``,
+with the parameters and counts it was computed from alongside in
+``feedback_boost.json``. The same data and parameters always give the
+same array. Running searches pick the new array up within
+``FEEDBACK_BOOST_CHECK_INTERVAL`` seconds.
+
+Usage:
+    python scripts/compute_feedback_boosts.py --strength 0.05 --prior 5 --document-weight 0.5
+    python scripts/compute_feedback_boosts.py --dry-run
+"""
+import argparse
+import hashlib
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.db.session import SessionLocal
+from app.services.feedback_boost import (
+    compute_boosts,
+    load_chunk_documents,
+    load_feedback_signals,
+    save_boosts
+)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--strength", type=float, default=0.05, help="Largest boost, in similarity units")
+    parser.add_argument("--prior", type=float, default=5.0, help="Neutral pseudo-ratings per chunk")
+    parser.add_argument("--document-weight", type=float, default=0.5)
+    parser.add_argument("--output", help="Array path, defaults to INDEX_PATH/feedback_boost.npy")
+    parser.add_argument("--dry-run", action="store_true", help="Print the summary without writing")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        signals = load_feedback_signals(db)
+        chunk_documents = load_chunk_documents(db)
+    finally:
+        db.close()
+    boosts = compute_boosts(
+        signals,
+        chunk_documents,
+        strength=args.strength,
+        prior=args.prior,
+        document_weight=args.document_weight
+    )
+
+    info = {
+        "created_at": datetime.utcnow().isoformat(),
+        "strength": args.strength,
+        "prior": args.prior,
+        "document_weight": args.document_weight,
+        "rated_answers": int(len(np.unique(signals.message))),
+        "sources": int(len(signals.vector_id)),
+        "vector_ids": int(len(boosts)),
+        "boosted": int(np.count_nonzero(boosts > 0)),
+        "demoted": int(np.count_nonzero(boosts < 0)),
+        "sha256": hashlib.sha256(boosts.tobytes()).hexdigest()
+    }
+    for key, value in info.items():
+        print(f"{key}: {value}")
+    if len(boosts):
+        print(f"range: {boosts.min():+.4f} .. {boosts.max():+.4f}")
+    if not args.dry_run:
+        print(f"written to {save_boosts(boosts, info, args.output)}")
+
+if __name__ == "__main__":
+    main()
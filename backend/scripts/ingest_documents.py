@@ -0,0 +1,98 @@
+"""Ingest queued documents: parse, chunk, embed and index them.
+
+Completed uploads are queued for ingestion; this job works through the
+queue. It is the only writer of the vector index and chunk store: after
+every pass that ingested something, and at least every
+``--publish-interval`` seconds, it syncs them with the chunks table,
+compacts the index if it is fragmented and publishes a new version under
+``INDEX_PATH``, which serving workers load.
+A lock file keeps a second instance from starting.
+
+Usage:
+    python scripts/ingest_documents.py
+    python scripts/ingest_documents.py --watch --interval 10
+"""
+import argparse
+import fcntl
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.indexing import publish_index, sync_index_with_database
+from app.services.ingestion import ingest_queued_documents
+from app.services.parsing import shutdown_parse_pool
+from app.services.vector_index import Compactor, get_vector_index
+
+LOCK_FILE = "ingest.lock"
+
+def ingest_pass(limit: int, publish: bool) -> int:
+    """
+    Ingest queued documents until the queue is empty.
+
+    Publishes a new index version if anything was ingested or ``publish``
+    is set, compacting the index first if it needs it.
+    """
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ingested = ingest_queued_documents(db, limit=limit)
+            total += ingested
+            if ingested < limit:
+                break
+        if total or publish:
+            sync_index_with_database(db)
+            Compactor(
+                get_vector_index(),
+                max_segments=settings.INDEX_MAX_SEGMENTS,
+                max_tombstone_ratio=settings.INDEX_MAX_TOMBSTONE_RATIO,
+                max_segment_rows=settings.INDEX_COMPACTION_MAX_SEGMENT_ROWS
+            ).run_once()
+            publish_index()
+    finally:
+        db.close()
+    return total
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=settings.INGEST_BATCH_SIZE, help="Documents per batch")
+    parser.add_argument("--watch", action="store_true", help="Keep polling the queue")
+    parser.add_argument("--interval", type=float, default=settings.INGEST_POLL_INTERVAL)
+    parser.add_argument("--publish-interval", type=float, default=settings.INDEX_PUBLISH_INTERVAL)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    os.makedirs(settings.INDEX_PATH, exist_ok=True)
+    lock = open(os.path.join(settings.INDEX_PATH, LOCK_FILE), "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        sys.exit("Another ingestion job is running")
+
+    published_at = time.monotonic()
+    try:
+        while True:
+            start = time.monotonic()
+            ingested = ingest_pass(args.limit, publish=start - published_at >= args.publish_interval)
+            if ingested or start - published_at >= args.publish_interval:
+                published_at = start
+            if ingested or not args.watch:
+                print(f"Ingested {ingested} documents in {time.monotonic() - start:.1f}s")
+            if not args.watch:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_parse_pool()
+        lock.close()
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,25 @@ from pathlib import Path
 # Add parent directory to path so we can import app modules
 sys.path.append(str(Path(__file__).parent.parent))
 
+from alembic import command
+from alembic.config import Config
 from sqlalchemy.orm import Session
 from app.db.base import Base, User, LLMSettings, EmbeddingSettings, ChunkingSettings, VectorDBSettings, SystemPrompt
 from app.db.session import engine, SessionLocal
 from app.core.security import get_password_hash
 
+def alembic_config() -> Config:
+    """Alembic configuration of the backend, wherever the script runs from."""
+    backend = Path(__file__).parent.parent
+    config = Config(str(backend / "alembic.ini"))
+    config.set_main_option("script_location", str(backend / "alembic"))
+    return config
+
 def init_db() -> None:
     """Initialize database with required tables and default data."""
     Base.metadata.create_all(bind=engine)
+    # The tables are already current, so later upgrades start from here
+    command.stamp(alembic_config(), "head")
     
     db = SessionLocal()
     create_default_data(db)
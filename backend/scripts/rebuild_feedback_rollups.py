@@ -0,0 +1,24 @@
+
+"""Recompute the feedback rollups from the stored feedback.
+
+Run once after upgrading to fill the rollups with older feedback, or
+periodically, e.g. nightly from cron, to repair any drift.
+"""
+import sys
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.crud.analytics import rebuild_feedback_rollups
+from app.db.session import SessionLocal
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        rebuild_feedback_rollups(db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
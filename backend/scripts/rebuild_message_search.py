@@ -0,0 +1,40 @@
+
+"""Rebuild the full-text index of message text.
+
+The index is kept in step by triggers, so this is only needed when it
+fell out of step, e.g. after messages were bulk-loaded with the triggers
+dropped. On SQLite it refills the FTS5 table from ``messages`` and merges
+its segments; Postgres keeps its tsvector column up to date by itself.
+
+Usage:
+    python scripts/rebuild_message_search.py
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.db.session import SessionLocal
+from app.services.message_search import get_search_backend, rebuild_search_index
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        backend = get_search_backend(db)
+        if backend != "sqlite":
+            print(f"Nothing to rebuild, searches use the {backend} backend")
+            return
+        start = time.perf_counter()
+        count = rebuild_search_index(db)
+    finally:
+        db.close()
+    print(f"Indexed {count} messages in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+
+"""Deterministic synthetic data for benchmarks and load tests.
+
+Generates users, tags with role access, documents with chunks and
+optionally their embeddings, and conversations whose assistant messages
+cite chunks. The same arguments always produce the same database.
+
+Rows are written with core bulk inserts on one connection, committed every
+``commit_every`` rows. Texts are drawn from a pool generated up front and
+IDs are derived from row numbers, so generating a row costs little more
+than building its dict; the ``large`` scale (about 12M rows) loads in
+minutes on SQLite.
+
+Usage:
+    python scripts/synthetic.py --scale medium
+    python scripts/synthetic.py --users 100 --documents 1000 --dimensions 384
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+# Add parent directory to path so we can import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.security import get_password_hash
+from app.db.base import (
+    Base,
+    Chunk,
+    Conversation,
+    Document,
+    Message,
+    Source,
+    Tag,
+    TagAccess,
+    User,
+    document_tags
+)
+
+# Password of every generated user
+PASSWORD = "benchmark-password"
+
+# Roles given to users besides the first, who is an admin
+ROLES = ("user", "hr", "finance", "engineering")
+
+WORDS = (
+    "policy leave request approval manager employee handbook section clause "
+    "security access compliance report quarter budget travel expense claim "
+    "onboarding training benefit insurance contract vendor invoice payment "
+    "retention schedule holiday overtime remote office equipment laptop"
+).split()
+
+BASE_TIME = datetime(2024, 1, 1)
+
+# Distinct texts of each kind; rows pick from the pool
+POOL_SIZE = 4096
+
+# Keyword arguments of ``seed`` for each preset scale
+SCALES = {
+    "small": dict(
+        users=10, conversations_per_user=5, messages_per_conversation=20,
+        documents=50, chunks_per_document=20
+    ),
+    # About 1M rows
+    "medium": dict(
+        users=200, conversations_per_user=50, messages_per_conversation=40,
+        documents=5_000, chunks_per_document=20
+    ),
+    # About 12M rows: 4M messages, 6M sources, 2M chunks
+    "large": dict(
+        users=2_000, conversations_per_user=50, messages_per_conversation=40,
+        documents=100_000, chunks_per_document=20
+    ),
+}
+
+# Kinds of rows, part of every generated ID
+_KINDS = {
+    "user": 1, "tag": 2, "document": 3, "chunk": 4,
+    "conversation": 5, "message": 6, "source": 7
+}
+
+class Generator:
+    """Seeded source of IDs, text and timestamps."""
+
+    def __init__(self, seed: int = 0) -> None:
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def id(self, kind: str, index: int) -> str:
+        """
+        UUID-formatted ID of the ``index``-th row of a kind.
+
+        IDs of one kind increase with ``index``, which keeps primary key
+        inserts appending to the end of the index.
+        """
+        return f"{self.seed & 0xffffffff:08x}-{_KINDS[kind]:04x}-4000-8000-{index:012x}"
+
+    def text(self, words: int) -> str:
+        return " ".join(self.random.choices(WORDS, k=words))
+
+    def pool(self, min_words: int, max_words: int) -> List[str]:
+        """Texts with a random number of words between the bounds."""
+        return [
+            self.text(self.random.randint(min_words, max_words)) for _ in range(POOL_SIZE)
+        ]
+
+    def time(self, max_days: int = 365) -> datetime:
+        return BASE_TIME + timedelta(seconds=self.random.randrange(max_days * 86400))
+
+def batched(rows: Iterator[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    """Group rows into lists of ``batch_size``."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class BulkWriter:
+    """Batched core inserts on one connection with periodic commits."""
+
+    def __init__(self, conn: Connection, batch_size: int, commit_every: int) -> None:
+        self.conn = conn
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.rows = 0
+        self._uncommitted = 0
+
+    def insert(self, table, rows: List[Dict]) -> None:
+        if not rows:
+            return
+        self.conn.execute(insert(table), rows)
+        self.rows += len(rows)
+        self._uncommitted += len(rows)
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def write(self, table, rows: Iterator[Dict]) -> None:
+        for batch in batched(rows, self.batch_size):
+            self.insert(table, batch)
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self._uncommitted = 0
+
+def seed(
+    engine: Engine,
+    users: int = 10,
+    conversations_per_user: int = 5,
+    messages_per_conversation: int = 20,
+    sources_per_message: int = 3,
+    documents: int = 50,
+    chunks_per_document: int = 20,
+    tags: int = 20,
+    dimensions: int = 0,
+    index_path: Optional[str] = None,
+    seed_value: int = 0,
+    batch_size: int = 5000,
+    commit_every: int = 100_000
+) -> Dict[str, List[str]]:
+    """
+    Create the schema if needed and fill it with synthetic data.
+
+    Every tag is visible to admins and one or two other roles, and every
+    document has up to two tags. Messages alternate between user and
+    assistant; assistant messages cite ``sources_per_message`` random
+    chunks. Every user shares the password ``PASSWORD``.
+
+    Args:
+        engine: Engine of the database to fill
+        dimensions: Also build a vector index and chunk store of random
+            embeddings with this many dimensions, saved to ``index_path``;
+            0 skips embeddings
+        index_path: Directory for the index, ``INDEX_PATH`` by default
+        seed_value: Seed of the random generator
+        batch_size: Rows per insert statement
+        commit_every: Rows per transaction
+
+    Returns:
+        IDs of the generated users, conversations and documents
+    """
+    Base.metadata.create_all(bind=engine)
+    gen = Generator(seed_value)
+    rng = gen.random
+    # Hashing is deliberately slow, so every user shares one hash
+    password_hash = get_password_hash(PASSWORD)
+
+    user_ids = [gen.id("user", i) for i in range(users)]
+    tag_ids = [gen.id("tag", i) for i in range(tags)]
+    document_ids = [gen.id("document", i) for i in range(documents)]
+    conversation_ids = [gen.id("conversation", i) for i in range(users * conversations_per_user)]
+    user_texts = gen.pool(6, 16)
+    assistant_texts = gen.pool(40, 80)
+    chunk_texts = gen.pool(80, 160)
+    chunk_lengths = np.array([len(text) for text in chunk_texts], dtype=np.int32)
+    total_chunks = documents * chunks_per_document
+    # Pool text of every chunk; sources need the cited chunk's length
+    chunk_text = np.empty(total_chunks, dtype=np.int32)
+    tags_by_document: Dict[int, List[str]] = {}
+
+    def user_rows():
+        for i, user_id in enumerate(user_ids):
+            yield {
+                "id": user_id,
+                "name": f"User {i}",
+                "email": f"user{i}@example.com",
+                "password_hash": password_hash,
+                "role": "admin" if i == 0 else rng.choice(ROLES),
+                "created_at": BASE_TIME,
+                "updated_at": BASE_TIME
+            }
+
+    def tag_rows():
+        for i, tag_id in enumerate(tag_ids):
+            yield {
+                "id": tag_id,
+                "name": f"{rng.choice(WORDS).title()} {i}",
+                "color": f"#{rng.randrange(0x1000000):06x}",
+                "description": gen.text(8),
+                "created_at": BASE_TIME,
+                "updated_at": BASE_TIME
+            }
+
+    def tag_access_rows():
+        for tag_id in tag_ids:
+            yield {"tag_id": tag_id, "role": "admin"}
+            for role in rng.sample(ROLES, rng.randint(1, 2)):
+                yield {"tag_id": tag_id, "role": role}
+
+    def document_rows():
+        for i, document_id in enumerate(document_ids):
+            created_at = gen.time()
+            yield {
+                "id": document_id,
+                "title": f"{gen.text(3).title()} {i}",
+                "description": gen.text(12),
+                "file_name": f"document-{i}.pdf",
+                "file_size": rng.randrange(10_000, 5_000_000),
+                "mime_type": "application/pdf",
+                "status": "processed",
+                "storage_path": f"documents/{document_id}",
+                "user_id": user_ids[i % users],
+                "created_at": created_at,
+                "updated_at": created_at
+            }
+
+    def document_tag_rows():
+        for i, document_id in enumerate(document_ids):
+            chosen = rng.sample(tag_ids, min(len(tag_ids), rng.randint(0, 2)))
+            tags_by_document[i] = chosen
+            for tag_id in chosen:
+                yield {"document_id": document_id, "tag_id": tag_id}
+
+    def chunk_rows():
+        for document in range(documents):
+            offset = 0
+            for position in range(chunks_per_document):
+                vector_id = document * chunks_per_document + position
+                text = rng.randrange(POOL_SIZE)
+                chunk_text[vector_id] = text
+                length = int(chunk_lengths[text])
+                yield {
+                    "id": gen.id("chunk", vector_id),
+                    "document_id": document_ids[document],
+                    "vector_id": vector_id,
+                    "content": chunk_texts[text],
+                    "page": position // 3 + 1,
+                    "char_start": offset,
+                    "char_end": offset + length,
+                    "created_at": BASE_TIME
+                }
+                offset += length + 1
+
+    def conversation_rows():
+        for i, conversation_id in enumerate(conversation_ids):
+            created_at = gen.time()
+            yield {
+                "id": conversation_id,
+                "title": gen.text(4).capitalize(),
+                "user_id": user_ids[i // conversations_per_user],
+                "created_at": created_at,
+                "updated_at": created_at
+            }
+
+    sources: List[Dict] = []
+    source_count = 0
+
+    def message_rows():
+        nonlocal source_count
+        message = 0
+        cite = min(sources_per_message, total_chunks)
+        for conversation_id in conversation_ids:
+            created_at = gen.time()
+            for position in range(messages_per_conversation):
+                message_id = gen.id("message", message)
+                message += 1
+                is_user = position % 2 == 0
+                yield {
+                    "id": message_id,
+                    "conversation_id": conversation_id,
+                    "content": rng.choice(user_texts if is_user else assistant_texts),
+                    "role": "user" if is_user else "assistant",
+                    "created_at": created_at + timedelta(seconds=30 * position)
+                }
+                if is_user:
+                    continue
+                for vector_id in rng.sample(range(total_chunks), cite):
+                    length = int(chunk_lengths[chunk_text[vector_id]])
+                    start = rng.randrange(length // 2)
+                    sources.append({
+                        "id": gen.id("source", source_count),
+                        "message_id": message_id,
+                        "document_id": document_ids[vector_id // chunks_per_document],
+                        "chunk_id": gen.id("chunk", vector_id),
+                        "start_offset": start,
+                        "end_offset": min(length, start + 200),
+                        "title": "Source",
+                        "page": (vector_id % chunks_per_document) // 3 + 1,
+                        "score": round(rng.uniform(0.5, 1.0), 4)
+                    })
+                    source_count += 1
+
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            # Bulk-load settings for this connection only; a crash mid-load
+            # can corrupt the file, which a generated database can afford
+            conn.exec_driver_sql("PRAGMA journal_mode=MEMORY")
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+            conn.exec_driver_sql("PRAGMA cache_size=-262144")
+        writer = BulkWriter(conn, batch_size, commit_every)
+        writer.write(User, user_rows())
+        writer.write(Tag, tag_rows())
+        writer.write(TagAccess.__table__, tag_access_rows())
+        writer.write(Document, document_rows())
+        writer.write(document_tags, document_tag_rows())
+        writer.write(Chunk, chunk_rows())
+        writer.write(Conversation, conversation_rows())
+        for batch in batched(message_rows(), batch_size):
+            writer.insert(Message, batch)
+            writer.insert(Source, sources)
+            sources.clear()
+        # Sources of the last message are generated after its batch is full
+        writer.insert(Source, sources)
+        writer.commit()
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("PRAGMA synchronous=FULL")
+            conn.exec_driver_sql("PRAGMA journal_mode=DELETE")
+
+    if dimensions:
+        write_embeddings(
+            gen, document_ids, chunks_per_document, tags_by_document, dimensions, index_path
+        )
+
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {writer.rows} rows in {elapsed:.1f}s ({writer.rows / elapsed:,.0f} rows/s)")
+    return {
+        "users": user_ids,
+        "conversations": conversation_ids,
+        "documents": document_ids
+    }
+
+def write_embeddings(
+    gen: Generator,
+    document_ids: List[str],
+    chunks_per_document: int,
+    tags_by_document: Dict[int, List[str]],
+    dimensions: int,
+    index_path: Optional[str] = None,
+    documents_per_batch: int = 1000
+) -> None:
+    """Build and publish a vector index and chunk store for the generated chunks."""
+    # Imported here so seeding without embeddings does not load the index code
+    from app.services.chunk_store import ChunkStore
+    from app.services.indexing import publish_index
+    from app.services.vector_index import SegmentedIndex
+
+    rng = np.random.default_rng(gen.seed)
+    index = SegmentedIndex(dimensions, mutable_capacity=65536)
+    store = ChunkStore()
+    for first in range(0, len(document_ids), documents_per_batch):
+        batch = range(first, min(first + documents_per_batch, len(document_ids)))
+        vector_ids = np.arange(
+            batch.start * chunks_per_document, batch.stop * chunks_per_document
+        )
+        index.add(vector_ids, rng.standard_normal((len(vector_ids), dimensions), np.float32))
+        for document in batch:
+            store.add_chunks(
+                document_ids[document],
+                [
+                    {
+                        "id": gen.id("chunk", vector_id),
+                        "vector_id": vector_id,
+                        "page": position // 3 + 1
+                    }
+                    for position, vector_id in enumerate(range(
+                        document * chunks_per_document, (document + 1) * chunks_per_document
+                    ))
+                ],
+                tags_by_document.get(document, ())
+            )
+    index.compact()
+    publish_index(index, store, root=index_path)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small",
+                        help="Preset sizes; the options below override them")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--conversations-per-user", type=int)
+    parser.add_argument("--messages-per-conversation", type=int)
+    parser.add_argument("--sources-per-message", type=int, default=3)
+    parser.add_argument("--documents", type=int)
+    parser.add_argument("--chunks-per-document", type=int)
+    parser.add_argument("--tags", type=int, default=20)
+    parser.add_argument("--dimensions", type=int, default=0,
+                        help="Embedding dimensions; 0 skips the vector index")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+
+    from app.db.session import engine
+    ids = seed(
+        engine,
+        sources_per_message=args.sources_per_message,
+        tags=args.tags,
+        dimensions=args.dimensions,
+        seed_value=args.seed,
+        batch_size=args.batch_size,
+        **sizes
+    )
+    print(
+        f"Seeded {len(ids['users'])} users, {len(ids['conversations'])} conversations "
+        f"and {len(ids['documents'])} documents (password: {PASSWORD})"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Shared fixtures: every test session runs against a scratch database and storage."""
+import os
+import tempfile
+
+# Settings are read on import, so point them away from any real data first
+_TMP = tempfile.mkdtemp(prefix="rag-assistant-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ["STORAGE_TYPE"] = "local"
+os.environ["STORAGE_PATH"] = os.path.join(_TMP, "storage")
+os.environ["INDEX_PATH"] = os.path.join(_TMP, "index")
+os.environ["WRITE_BEHIND_SPOOL_PATH"] = os.path.join(_TMP, "write_behind")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import pytest
+
+from app.db.base import Base
+from app.db.session import SessionLocal, engine
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, dropped again after the test."""
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,92 @@
+"""Admission control of LLM calls against a slow fake provider."""
+import asyncio
+from typing import List, Sequence, Tuple
+
+from app.core.admission import AdaptiveLimiter, Overloaded
+from app.services import rag
+from app.services.providers import ChatProvider
+
+class SlowChatProvider(ChatProvider):
+    """Fake provider whose latency grows once it is over capacity."""
+
+    def __init__(self, capacity: int, latency: float) -> None:
+        self.capacity = capacity
+        self.latency = latency
+        self.inflight = 0
+        self.max_inflight = 0
+
+    async def complete(self, messages: Sequence[Tuple[str, str]]) -> str:
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(self.latency * max(1.0, self.inflight / self.capacity))
+            return "reply"
+        finally:
+            self.inflight -= 1
+
+async def call(limiter: AdaptiveLimiter, provider: SlowChatProvider) -> str:
+    try:
+        async with limiter.slot():
+            return await provider.complete([("user", "question")])
+    except Overloaded as e:
+        return e.reason
+
+async def burst(
+    limiter: AdaptiveLimiter, provider: SlowChatProvider, calls: int, warm_up: bool = False
+) -> List[str]:
+    if warm_up:
+        # Let the limiter learn the provider's unloaded latency first
+        await call(limiter, provider)
+    return await asyncio.gather(*(call(limiter, provider) for _ in range(calls)))
+
+def test_calls_over_the_limit_queue_and_the_rest_are_shed():
+    limiter = AdaptiveLimiter(initial_limit=2, max_queue=2, queue_timeout=5)
+    provider = SlowChatProvider(capacity=2, latency=0.05)
+
+    results = asyncio.run(burst(limiter, provider, 6))
+
+    assert results.count("reply") == 4
+    assert results.count("queue_full") == 2
+    assert provider.max_inflight == 2
+    assert limiter.inflight == 0 and limiter.queue_depth == 0
+
+def test_waiting_calls_are_shed_after_the_queue_timeout():
+    limiter = AdaptiveLimiter(initial_limit=1, max_queue=10, queue_timeout=0.05)
+    provider = SlowChatProvider(capacity=1, latency=0.3)
+
+    results = asyncio.run(burst(limiter, provider, 3))
+
+    assert results == ["reply", "timeout", "timeout"]
+    assert limiter.inflight == 0 and limiter.queue_depth == 0
+
+def test_limit_backs_off_when_the_provider_slows_down():
+    limiter = AdaptiveLimiter(initial_limit=16, max_queue=1000, queue_timeout=30)
+    provider = SlowChatProvider(capacity=2, latency=0.005)
+
+    results = asyncio.run(burst(limiter, provider, 400, warm_up=True))
+
+    assert results.count("reply") == 400
+    assert limiter.limit < 8
+
+def test_limit_grows_while_the_provider_keeps_up():
+    limiter = AdaptiveLimiter(initial_limit=2, max_queue=1000, queue_timeout=30)
+    provider = SlowChatProvider(capacity=64, latency=0.005)
+
+    results = asyncio.run(burst(limiter, provider, 400, warm_up=True))
+
+    assert results.count("reply") == 400
+    assert limiter.limit > 2
+
+def test_generation_is_shed_once_the_limiter_is_full(monkeypatch):
+    monkeypatch.setattr(rag, "LLM_LIMITER", AdaptiveLimiter(initial_limit=1, max_queue=0))
+
+    async def ask_twice():
+        return await asyncio.gather(
+            rag.process_query(None, "hello", []),
+            rag.process_query(None, "hello", []),
+            return_exceptions=True
+        )
+
+    first, second = asyncio.run(ask_twice())
+    assert first[0].startswith("Hello")
+    assert isinstance(second, Overloaded) and second.reason == "queue_full"
@@ -0,0 +1,52 @@
+"""Chunk store readers stay consistent while writers grow it."""
+from typing import Dict, List
+
+from app.services.chunk_store import ChunkStore
+
+def chunks(first: int, count: int) -> List[Dict]:
+    return [
+        {"id": f"chunk-{i}", "vector_id": i, "page": 1, "char_start": 0, "char_end": 10}
+        for i in range(first, first + count)
+    ]
+
+def tags(count: int) -> List[str]:
+    return [f"tag-{i}" for i in range(count)]
+
+def test_tag_mask_and_resolve():
+    store = ChunkStore()
+    store.add_chunks("document-1", chunks(0, 2), ["tag-a"])
+    store.add_chunks("document-2", chunks(2, 2), ["tag-b"])
+
+    assert store.tag_mask([0, 1, 2, 3, 9], ["tag-b"]).tolist() == [False, False, True, True, False]
+    assert store.tag_mask([0, 2], ["tag-unknown"]).tolist() == [False, False]
+    [first, missing] = store.resolve([1, 9])
+    assert (first.chunk_id, first.document_id, first.tag_ids) == ("chunk-1", "document-1", ["tag-a"])
+    assert missing is None
+
+def test_readers_never_see_tags_wider_than_the_columns(monkeypatch):
+    store = ChunkStore()
+    store.add_chunks("document-1", chunks(0, 2), tags(70))
+    masks = []
+    ensure_capacity = ChunkStore._ensure_capacity
+
+    def with_reader(self, size, tag_words):
+        # A search between the tag dictionary growing and the columns widening
+        masks.append(self.tag_mask([0, 1], tags(200)).tolist())
+        ensure_capacity(self, size, tag_words)
+
+    monkeypatch.setattr(ChunkStore, "_ensure_capacity", with_reader)
+    store.set_document_tags("document-1", tags(200))
+
+    assert masks == [[True, True]]
+    assert store.tag_mask([0, 1], ["tag-199"]).tolist() == [True, True]
+
+def test_held_snapshot_keeps_its_own_tags():
+    store = ChunkStore()
+    store.add_chunks("document-1", chunks(0, 2), ["tag-a"])
+    held = store._snapshot
+
+    store.add_chunks("document-2", chunks(2, 2), tags(100))
+
+    assert held.tags == ["tag-a"]
+    assert held.columns.tags.shape[1] == 1
+    assert store.resolve([3])[0].tag_ids == tags(100)
@@ -0,0 +1,115 @@
+"""Content coding negotiation and the compression middleware."""
+import asyncio
+import zlib
+from typing import Dict, List, Optional
+
+import pytest
+from starlette.responses import Response, StreamingResponse
+
+from app.core.compression import CompressionMiddleware, brotli, negotiate
+
+LARGE = b'{"content": "' + b"annual leave policy " * 200 + b'"}'
+
+def test_negotiate_prefers_the_highest_quality():
+    assert negotiate("gzip, br", ("br", "gzip")) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", ("br", "gzip")) == "gzip"
+    assert negotiate(" GZIP ; q=0.8 ", ("br", "gzip")) == "gzip"
+    # Ties go to the most preferred coding
+    assert negotiate("gzip;q=0.5, br;q=0.5", ("br", "gzip")) == "br"
+    assert negotiate("identity, deflate", ("br", "gzip")) is None
+
+def test_negotiate_wildcard_and_refusals():
+    assert negotiate("*", ("br", "gzip")) == "br"
+    assert negotiate("br;q=0, *", ("br", "gzip")) == "gzip"
+    assert negotiate("gzip;q=0", ("gzip",)) is None
+    assert negotiate("*;q=0", ("br", "gzip")) is None
+    assert negotiate("gzip;q=0.2, *;q=0.9", ("gzip",)) == "gzip"
+    assert negotiate("gzip;q=high", ("gzip",)) is None
+
+def run(app, accept_encoding: Optional[str]) -> List[Dict]:
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else []
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers}
+    messages = []
+    requests = [{"type": "http.request", "body": b""}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # The client stays connected until the response is done
+        await asyncio.Event().wait()
+
+    async def send(message) -> None:
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=1024)(scope, receive, send))
+    return messages
+
+def headers_of(messages: List[Dict]) -> Dict[bytes, bytes]:
+    return {key.lower(): value for key, value in messages[0]["headers"]}
+
+def test_large_json_is_compressed():
+    messages = run(Response(LARGE, media_type="application/json"), "gzip")
+    headers = headers_of(messages)
+
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(messages[1]["body"])
+    assert zlib.decompress(messages[1]["body"], 16 + zlib.MAX_WBITS) == LARGE
+
+@pytest.mark.parametrize("body,accept_encoding", [
+    (b'{"ok": true}', "gzip"),
+    (LARGE, None),
+    (LARGE, "identity"),
+    (LARGE, "gzip;q=0"),
+], ids=["small", "no-header", "identity", "refused"])
+def test_uncompressed_variants_still_vary_on_accept_encoding(body, accept_encoding):
+    messages = run(Response(body, media_type="application/json"), accept_encoding)
+    headers = headers_of(messages)
+
+    assert b"content-encoding" not in headers
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert messages[1]["body"] == body
+
+def test_vary_is_extended_not_duplicated():
+    response = Response(LARGE, media_type="application/json", headers={"Vary": "Origin"})
+    assert headers_of(run(response, "gzip"))[b"vary"] == b"Origin, Accept-Encoding"
+
+    response = Response(LARGE, media_type="application/json", headers={"Vary": "accept-encoding"})
+    messages = run(response, None)
+    assert [key for key, _ in messages[0]["headers"]].count(b"vary") == 1
+    assert headers_of(messages)[b"vary"] == b"accept-encoding"
+
+def test_files_and_encoded_bodies_are_sent_as_is():
+    for response in (
+        Response(LARGE, media_type="application/pdf"),
+        Response(LARGE, media_type="application/json", headers={"Content-Encoding": "gzip"}),
+    ):
+        messages = run(response, "gzip")
+        assert b"vary" not in headers_of(messages)
+        assert messages[1]["body"] == LARGE
+
+@pytest.mark.parametrize("coding", ["gzip", "br"])
+def test_streamed_chunks_are_flushed_as_they_are_produced(coding):
+    if coding == "br" and brotli is None:
+        pytest.skip("brotli is not installed")
+    chunks = [b'{"token": "%d"}\n' % i for i in range(5)]
+
+    async def tokens():
+        for chunk in chunks:
+            yield chunk
+
+    messages = run(StreamingResponse(tokens(), media_type="application/x-ndjson"), coding)
+    assert headers_of(messages)[b"content-encoding"] == coding.encode()
+    assert b"content-length" not in headers_of(messages)
+
+    if coding == "br":
+        decoder = brotli.Decompressor()
+        decode = decoder.process
+    else:
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decode = decoder.decompress
+    # Each chunk decodes on its own as soon as it arrives
+    bodies = [message for message in messages[1:] if message.get("more_body")]
+    assert [decode(message["body"]) for message in bodies] == chunks
+    assert decode(messages[-1]["body"]) == b""
+    assert not messages[-1].get("more_body", False)
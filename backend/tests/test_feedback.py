@@ -0,0 +1,53 @@
+"""Feedback submitted through the write-behind queue reports the ID it is stored under."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.api_v1.endpoints import feedback
+from app.core.security import create_access_token
+from app.crud.message import feedback_id_for
+from app.db.base import (
+    Conversation as ConversationModel,
+    Feedback as FeedbackModel,
+    Message as MessageModel,
+    User as UserModel
+)
+
+@pytest.fixture
+def client(db):
+    db.add(UserModel(id="user-1", name="User", email="user@example.com", password_hash="x"))
+    db.add(ConversationModel(id="conversation-1", title="Questions", user_id="user-1"))
+    for message_id in ("message-1", "message-2"):
+        db.add(MessageModel(
+            id=message_id, conversation_id="conversation-1", content="Answer", role="assistant"
+        ))
+    db.commit()
+    app = FastAPI()
+    app.include_router(feedback.router, prefix="/api/v1/chat")
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {create_access_token('user-1')}"
+    return client
+
+def submit(client, message_id: str, feedback_type: str = "positive") -> str:
+    response = client.post(
+        "/api/v1/chat/feedback",
+        json={"message_id": message_id, "feedback_type": feedback_type}
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def test_new_feedback_id_is_the_stored_id(client, db):
+    feedback_id = submit(client, "message-1")
+
+    assert feedback_id == feedback_id_for("message-1")
+    assert db.query(FeedbackModel.id).filter_by(message_id="message-1").scalar() == feedback_id
+    assert submit(client, "message-1", "negative") == feedback_id
+
+def test_feedback_stored_under_an_older_id_keeps_it(client, db):
+    db.add(FeedbackModel(id="legacy-id", message_id="message-2", feedback_type="negative"))
+    db.commit()
+
+    assert submit(client, "message-2") == "legacy-id"
+    db.expire_all()
+    stored = db.query(FeedbackModel).filter_by(message_id="message-2").one()
+    assert (stored.id, stored.feedback_type) == ("legacy-id", "positive")
@@ -0,0 +1,104 @@
+"""Full-text search over a user's messages, on FTS5 and on the in-process index."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.db.base import (
+    Conversation as ConversationModel,
+    Message as MessageModel,
+    User as UserModel
+)
+from app.services import message_search
+from app.services.message_search import (
+    HIGHLIGHT_END,
+    HIGHLIGHT_START,
+    MemorySearchIndex,
+    parse_query,
+    search_messages,
+    split_highlights,
+    tokenize
+)
+
+START = datetime(2026, 1, 1)
+
+@pytest.fixture(params=["sqlite", "memory"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(settings, "MESSAGE_SEARCH_BACKEND", request.param)
+    monkeypatch.setattr(message_search, "MEMORY_INDEX", MemorySearchIndex())
+    return request.param
+
+@pytest.fixture
+def seeded(db, backend):
+    for user_id in ("user-a", "user-b"):
+        db.add(UserModel(id=user_id, name=user_id, email=f"{user_id}@example.com", password_hash="x"))
+        db.add(ConversationModel(id=f"conversation-{user_id}", title="Policies", user_id=user_id))
+    db.flush()
+    add_message(db, "user-a", "m1", "The annual leave policy changed this year.", 0)
+    add_message(db, "user-a", "m2", "Leave the policy review until the annual meeting.", 1)
+    add_message(db, "user-a", "m3", "Nothing to see here.", 2)
+    add_message(db, "user-b", "m4", "Bob asked about annual leave too.", 3)
+    db.commit()
+    assert message_search.get_search_backend(db) == backend
+    return db
+
+def add_message(db, user_id: str, message_id: str, content: str, minutes: int) -> None:
+    db.add(MessageModel(
+        id=message_id,
+        conversation_id=f"conversation-{user_id}",
+        content=content,
+        role="user",
+        created_at=START + timedelta(minutes=minutes)
+    ))
+
+def found(db, user_id: str, query: str):
+    return sorted(result["message_id"] for result in search_messages(db, user_id, query))
+
+def test_parse_query():
+    assert parse_query('Annual "leave  policy" annual -OR') == [("annual",), ("leave", "policy"), ("or",)]
+    assert parse_query('"" ...') == []
+    assert tokenize("Café déjà-vu") == ["cafe", "deja", "vu"]
+
+def test_words_match_anywhere_and_phrases_as_written(seeded):
+    assert found(seeded, "user-a", "annual leave") == ["m1", "m2"]
+    assert found(seeded, "user-a", '"annual leave"') == ["m1"]
+    assert found(seeded, "user-a", '"leave annual"') == []
+    assert found(seeded, "user-a", "ANNUAL Policy") == ["m1", "m2"]
+    assert found(seeded, "user-a", "annual holiday") == []
+
+def test_search_only_sees_the_callers_messages(seeded):
+    assert found(seeded, "user-a", '"annual leave"') == ["m1"]
+    assert found(seeded, "user-b", '"annual leave"') == ["m4"]
+    assert found(seeded, "user-b", "policy") == []
+    assert found(seeded, "user-unknown", "annual") == []
+
+def test_highlights_point_at_the_matched_words(seeded):
+    [result] = search_messages(seeded, "user-a", '"annual leave" changed')
+
+    assert result["snippet"] == "The annual leave policy changed this year."
+    words = [result["snippet"][start:end] for start, end in result["highlights"]]
+    assert words == ["annual", "leave", "changed"]
+    assert result["conversation_title"] == "Policies"
+
+def test_split_highlights():
+    marked = f"a {HIGHLIGHT_START}bc{HIGHLIGHT_END} d {HIGHLIGHT_START}é{HIGHLIGHT_END}"
+    assert split_highlights(marked) == ("a bc d é", [(2, 4), (7, 8)])
+    # Unbalanced and empty markers are dropped
+    assert split_highlights(f"{HIGHLIGHT_END}x{HIGHLIGHT_START}{HIGHLIGHT_END}y") == ("xy", [])
+
+def test_search_follows_new_and_deleted_messages(seeded):
+    assert found(seeded, "user-a", "meeting") == ["m2"]
+
+    add_message(seeded, "user-a", "m5", "The meeting moved to Friday.", 10)
+    seeded.commit()
+    assert found(seeded, "user-a", "meeting") == ["m2", "m5"]
+
+    seeded.query(MessageModel).filter_by(id="m2").delete()
+    seeded.commit()
+    assert found(seeded, "user-a", "meeting") == ["m5"]
+
+    # A deletion and an addition that leave the count unchanged
+    seeded.query(MessageModel).filter_by(id="m5").delete()
+    add_message(seeded, "user-a", "m6", "Another meeting on Monday.", 11)
+    seeded.commit()
+    assert found(seeded, "user-a", "meeting") == ["m6"]
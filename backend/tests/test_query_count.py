@@ -0,0 +1,67 @@
+"""Endpoints must run a fixed number of SQL statements, however many rows they return."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.api_v1.endpoints import messages
+from app.core.security import create_access_token
+from app.db.base import (
+    Conversation as ConversationModel,
+    Document as DocumentModel,
+    Message as MessageModel,
+    Source as SourceModel,
+    User as UserModel
+)
+from app.db.session import assert_max_queries
+
+# The user, the conversation, the total, a page of messages and their sources
+MAX_HISTORY_QUERIES = 5
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(messages.router, prefix="/api/v1/chat")
+    return TestClient(app)
+
+def seed_conversation(db, messages_count: int, sources_per_message: int = 3) -> str:
+    user = UserModel(id="user-1", name="User", email="user@example.com", password_hash="x")
+    document = DocumentModel(
+        id="document-1", title="Manual", file_name="manual.pdf", file_size=1,
+        mime_type="application/pdf", user_id=user.id
+    )
+    conversation = ConversationModel(id="conversation-1", title="Questions", user_id=user.id)
+    db.add_all([user, document, conversation])
+    for i in range(messages_count):
+        message = MessageModel(
+            id=f"message-{i}",
+            conversation_id=conversation.id,
+            content=f"Message {i}",
+            role="user" if i % 2 == 0 else "assistant"
+        )
+        db.add(message)
+        for j in range(sources_per_message if message.role == "assistant" else 0):
+            db.add(SourceModel(
+                message_id=message.id,
+                document_id=document.id,
+                title="Manual",
+                content=f"Passage {j}",
+                score=0.5
+            ))
+    db.commit()
+    return conversation.id
+
+@pytest.mark.parametrize("messages_count", [2, 40])
+def test_history_query_count_does_not_grow_with_messages(db, client, messages_count):
+    conversation_id = seed_conversation(db, messages_count)
+    headers = {"Authorization": f"Bearer {create_access_token('user-1')}"}
+
+    with assert_max_queries(MAX_HISTORY_QUERIES):
+        response = client.get(
+            f"/api/v1/chat/conversations/{conversation_id}/messages",
+            headers=headers
+        )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == messages_count
+    assert sum(len(message["sources"]) for message in body["items"]) == 3 * (messages_count // 2)
@@ -0,0 +1,169 @@
+"""Token bucket rate limiting, on a clock the tests move by hand."""
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import deps
+from app.core import rate_limit
+from app.core.rate_limit import Limit, MemoryBackend, RateLimiter, parse_limits, retry_after
+from app.core.security import create_access_token
+from app.db.base import User as UserModel
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+def test_parse_limits():
+    assert parse_limits(" *:20/minute, admin:120/minute ,curator:none,") == {
+        "*": Limit(20.0, 20 / 60),
+        "admin": Limit(120.0, 2.0),
+        "curator": None,
+    }
+    assert parse_limits("*:5/30") == {"*": Limit(5.0, 5 / 30)}
+    assert parse_limits("") == {}
+    for spec in ("*:0/minute", "*:5/0", "*:5/fortnight", "*:many/minute"):
+        with pytest.raises(ValueError):
+            parse_limits(spec)
+
+def test_bucket_bursts_then_refills_at_the_average_rate(clock):
+    backend = MemoryBackend()
+    limit = Limit(capacity=3, rate=0.5)
+
+    assert [backend.acquire("user:1", limit) for _ in range(3)] == [0, 0, 0]
+    assert backend.acquire("user:1", limit) == pytest.approx(2.0)
+    # A rejected request takes nothing
+    clock.advance(1.5)
+    assert backend.acquire("user:1", limit) == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert backend.acquire("user:1", limit) == 0
+    assert backend.acquire("user:1", limit) == pytest.approx(2.0)
+
+    # Refilling stops at the capacity
+    clock.advance(3600)
+    assert [backend.acquire("user:1", limit) for _ in range(4)][-1] == pytest.approx(2.0)
+    # Other keys have their own buckets
+    assert backend.acquire("user:2", limit) == 0
+
+def test_retry_after_rounds_up_to_whole_seconds():
+    assert retry_after(0.01) == "1"
+    assert retry_after(1.0) == "1"
+    assert retry_after(1.2) == "2"
+    assert retry_after(59.9) == "60"
+
+def test_prune_drops_only_full_buckets(clock):
+    backend = MemoryBackend(max_keys=4, stripes=2)
+    limit = Limit(capacity=2, rate=1.0)
+    for user in range(3):
+        backend.acquire(f"user:{user}", limit)
+    clock.advance(0.5)
+    backend.acquire("user:3", limit)
+    clock.advance(0.5)
+
+    # The map is at its bound, so this check first drops the refilled buckets
+    backend.acquire("user:4", limit)
+    assert sorted(backend._buckets) == ["user:3", "user:4"]
+    assert backend._buckets["user:3"][0] == pytest.approx(1.0)
+    assert backend._prune_at == 4
+
+def test_prune_waits_for_the_map_to_grow_when_buckets_are_in_use(clock):
+    backend = MemoryBackend(max_keys=2, stripes=2)
+    limit = Limit(capacity=1, rate=0.001)
+    for user in range(3):
+        backend.acquire(f"user:{user}", limit)
+
+    assert len(backend._buckets) == 3
+    assert backend._prune_at == 4
+
+def test_exempt_roles_and_disabled_limiter_are_not_charged():
+    limits = {"chat": parse_limits("*:1/minute,admin:none")}
+    limiter = RateLimiter(limits)
+
+    assert asyncio.run(limiter.acquire("chat", "user:1", "admin")) == 0
+    assert asyncio.run(limiter.acquire("chat", "user:1", "admin")) == 0
+    assert asyncio.run(limiter.acquire("upload", "user:1")) == 0
+    assert asyncio.run(limiter.acquire("chat", "user:1")) == 0
+    assert asyncio.run(limiter.acquire("chat", "user:1")) > 0
+
+    limiter = RateLimiter(limits, enabled=False)
+    assert [asyncio.run(limiter.acquire("chat", "user:1")) for _ in range(3)] == [0, 0, 0]
+
+def test_unreachable_redis_falls_back_to_local_buckets(clock, monkeypatch, caplog):
+    calls = []
+
+    class FlakyRedis:
+        down = True
+
+        def __init__(self, url: str) -> None:
+            self.url = url
+
+        async def acquire(self, key, limit, cost=1.0):
+            calls.append(key)
+            if FlakyRedis.down:
+                raise ConnectionError("connection refused")
+            return 0.0
+
+    monkeypatch.setattr(rate_limit, "RedisBackend", FlakyRedis)
+    limiter = RateLimiter({"chat": parse_limits("*:2/minute")}, redis_url="redis://cache")
+
+    with caplog.at_level(logging.INFO, logger=rate_limit.__name__):
+        waits = [asyncio.run(limiter.acquire("chat", "user:1")) for _ in range(3)]
+        # Local buckets still enforce the budget
+        assert waits[:2] == [0, 0]
+        assert waits[2] == pytest.approx(30.0)
+        assert len(calls) == 3
+        # Warned once, not on every request
+        assert [r.levelno for r in caplog.records] == [logging.WARNING]
+
+        FlakyRedis.down = False
+        assert asyncio.run(limiter.acquire("chat", "user:1")) == 0
+        assert [r.levelno for r in caplog.records] == [logging.WARNING, logging.INFO]
+    assert not limiter._redis_failing
+
+@pytest.fixture
+def client(db, clock, monkeypatch):
+    # conftest turns limiting off for every other test
+    limiter = RateLimiter({"chat": parse_limits("*:2/4,admin:none")}, enabled=True)
+    monkeypatch.setattr(deps, "RATE_LIMITER", limiter)
+    db.add(UserModel(id="user-1", name="User", email="user@example.com", password_hash="x"))
+    db.add(UserModel(id="admin-1", name="Admin", email="admin@example.com", password_hash="x", role="admin"))
+    db.commit()
+    app = FastAPI()
+
+    @app.get("/chat")
+    def chat(current_user=Depends(deps.rate_limit("chat"))):
+        return {"id": current_user.id}
+
+    return TestClient(app)
+
+def get(client, user_id: str):
+    return client.get("/chat", headers={"Authorization": f"Bearer {create_access_token(user_id)}"})
+
+def test_dependency_rejects_over_budget_with_retry_after(client, clock):
+    assert [get(client, "user-1").status_code for _ in range(2)] == [200, 200]
+
+    response = get(client, "user-1")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    clock.advance(1)
+    assert get(client, "user-1").headers["Retry-After"] == "1"
+    clock.advance(1)
+    assert get(client, "user-1").json() == {"id": "user-1"}
+    # Budgets follow the role
+    assert [get(client, "admin-1").status_code for _ in range(5)] == [200] * 5
@@ -0,0 +1,117 @@
+"""S3 storage and its on-disk block cache, against moto's in-memory S3."""
+import os
+from typing import List, Tuple
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.services.storage import CachedStorageBackend, S3StorageBackend
+
+BLOCK = 1024
+DATA = bytes(range(256)) * 40
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="documents")
+        backend = S3StorageBackend("documents", client=client)
+        backend.write_stream("doc.pdf", [DATA[:4000], DATA[4000:]])
+        yield backend
+
+@pytest.fixture
+def reads(s3, monkeypatch) -> List[Tuple[int, int]]:
+    """Record the ``(offset, length)`` of every range read sent to S3."""
+    calls: List[Tuple[int, int]] = []
+    read_range = s3.read_range
+
+    def recording(key, offset, length):
+        calls.append((offset, length))
+        return read_range(key, offset, length)
+
+    monkeypatch.setattr(s3, "read_range", recording)
+    return calls
+
+def cached(s3, root, max_bytes=1024 * 1024, **kwargs) -> CachedStorageBackend:
+    return CachedStorageBackend(s3, str(root), max_bytes=max_bytes, block_size=BLOCK, **kwargs)
+
+def test_s3_read_range(s3):
+    assert s3.size("doc.pdf") == len(DATA)
+    assert s3.read_range("doc.pdf", 0, 10) == DATA[:10]
+    assert s3.read_range("doc.pdf", 10000, 1000) == DATA[10000:]
+    assert s3.read_range("doc.pdf", 100, 0) == b""
+
+def test_cache_fetches_missing_blocks_in_one_request(s3, reads, tmp_path):
+    cache = cached(s3, tmp_path)
+
+    assert cache.read_range("doc.pdf", 1500, 3000) == DATA[1500:4500]
+    assert reads == [(BLOCK, 4 * BLOCK)]
+
+    assert cache.read_range("doc.pdf", 2000, 100) == DATA[2000:2100]
+    assert len(reads) == 1
+
+    # Blocks 0 and 5 are missing and not adjacent
+    assert cache.read_range("doc.pdf", 0, 6000) == DATA[:6000]
+    assert reads[1:] == [(0, BLOCK), (5 * BLOCK, BLOCK)]
+
+    assert cache.read_range("doc.pdf", len(DATA) - 10, 100) == DATA[-10:]
+    assert cache.read_range("doc.pdf", len(DATA), 100) == b""
+
+def test_cache_evicts_least_recently_used_blocks(s3, reads, tmp_path):
+    cache = cached(s3, tmp_path, max_bytes=3 * BLOCK)
+    for block in (0, 1, 2, 0, 3):
+        cache.read_range("doc.pdf", block * BLOCK, BLOCK)
+
+    assert cache.cached_bytes == 3 * BLOCK
+    assert len(os.listdir(cache.directory)) == 3
+    del reads[:]
+
+    for block in (0, 2, 3):
+        assert cache.read_range("doc.pdf", block * BLOCK, BLOCK) == DATA[block * BLOCK:(block + 1) * BLOCK]
+    assert reads == []
+    cache.read_range("doc.pdf", BLOCK, BLOCK)
+    assert reads == [(BLOCK, BLOCK)]
+
+def test_processes_cache_in_slots_of_their_own(s3, reads, tmp_path):
+    first = cached(s3, tmp_path, max_bytes=4 * BLOCK, processes=2)
+    second = cached(s3, tmp_path, max_bytes=4 * BLOCK, processes=2)
+    first.read_range("doc.pdf", 0, 2 * BLOCK)
+    second.read_range("doc.pdf", 0, 3 * BLOCK)
+
+    assert first.directory != second.directory
+    assert first.max_bytes == second.max_bytes == 2 * BLOCK
+    assert first.cached_bytes == second.cached_bytes == 2 * BLOCK
+
+    # The first process exits; the next one takes over its slot and blocks
+    first._slot_lock.close()
+    third = cached(s3, tmp_path, max_bytes=4 * BLOCK, processes=2)
+    del reads[:]
+    assert third.read_range("doc.pdf", 0, 2 * BLOCK) == DATA[:2 * BLOCK]
+    assert third.directory == first.directory
+    assert reads == []
+
+def test_unheld_slots_beyond_processes_are_removed(s3, tmp_path):
+    os.makedirs(tmp_path / "3")
+    (tmp_path / "3" / "stale.0").write_bytes(b"x" * BLOCK)
+    (tmp_path / "slot-3.lock").touch()
+
+    cache = cached(s3, tmp_path, processes=2)
+    cache.read_range("doc.pdf", 0, 10)
+
+    assert not (tmp_path / "3").exists()
+    assert (tmp_path / "0").exists()
+
+def test_object_sizes_are_bounded(s3, tmp_path):
+    for key in ("a", "b", "c"):
+        s3.write_stream(key, [key.encode()])
+    cache = cached(s3, tmp_path, max_sizes=2)
+    for key in ("a", "b", "a", "c"):
+        cache.read_range(key, 0, 1)
+
+    assert list(cache._sizes) == ["a", "c"]
+
+    cache.delete("c")
+    assert list(cache._sizes) == ["a"]
@@ -0,0 +1,203 @@
+"""Resumable multipart uploads through the document endpoints."""
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.api_v1.endpoints import documents
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db.base import (
+    Blob as BlobModel,
+    Document as DocumentModel,
+    Tag as TagModel,
+    UploadSession as UploadSessionModel,
+    User as UserModel
+)
+from app.services import chunk_store, uploads
+from app.services.documents import delete_document
+from app.services.storage import get_storage
+from app.services.vector_index import SegmentedIndex
+
+PART = 1024
+DATA = bytes(range(256)) * 10  # two full parts and a short last one
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_PART_SIZE", PART)
+    db.add(UserModel(id="user-1", name="User", email="user@example.com", password_hash="x"))
+    db.commit()
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/api/v1/documents")
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {create_access_token('user-1')}"
+    return client
+
+def start(client, data: bytes = DATA, tags=()) -> str:
+    response = client.post("/api/v1/documents/uploads", json={
+        "title": "Manual",
+        "file_name": "manual.pdf",
+        "file_size": len(data),
+        "mime_type": "application/pdf",
+        "tags": list(tags)
+    })
+    assert response.status_code == 201
+    return response.json()["id"]
+
+def put_part(client, upload_id: str, part_number: int, data: bytes = DATA):
+    return client.put(
+        f"/api/v1/documents/uploads/{upload_id}/parts/{part_number}",
+        content=data[(part_number - 1) * PART:part_number * PART]
+    )
+
+def upload_parts(client, upload_id: str, data: bytes = DATA) -> None:
+    for part_number in range(1, -(-len(data) // PART) + 1):
+        assert put_part(client, upload_id, part_number, data).status_code == 200
+
+def complete(client, upload_id: str):
+    return client.post(f"/api/v1/documents/uploads/{upload_id}/complete")
+
+def test_upload_resumes_from_next_part(client, db):
+    upload_id = start(client)
+    assert put_part(client, upload_id, 1).status_code == 200
+
+    response = put_part(client, upload_id, 3)
+    assert response.status_code == 409
+
+    state = client.get(f"/api/v1/documents/uploads/{upload_id}").json()
+    assert (state["next_part"], state["bytes_received"]) == (2, PART)
+    assert put_part(client, upload_id, 2).status_code == 200
+    assert put_part(client, upload_id, 3).status_code == 200
+
+    response = complete(client, upload_id)
+    assert response.status_code == 200
+    document = response.json()
+    assert document["file_size"] == len(DATA)
+    assert client.get(f"/api/v1/documents/{document['id']}/file").content == DATA
+
+def test_part_of_the_wrong_size_is_rejected(client):
+    upload_id = start(client)
+
+    assert client.put(
+        f"/api/v1/documents/uploads/{upload_id}/parts/1", content=DATA[:PART - 1]
+    ).status_code == 400
+    assert client.put(
+        f"/api/v1/documents/uploads/{upload_id}/parts/1", content=DATA[:PART + 1]
+    ).status_code == 413
+    assert client.put(
+        f"/api/v1/documents/uploads/{upload_id}/parts/1",
+        content=DATA[:PART],
+        headers={"Content-Length": "many"}
+    ).status_code == 400
+
+    # The failed attempts left nothing behind
+    state = client.get(f"/api/v1/documents/uploads/{upload_id}").json()
+    assert (state["next_part"], state["bytes_received"]) == (1, 0)
+    upload_parts(client, upload_id)
+    assert complete(client, upload_id).status_code == 200
+
+def test_concurrent_complete_conflicts(client, db, monkeypatch):
+    upload_id = start(client)
+    upload_parts(client, upload_id)
+    storage = get_storage()
+    assemble = storage.complete_upload
+    responses = []
+
+    def complete_upload(key, storage_upload_id, parts):
+        # A second request arrives while the first is assembling the file
+        responses.append(complete(client, upload_id))
+        assemble(key, storage_upload_id, parts)
+
+    monkeypatch.setattr(storage, "complete_upload", complete_upload)
+    response = complete(client, upload_id)
+
+    assert response.status_code == 200
+    assert [r.status_code for r in responses] == [409]
+    assert db.query(DocumentModel).count() == 1
+
+def test_incremental_hash_matches_stored_object(client, db):
+    upload_id = start(client)
+    upload_parts(client, upload_id)
+    document = db.get(DocumentModel, complete(client, upload_id).json()["id"])
+
+    assert document.content_hash == hashlib.sha256(DATA).hexdigest()
+    assert document.content_hash == uploads._hash_stored_object(document.storage_path)
+
+def test_upload_resumed_on_another_worker_is_hashed_from_storage(client, db):
+    data = DATA[::-1]
+    upload_id = start(client, data)
+    upload_parts(client, upload_id, data)
+    # This worker never saw the parts, so it has no running digest
+    uploads._hashers.pop(upload_id)
+    document = db.get(DocumentModel, complete(client, upload_id).json()["id"])
+
+    assert document.content_hash == hashlib.sha256(data).hexdigest()
+
+def test_failed_document_creation_reopens_the_upload(client, db, monkeypatch):
+    upload_id = start(client)
+    upload_parts(client, upload_id)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database went away")
+
+    # The document is committed by then, so it has to be undone
+    with monkeypatch.context() as patch:
+        patch.setattr(uploads, "update_upload_status", fail)
+        with pytest.raises(RuntimeError):
+            complete(client, upload_id)
+
+    db.expire_all()
+    assert db.get(UploadSessionModel, upload_id).status == "active"
+    assert db.query(DocumentModel).count() == 0
+    assert db.query(BlobModel).count() == 0
+
+    # A retry finds the file already assembled
+    response = complete(client, upload_id)
+    assert response.status_code == 200
+    assert db.get(BlobModel, db.get(DocumentModel, response.json()["id"]).blob_id).ref_count == 1
+
+def test_duplicate_upload_shares_the_blob_and_tags_its_chunks(client, db, monkeypatch):
+    store = chunk_store.ChunkStore()
+    monkeypatch.setattr(chunk_store, "_chunk_store", store)
+    db.add_all([TagModel(id=tag, name=tag, color="red") for tag in ("tag-a", "tag-b")])
+    db.commit()
+
+    upload_id = start(client, tags=["tag-a"])
+    upload_parts(client, upload_id)
+    first = db.get(DocumentModel, complete(client, upload_id).json()["id"])
+    # Ingested: its chunks are in the store
+    store.add_chunks(first.id, [
+        {"id": f"chunk-{i}", "vector_id": i, "page": 1, "char_start": 0, "char_end": 10}
+        for i in range(3)
+    ], ["tag-a"])
+
+    upload_id = start(client, tags=["tag-b"])
+    upload_parts(client, upload_id)
+    second = db.get(DocumentModel, complete(client, upload_id).json()["id"])
+    blob = db.get(BlobModel, first.blob_id)
+
+    assert second.blob_id == blob.id
+    assert second.storage_path == first.storage_path
+    assert blob.ref_count == 2
+    assert db.query(BlobModel).count() == 1
+    # The duplicate copy is gone, the shared one stays
+    storage = get_storage()
+    assert not os.path.exists(storage.path(f"documents/{upload_id}"))
+    assert os.path.exists(storage.path(first.storage_path))
+    assert store.tag_mask([0, 1, 2], ["tag-b"]).all()
+
+    index = SegmentedIndex()
+    delete_document(db, second, index=index, store=store)
+    db.refresh(blob)
+    assert blob.ref_count == 1
+    assert store.tag_mask([0, 1, 2], ["tag-a"]).all()
+    assert not store.tag_mask([0, 1, 2], ["tag-b"]).any()
+    assert client.get(f"/api/v1/documents/{first.id}/file").content == DATA
+
+    storage_path = first.storage_path
+    delete_document(db, first, index=index, store=store)
+    assert db.query(BlobModel).count() == 0
+    assert len(store) == 0
+    assert not os.path.exists(storage.path(storage_path))
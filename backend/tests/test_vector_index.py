@@ -0,0 +1,40 @@
+"""Compaction of the segmented vector index."""
+import numpy as np
+
+from app.services.vector_index import Compactor, SegmentedIndex
+
+def filled_index(segments: int, rows: int = 4) -> SegmentedIndex:
+    """An index with ``segments`` sealed segments and one row in the mutable one."""
+    index = SegmentedIndex(dimensions=3, mutable_capacity=rows)
+    count = segments * rows + 1
+    index.add(range(count), np.random.default_rng(0).standard_normal((count, 3)).astype(np.float32))
+    return index
+
+def segment_sizes(index: SegmentedIndex):
+    return sorted(len(segment) for segment in index._state.segments)
+
+def test_compactor_leaves_fragmented_index_alone_below_thresholds():
+    index = filled_index(segments=3)
+    assert not Compactor(index, max_segments=3).run_once()
+    assert segment_sizes(index) == [4, 4, 4]
+
+def test_compactor_does_not_remerge_large_segments():
+    index = filled_index(segments=4)
+    compactor = Compactor(index, max_segments=2, max_segment_rows=8)
+
+    assert compactor.run_once()
+    assert segment_sizes(index) == [16]
+
+    index.add(range(17, 29), np.ones((12, 3), np.float32))
+    assert compactor.run_once()
+    # The 16-row segment was not rewritten, only the new ones merged
+    assert segment_sizes(index) == [12, 16]
+
+def test_compactor_rewrites_large_segments_to_purge_tombstones():
+    index = filled_index(segments=4)
+    Compactor(index, max_segments=2).run_once()
+    index.delete([0, 1, 2])
+
+    assert Compactor(index, max_segments=2, max_segment_rows=8).run_once()
+    assert segment_sizes(index) == [13]
+    assert index.stats()["tombstones"] == 0
@@ -0,0 +1,161 @@
+"""The write-behind queue keeps writes across database failures and restarts."""
+import glob
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.services.write_behind import WriteBehindQueue
+
+class FakeDatabase:
+    """Rows committed by fake sessions; commits fail while it is down."""
+
+    def __init__(self) -> None:
+        self.rows: List[int] = []
+        self.down = False
+
+    def session(self) -> "FakeSession":
+        return FakeSession(self)
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase) -> None:
+        self.database = database
+        self.staged: List[int] = []
+
+    def commit(self) -> None:
+        if self.database.down:
+            raise OperationalError("COMMIT", {}, Exception("database is down"))
+        self.database.rows.extend(self.staged)
+
+    def rollback(self) -> None:
+        self.staged = []
+
+    def close(self) -> None:
+        pass
+
+def record(db: FakeSession, payloads: List[Dict[str, Any]]) -> None:
+    for payload in payloads:
+        if payload.get("invalid"):
+            raise IntegrityError("INSERT", {}, Exception("constraint failed"))
+        db.staged.append(payload["n"])
+
+@pytest.fixture
+def database() -> FakeDatabase:
+    return FakeDatabase()
+
+@pytest.fixture
+def make_queue(database, tmp_path):
+    queues = []
+
+    def make(**kwargs) -> WriteBehindQueue:
+        # Long interval, so only explicit flushes and stop() write
+        options = {"interval": 60, "spool_path": str(tmp_path)}
+        queue = WriteBehindQueue(
+            session_factory=database.session,
+            handlers={"record": record},
+            **{**options, **kwargs}
+        )
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue._stop.set()
+        queue._wake.set()
+
+def spooled(path) -> List[str]:
+    return sorted(os.path.basename(p) for p in glob.glob(os.path.join(str(path), "*.jsonl")))
+
+def write_spool(path, name: str, numbers: List[int]) -> None:
+    with open(os.path.join(str(path), name), "w") as f:
+        for n in numbers:
+            f.write(json.dumps({"kind": "record", "payload": {"n": n}}) + "\n")
+
+def test_stop_spools_writes_the_database_rejects(database, make_queue, tmp_path):
+    queue = make_queue()
+    queue.start()
+    for n in (1, 2, 3):
+        queue.enqueue("record", {"n": n})
+    database.down = True
+    queue.stop()
+
+    assert database.rows == []
+    assert len(queue) == 0
+    [name] = spooled(tmp_path)
+    assert name.startswith(f"pending-{os.getpid()}-")
+    with open(tmp_path / name) as f:
+        assert [json.loads(line)["payload"]["n"] for line in f] == [1, 2, 3]
+
+def test_start_replays_spooled_writes_first(database, make_queue, tmp_path):
+    write_spool(tmp_path, "pending-1-100.jsonl", [1, 2])
+    write_spool(tmp_path, "pending-1-200.jsonl", [3])
+
+    queue = make_queue()
+    queue.start()
+    queue.enqueue("record", {"n": 4})
+    queue.stop()
+
+    assert database.rows == [1, 2, 3, 4]
+    assert spooled(tmp_path) == []
+
+def test_files_claimed_by_dead_workers_are_replayed(database, make_queue, tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    write_spool(tmp_path, f"claimed-{exited.pid}-pending-1-100.jsonl", [1, 2])
+    # The parent process is alive and may still be writing its claim
+    live_claim = f"claimed-{os.getppid()}-pending-1-200.jsonl"
+    write_spool(tmp_path, live_claim, [3])
+
+    queue = make_queue()
+    queue.start()
+    queue.stop()
+
+    assert database.rows == [1, 2]
+    assert spooled(tmp_path) == [live_claim]
+
+def test_invalid_writes_are_dropped_alone(database, make_queue):
+    queue = make_queue()
+    queue.start()
+    queue.enqueue("record", {"n": 1})
+    queue.enqueue("record", {"n": 2, "invalid": True})
+    queue.enqueue("record", {"n": 3})
+
+    assert queue.flush() == 3
+    assert database.rows == [1, 3]
+    assert len(queue) == 0
+    queue.stop()
+
+def test_failed_flush_keeps_writes_queued(database, make_queue):
+    queue = make_queue()
+    queue.start()
+    queue.enqueue("record", {"n": 1})
+    database.down = True
+    with pytest.raises(OperationalError):
+        queue.flush()
+    assert len(queue) == 1
+
+    database.down = False
+    queue.stop()
+    assert database.rows == [1]
+
+def test_overflow_spills_to_the_spool(database, make_queue, tmp_path):
+    database.down = True
+    queue = make_queue(max_batch=2, max_pending=4)
+    queue.start()
+    for n in range(1, 11):
+        queue.enqueue("record", {"n": n})
+        assert len(queue) <= 4
+    assert spooled(tmp_path)
+
+    database.down = False
+    queue.stop()
+    restarted = make_queue()
+    restarted.start()
+    restarted.stop()
+
+    assert sorted(database.rows) == list(range(1, 11))
+    assert spooled(tmp_path) == []